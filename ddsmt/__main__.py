@@ -1,12 +1,19 @@
 import sys
 
-from . import cli
+from . import daemon
+from . import distributed
 from . import options
-from . import debug_utils
 
 
 def main():
     """Main entry point for ddsmt."""
+    if len(sys.argv) > 1 and sys.argv[1] in daemon.COMMANDS:
+        return daemon.main(sys.argv[1], sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'agent':
+        return distributed.main(sys.argv[2:])
+    # the strategies (and debug_utils) read the options on import
+    from . import cli
+    from . import debug_utils
     try:
         cli.ddsmt_main()
         if options.args().profile:
@@ -0,0 +1,85 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+
+from . import checker
+from . import context
+from . import mutators
+from . import nodeio
+from . import options
+
+
+def __as_text(exprs):
+    """Return ``exprs`` as SMT-LIB string, as it would be checked."""
+    file = io.StringIO()
+    nodeio.write_smtlib_for_checking(file, exprs)
+    return file.getvalue()
+
+
+def reduce(exprs, oracle, strategy='hybrid', jobs=1, arguments=()):
+    """Reduce ``exprs`` such that ``oracle`` still holds, and return the
+    reduced input.
+
+    ``exprs`` is either an SMT-LIB string or a list of expressions (as
+    returned by ``nodeio.parse_smtlib``). ``oracle`` is called with every
+    candidate in the same form and returns whether the candidate is still
+    interesting, it replaces the command and the comparison with the
+    golden run. ``strategy`` and ``jobs`` correspond to the options
+    ``--strategy`` and ``--jobs``, ``arguments`` may contain further
+    command line options (e.g., ``['--disable-all', '--core']``).
+
+    No files are written and no commands are executed. The reduction
+    runs in its own ``ReductionContext``, so several reductions can run
+    concurrently in different threads. Checks run in (forked) worker
+    processes, so ``oracle`` does not need to be picklable, but it can not
+    collect state across checks (unless ``--executor thread`` is given,
+    then it may be called from several threads at once). Raises
+    ``ValueError`` if ``oracle`` does not hold for ``exprs`` itself.
+    """
+    args = options.parse_options(
+        mutators, ['--strategy', strategy, '--jobs',
+                   str(jobs)] + list(arguments) + ['<input>', '<output>'])
+    args.infile = None
+    args.outfile = None
+    with context.ReductionContext(args):
+        text = isinstance(exprs, str)
+        if text:
+            exprs = list(nodeio.parse_smtlib(exprs))
+            check = lambda e: oracle(__as_text(e))  # noqa: E731
+        else:
+            check = oracle
+        if not check(exprs):
+            raise ValueError('the oracle does not hold for the input')
+
+        checker.set_oracle(check)
+        # the strategies (and debug_utils) read the options on import
+        from . import cli
+        from . import strategy_ddmin
+        from . import strategy_hierarchical
+        cli.add_log_levels()
+        mutators.auto_detect_theories(exprs)
+        if strategy in ('ddmin', 'hybrid'):
+            exprs, _ = strategy_ddmin.reduce(exprs)
+        if strategy in ('hierarchical', 'hybrid'):
+            exprs, _ = strategy_hierarchical.reduce(exprs)
+        if text:
+            return nodeio.write_smtlib_to_str(exprs)
+        return exprs
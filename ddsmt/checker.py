@@ -19,21 +19,138 @@
 # along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
 
 import collections
+import hashlib
+import io
+import json
 import logging
 import math
+import multiprocessing
+import multiprocessing.pool
+import os
 import resource
+import select
+import selectors
+import signal
+import statistics
 import subprocess
 import sys
+import threading
 import time
 
+from . import context
 from . import nodeio
+from . import nodes
 from . import options
 from . import tmpfiles
 
-RunInfo = collections.namedtuple("RunInfo", ["exit", "out", "err", "runtime"])
+# user, sys: cpu time in seconds, maxrss: peak resident set size in kilobytes
+RunInfo = collections.namedtuple(
+    "RunInfo", ["exit", "out", "err", "runtime", "user", "sys", "maxrss"])
+RunInfo.__new__.__defaults__ = (0.0, 0.0, 0)
+ResourceUsage = collections.namedtuple("ResourceUsage",
+                                       ["user", "sys", "maxrss"])
 
-__GOLDEN = None
-__GOLDEN_CC = None
+# How often (in seconds) a running command checks whether it was cancelled.
+__CANCEL_INTERVAL = 0.05
+# Resource usage of the checks in the current thread, see ``take_usage()``.
+__USAGE = threading.local()
+# Process groups of the commands that are currently running in this process.
+__RUNNING = set()
+# Number of checks in this process that left processes behind.
+__LEAKS = 0
+# Check results that a command may print for a check-sat in a batch.
+__BATCH_ANSWERS = ('sat', 'unsat', 'unknown')
+# Commands that may occur before the check-sat of a batched candidate, and
+# those of them that can be scoped within push and pop.
+__BATCH_COMMANDS = ('set-info', 'set-logic', 'set-option')
+__BATCH_SCOPED_COMMANDS = ('assert', 'declare-const', 'declare-datatype',
+                           'declare-datatypes', 'declare-fun', 'declare-sort',
+                           'define-fun', 'define-fun-rec', 'define-funs-rec',
+                           'define-sort')
+# Persistent oracles by process, thread and command, see ``__get_oracle()``.
+__ORACLES = {}
+# Number of answers per command cached for --differential.
+__ANSWERS_SIZE = 100000
+# Answers that do not decide the verdict of --differential on their own.
+__DIFFERENTIAL_ANSWERS = ('sat', 'unsat')
+# Probabilities of a successful measurement for --performance that the
+# sequential test distinguishes, see ``__check_performance()``.
+__PERFORMANCE_HYPOTHESES = (0.2, 0.8)
+
+
+class __State:
+    """State of the checker, stored per ``ReductionContext``."""
+    def __init__(self):
+        self.golden = None
+        self.golden_cc = None
+        # Statistics for cmd and cmd_cc as used by --cross-check-mode
+        # adaptive: number of runs, number of rejected runs and total runtime.
+        self.command_stats = [[0, 0, 0.0], [0, 0, 0.0]]
+        # Adaptive timeouts for cmd and cmd_cc, if enabled.
+        self.adaptive_timeouts = [None, None]
+        # The golden run (with plain string output) if --batch-size is
+        # supported.
+        self.batch_golden = None
+        # Answers of cmd and cmd_cc by candidate digest for --differential.
+        self.answers = [collections.OrderedDict(), collections.OrderedDict()]
+        # Python callable that replaces the command, see ``set_oracle()``.
+        self.predicate = None
+        # Share of a scheduler that limits the running commands, see
+        # ``set_scheduler()``.
+        self.share = None
+
+
+def __state():
+    """Return the state of the checker in the current reduction context."""
+    return context.current().state('checker', __State)
+
+
+class AdaptiveTimeout:
+    """A timeout that follows the runtimes of accepted candidates.
+
+    Keeps a rolling window of the runtimes of the last ``size`` accepted
+    candidates. Once ``min_samples`` runtimes have been recorded, the
+    timeout is set to ``factor`` times the largest runtime in the window,
+    but at least ``floor`` and at most the ``initial`` timeout. The
+    state lives in shared memory, so that all worker processes that are
+    forked after construction contribute to and use the same timeout.
+    """
+    def __init__(self, name, initial, floor, factor, size=20, min_samples=5):
+        self.name = name
+        self.initial = initial
+        self.floor = floor
+        self.factor = factor
+        self.min_samples = min_samples
+        self.__runtimes = multiprocessing.Array('d', size)
+        self.__count = multiprocessing.Value('i', 0, lock=False)
+        self.__timeout = multiprocessing.Value('d', initial, lock=False)
+
+    def get(self):
+        """Return the current timeout."""
+        return self.__timeout.value
+
+    def add(self, runtime):
+        """Record the runtime of an accepted candidate and update the timeout.
+
+        The timeout is only changed (and logged) if it changes by more
+        than 10%.
+        """
+        with self.__runtimes.get_lock():
+            size = len(self.__runtimes)
+            self.__runtimes[self.__count.value % size] = runtime
+            self.__count.value += 1
+            if self.__count.value < self.min_samples:
+                return
+            window = self.__runtimes[:min(self.__count.value, size)]
+            timeout = round(
+                min(self.initial, max(self.floor,
+                                      self.factor * max(window))), 2)
+            old = self.__timeout.value
+            if abs(timeout - old) <= 0.1 * old:
+                return
+            self.__timeout.value = timeout
+        logging.info(f'adaptive {self.name}: {old:.2f} -> {timeout:.2f} '
+                     'seconds')
 
 
 def limit_resources(timeout, pid=None):
@@ -51,29 +168,544 @@ def limit_resources(timeout, pid=None):
         setlimit(resource.RLIMIT_CPU, (timeout, timeout))
 
 
-def execute(cmd, filename, timeout):
-    """Execute the command on the file with a timeout and a memory limit."""
+def limit_resources_shim(cmd, timeout):
+    """Wrap ``cmd`` in a shell that applies the resource limits given by
+    ``--memout`` and ``timeout`` and then executes ``cmd``.
+
+    Other than ``limit_resources()``, this makes sure that the limits are
+    in place before ``cmd`` starts, and other than a ``preexec_fn`` it
+    still allows ``subprocess`` to start the command via ``vfork``. The
+    price is one additional ``exec``.
+    """
+    limits = []
+    if options.args().memout:
+        limits.append(f'ulimit -S -v {options.args().memout * 1024}')
+    if timeout:
+        limits.append(f'ulimit -t {math.ceil(timeout)}')
+    if not limits:
+        return cmd
+    return ['/bin/sh', '-c', '; '.join(limits + ['exec "$@"']), 'sh'] + cmd
+
+
+def __use_shim():
+    """Decide whether to use ``limit_resources_shim()`` (as opposed to
+    ``limit_resources()``) according to ``--launcher``."""
+    if not hasattr(resource, 'prlimit'):
+        return True
+    if options.args().launcher == 'auto':
+        # ddSMT enforces the timeout itself, the cpu limit is only a safety
+        # net and it does not matter if it is applied a bit late
+        return bool(options.args().memout)
+    return options.args().launcher == 'shim'
+
+
+class OutputCapture:
+    """Bounded capture of the output of a command.
+
+    Only the length and a rolling SHA-256 digest of the output are kept.
+    Two captures compare equal if and only if the outputs have the same
+    length and digest, which (barring hash collisions) is equivalent to
+    comparing the outputs. The ``patterns`` (from ``--match-out`` or
+    ``--match-err``) are searched for incrementally, keeping a window of
+    the last ``len(pattern) - 1`` bytes of the previous chunks. Then,
+    ``pattern in capture`` works like for strings.
+
+    If ``expected`` is given, ``write()`` returns false as soon as the
+    output diverges from it. If ``keep`` is true, the output is kept in
+    ``data`` as well.
+    """
+    def __init__(self, patterns=(), expected=None, keep=False):
+        self.length = 0
+        self.data = bytearray() if keep else None
+        self.__digest = hashlib.sha256()
+        self.__expected = expected
+        self.__patterns = {p: p.encode() for p in patterns if p}
+        self.__found = set()
+        self.__window = b''
+        self.__window_size = max(
+            (len(p) for p in self.__patterns.values()), default=1) - 1
+
+    @classmethod
+    def from_bytes(cls, data, patterns=()):
+        """Create a capture of ``data`` that keeps ``data``."""
+        res = cls(patterns, keep=True)
+        res.write(data)
+        return res
+
+    def write(self, data):
+        """Add ``data`` to the capture.
+
+        Returns false if the output diverges from ``expected``.
+        """
+        pos = self.length
+        self.length += len(data)
+        self.__digest.update(data)
+        if self.data is not None:
+            self.data += data
+        if len(self.__found) < len(self.__patterns):
+            buf = self.__window + data
+            for p, pattern in self.__patterns.items():
+                if p not in self.__found and pattern in buf:
+                    self.__found.add(p)
+            if self.__window_size > 0:
+                self.__window = buf[-self.__window_size:]
+        if self.__expected is not None:
+            return self.__expected[pos:pos + len(data)] == data
+        return True
+
+    def digest(self):
+        """Return the digest of the output captured so far."""
+        return self.__digest.digest()
+
+    def __eq__(self, other):
+        if not isinstance(other, OutputCapture):
+            return NotImplemented
+        return self.length == other.length and self.digest() == other.digest()
+
+    def __contains__(self, pattern):
+        return pattern in self.__found
+
+    def __str__(self):
+        return f'{self.length} bytes (sha256: {self.__digest.hexdigest()})'
+
+
+def __golden_bytes(output):
+    """Return the golden ``output`` (a string or a capture) as bytes."""
+    if isinstance(output, OutputCapture):
+        return output.data
+    return output.encode()
+
+
+def __reap(proc, block=True):
+    """Wait for ``proc`` via ``os.wait4`` and set its return code.
+
+    Returns the resource usage of the process, or ``None`` if ``block``
+    is false and the process has not terminated yet. Reaping a process
+    again returns the same resource usage.
+    """
+    if proc.returncode is None:
+        pid, status, rusage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return None
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        proc.rusage = rusage
+    return proc.rusage
+
+
+def __kill_group(proc):
+    """Kill all processes in the process group of ``proc``."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def __group_members(pgid):
+    """Return the pids of all processes in the process group ``pgid``
+    that are not zombies, or ``None`` if ``/proc`` is not available."""
+    try:
+        pids = [int(pid) for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return None
+    members = []
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # skip the command name, it may contain spaces and parentheses
+        state, _, group = stat[stat.rfind(')') + 2:].split()[:3]
+        if state != 'Z' and int(group) == pgid:
+            members.append(pid)
+    return members
+
+
+def __reap_group(proc):
+    """Kill and report processes that are left in the process group of
+    ``proc`` after ``proc`` itself terminated."""
+    global __LEAKS
+    try:
+        # fails if the process group is empty
+        os.killpg(proc.pid, 0)
+    except OSError:
+        return
+    members = __group_members(proc.pid)
+    if members == []:
+        return
+    __kill_group(proc)
+    __LEAKS += 1
+    msg = (f'killed processes {members or "(unknown)"} that were left '
+           f'behind by {" ".join(map(str, proc.args))}')
+    if __LEAKS == 1:
+        logging.warning(f'{msg}, make sure that the command waits for all '
+                        'its children')
+    else:
+        logging.debug(msg)
+
+
+def __kill_running(signum, frame):
+    """Kill the process groups of all running commands and terminate with
+    the default action of ``signum``.
+
+    Commands run in their own session and thus do not receive signals sent
+    to the process group of **ddSMT**. This is installed as handler for
+    ``SIGTERM`` while the main thread executes a command. A permanent
+    handler would not be safe, as Python only runs signal handlers between
+    bytecode instructions: a worker process that is blocked on a lock when
+    ``Pool.terminate()`` sends ``SIGTERM`` would never terminate.
+    """
+    for pgid in list(__RUNNING):
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except OSError:
+            pass
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def __communicate(proc, input, timeout, captures, cancel=None):  # noqa: C901
+    """Interact with ``proc`` like ``proc.communicate()``, but write stdout
+    and stderr to the given pair of ``OutputCapture`` objects.
+
+    The process group is killed as soon as a capture reports that the
+    output diverges from the expected output, or as soon as the event
+    ``cancel`` is set. The process is reaped via ``__reap()``, and
+    processes it left behind in its group are killed via
+    ``__reap_group()``. If possible, this happens as soon as the process
+    terminates, so that left over processes can not keep its output open.
+    Returns whether the process was killed early and its resource usage.
+    Raises ``subprocess.TimeoutExpired`` if ``timeout`` is exceeded.
+    """
+    deadline = time.time() + timeout if timeout else None
+
+    def get_remaining():
+        remaining = None
+        if deadline:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+        if cancel is not None:
+            # wake up regularly to check whether we were cancelled
+            remaining = min(remaining or __CANCEL_INTERVAL,
+                            __CANCEL_INTERVAL)
+        return remaining
+
+    def kill():
+        __kill_group(proc)
+        return True, __reap(proc)
+
+    pidfd = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+        except OSError:
+            pass
+    try:
+        with selectors.DefaultSelector() as selector:
+            if pidfd is not None:
+                selector.register(pidfd, selectors.EVENT_READ)
+            if input is not None:
+                input = memoryview(input)
+                selector.register(proc.stdin, selectors.EVENT_WRITE)
+            elif proc.stdin:
+                proc.stdin.close()
+            selector.register(proc.stdout, selectors.EVENT_READ, captures[0])
+            selector.register(proc.stderr, selectors.EVENT_READ, captures[1])
+            written = 0
+            while selector.get_map():
+                if cancel is not None and cancel.is_set():
+                    return kill()
+                for key, _ in selector.select(get_remaining()):
+                    if key.fileobj == pidfd:
+                        # the process terminated, its output may still be open
+                        selector.unregister(pidfd)
+                        __reap(proc)
+                        __reap_group(proc)
+                    elif key.fileobj is proc.stdin:
+                        chunk = input[written:written + select.PIPE_BUF]
+                        try:
+                            written += os.write(key.fd, chunk)
+                        except BrokenPipeError:
+                            written = len(input)
+                        if written >= len(input):
+                            selector.unregister(key.fileobj)
+                            key.fileobj.close()
+                    else:
+                        data = os.read(key.fd, 32768)
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            key.fileobj.close()
+                        elif not key.data.write(data):
+                            return kill()
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    if proc.returncode is not None:
+        return False, __reap(proc)
+    # the process usually terminates right after closing its output
+    delay = 0.001
+    while True:
+        if cancel is not None and cancel.is_set():
+            return kill()
+        rusage = __reap(proc, False)
+        if rusage is not None:
+            __reap_group(proc)
+            return False, rusage
+        remaining = get_remaining()
+        time.sleep(min(delay, remaining) if remaining else delay)
+        delay = min(2 * delay, __CANCEL_INTERVAL)
+
+
+def execute(cmd,
+            filename,
+            timeout,
+            input=None,
+            golden=None,
+            patterns=(None, None),
+            digest=False,
+            cancel=None):
+    """Execute the command on the file with a timeout and a memory limit.
+
+    If ``input`` is given, it is written to the stdin of the command and
+    ``filename`` is not passed to the command. If ``golden`` is given,
+    stdout and stderr are compared with the golden run while the command
+    is running, and the command is killed as soon as they diverge.
+
+    If ``digest`` is true, stdout and stderr of the result are
+    ``OutputCapture`` objects that track the pair of ``patterns`` (one
+    for stdout, one for stderr) instead of strings. If the event
+    ``cancel`` is given, the command is killed as soon as it is set.
+
+    With ``--timeout-clock cpu``, ``timeout`` limits the cpu time of the
+    command, and the wall clock time is only limited as a safety net.
+
+    If a scheduler was set via ``set_scheduler()``, waits for a free slot
+    before the command is executed.
+    """
+    share = __state().share
+    if share is None:
+        return __execute(cmd, filename, timeout, input, golden, patterns,
+                         digest, cancel)
+    with share.slot():
+        return __execute(cmd, filename, timeout, input, golden, patterns,
+                         digest, cancel)
+
+
+def __execute(cmd, filename, timeout, input, golden, patterns, digest,
+              cancel):
+    """Execute the command, see ``execute()``."""
     if options.args().unchecked:
         return RunInfo(0, "unchecked", "unchecked", 0)
+    if options.args().oracle and cmd == options.args().cmd:
+        return __query_oracle(cmd, filename, timeout, patterns, digest,
+                              cancel)
+    if input is None:
+        cmd = cmd + [filename]
+        stdin = None
+        pass_fds = tmpfiles.get_pass_fds(filename)
+    else:
+        stdin = subprocess.PIPE
+        pass_fds = ()
+    cpu_timeout = timeout and options.args().timeout_clock == 'cpu'
+    wall_timeout = timeout
+    if cpu_timeout:
+        wall_timeout = max(2 * timeout, timeout + 10)
     start = time.time()
-    if hasattr(resource, 'prlimit'):
-        proc = subprocess.Popen(cmd + [filename],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
+    use_shim = __use_shim()
+    if use_shim:
+        cmd = limit_resources_shim(cmd, timeout)
+    # run the command in its own session, so that we can kill all processes
+    # it spawns (for example if the command is a wrapper script)
+    proc = subprocess.Popen(cmd,
+                            stdin=stdin,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            pass_fds=pass_fds,
+                            start_new_session=True)
+    if not use_shim:
         limit_resources(timeout, proc.pid)
+    __RUNNING.add(proc.pid)
+    main_thread = threading.current_thread() is threading.main_thread()
+    if main_thread:
+        handler = signal.signal(signal.SIGTERM, __kill_running)
+    if golden is not None:
+        expected = (__golden_bytes(golden.out), __golden_bytes(golden.err))
     else:
-        proc = subprocess.Popen(cmd + [filename],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                preexec_fn=lambda: limit_resources(timeout))
+        expected = (None, None)
+    captures = [
+        OutputCapture([pattern], exp, keep=not digest)
+        for pattern, exp in zip(patterns, expected)
+    ]
     try:
-        out, err = proc.communicate(timeout=timeout)
+        killed, rusage = __communicate(proc, input, wall_timeout, captures,
+                                       cancel)
         runtime = time.time() - start
     except subprocess.TimeoutExpired:
-        proc.kill()
-        logging.debug(f'[!!] timeout: terminated after {timeout:.2f} seconds')
-        return RunInfo(proc.returncode, None, None, timeout)
-    return RunInfo(proc.returncode, out.decode(), err.decode(), runtime)
+        __kill_group(proc)
+        rusage = __reap(proc)
+        logging.debug(
+            f'[!!] timeout: terminated after {wall_timeout:.2f} seconds')
+        return __account(
+            RunInfo(proc.returncode, None, None, wall_timeout,
+                    rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss))
+    except BaseException:
+        # do not leave the command behind, e.g., on KeyboardInterrupt
+        __kill_group(proc)
+        __reap(proc)
+        raise
+    finally:
+        __RUNNING.discard(proc.pid)
+        if main_thread:
+            signal.signal(signal.SIGTERM, handler or signal.SIG_DFL)
+    if cpu_timeout and rusage.ru_utime + rusage.ru_stime >= timeout:
+        logging.debug(f'[!!] timeout: cpu time exceeded {timeout:.2f} '
+                      'seconds')
+        return __account(
+            RunInfo(proc.returncode, None, None, runtime, rusage.ru_utime,
+                    rusage.ru_stime, rusage.ru_maxrss))
+    if killed:
+        reason = 'cancelled' if cancel and cancel.is_set() else 'diverged'
+        logging.debug(f'[!!] {reason}: terminated after {runtime:.2f} seconds')
+    if digest:
+        out, err = captures
+    else:
+        # the output may end within a multi-byte character if it was killed
+        errors = 'replace' if killed else 'strict'
+        out = captures[0].data.decode(errors=errors)
+        err = captures[1].data.decode(errors=errors)
+    return __account(
+        RunInfo(proc.returncode, out, err, runtime, rusage.ru_utime,
+                rusage.ru_stime, rusage.ru_maxrss))
+
+
+def __get_oracle(cmd):
+    """Return the persistent oracle process for ``cmd`` of the current
+    thread, and start it if necessary.
+
+    Oracles are started like regular commands (see ``execute()``), but
+    without the filename and without a cpu time limit.
+    """
+    key = (os.getpid(), threading.get_ident(), tuple(cmd))
+    proc = __ORACLES.get(key)
+    if proc is None:
+        use_shim = __use_shim()
+        proc = subprocess.Popen(
+            limit_resources_shim(cmd, None) if use_shim else cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            start_new_session=True)
+        if not use_shim:
+            limit_resources(None, proc.pid)
+        proc.replies = b''
+        __ORACLES[key] = proc
+    return proc
+
+
+def __stop_oracle(cmd):
+    """Kill the persistent oracle process for ``cmd`` of the current
+    thread, if there is one."""
+    key = (os.getpid(), threading.get_ident(), tuple(cmd))
+    proc = __ORACLES.pop(key, None)
+    if proc is not None:
+        __kill_group(proc)
+        __reap(proc)
+        proc.stdin.close()
+        proc.stdout.close()
+
+
+def __query_oracle(cmd, filename, timeout, patterns, digest, cancel):
+    """Check ``filename`` with the persistent oracle ``cmd`` and return the
+    result as ``RunInfo`` like ``execute()``.
+
+    See ``ddsmt.oracle`` for the protocol. If the oracle does not reply
+    within ``timeout``, it is killed and restarted for the next check.
+    If the oracle terminates or its reply is invalid, the result has exit
+    code and output ``None``.
+    """
+    proc = __get_oracle(cmd)
+    if filename.startswith('/proc/self/'):
+        # the candidate file is only accessible via our file descriptor
+        filename = f'/proc/{os.getpid()}/{filename[len("/proc/self/"):]}'
+    start = time.time()
+    try:
+        proc.stdin.write(f'{filename}\n'.encode())
+        proc.stdin.flush()
+        while b'\n' not in proc.replies:
+            if cancel is not None and cancel.is_set():
+                __stop_oracle(cmd)
+                return RunInfo(-signal.SIGKILL, '', '', time.time() - start)
+            remaining = None
+            if timeout:
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    __stop_oracle(cmd)
+                    logging.debug(f'[!!] timeout: oracle terminated after '
+                                  f'{timeout:.2f} seconds')
+                    return __account(
+                        RunInfo(-signal.SIGKILL, None, None, timeout))
+            if cancel is not None:
+                remaining = min(remaining or __CANCEL_INTERVAL,
+                                __CANCEL_INTERVAL)
+            if select.select([proc.stdout], [], [], remaining)[0]:
+                data = os.read(proc.stdout.fileno(), 32768)
+                if not data:
+                    raise EOFError()
+                proc.replies += data
+        line, proc.replies = proc.replies.split(b'\n', 1)
+        reply = json.loads(line)
+        if not isinstance(reply, dict) \
+                or not isinstance(reply.get('exit'), int) \
+                or not isinstance(reply.get('out'), str) \
+                or not isinstance(reply.get('err'), str):
+            raise ValueError('malformed reply')
+        ri = RunInfo(reply['exit'], reply['out'], reply['err'],
+                     time.time() - start)
+    except (OSError, EOFError):
+        __stop_oracle(cmd)
+        logging.warning(f'oracle terminated with exit code {proc.returncode}')
+        return __account(RunInfo(None, None, None, time.time() - start))
+    except ValueError:
+        __stop_oracle(cmd)
+        logging.error(f'invalid reply from oracle: {line}')
+        return __account(RunInfo(None, None, None, time.time() - start))
+    if digest:
+        ri = ri._replace(
+            out=OutputCapture.from_bytes(ri.out.encode(), [patterns[0]]),
+            err=OutputCapture.from_bytes(ri.err.encode(), [patterns[1]]))
+    return __account(ri)
+
+
+def __account(ri):
+    """Add the resource usage of ``ri`` to the usage of the current thread
+    and return ``ri``."""
+    __USAGE.user = getattr(__USAGE, 'user', 0.0) + ri.user
+    __USAGE.sys = getattr(__USAGE, 'sys', 0.0) + ri.sys
+    __USAGE.maxrss = max(getattr(__USAGE, 'maxrss', 0), ri.maxrss)
+    return ri
+
+
+def get_elapsed(ri):
+    """Return the time ``ri`` took, as measured by ``--timeout-clock``."""
+    if options.args().timeout_clock == 'cpu':
+        return ri.user + ri.sys
+    return ri.runtime
+
+
+def take_usage():
+    """Return the accumulated resource usage of all commands executed by the
+    current thread since the last call as a ``ResourceUsage`` and reset
+    it."""
+    res = ResourceUsage(getattr(__USAGE, 'user', 0.0),
+                        getattr(__USAGE, 'sys', 0.0),
+                        getattr(__USAGE, 'maxrss', 0))
+    __USAGE.user = 0.0
+    __USAGE.sys = 0.0
+    __USAGE.maxrss = 0
+    return res
 
 
 def matches_golden(golden, run, ignore_out, match_out, match_err):
@@ -105,46 +737,473 @@ def matches_golden(golden, run, ignore_out, match_out, match_err):
     return True
 
 
-def check(filename):
+def __early_kill_golden(golden, ignore_out, match_out, match_err):
+    """Return ``golden`` if ``matches_golden`` compares the full output with
+    the golden run (and thus any divergence means failure), and ``None``
+    otherwise."""
+    if ignore_out or match_out or match_err:
+        return None
+    return golden
+
+
+def __check_command(index, filename, input, cancel=None):
+    """Execute ``cmd`` (for ``index`` 0) or ``cmd_cc`` (for ``index`` 1) and
+    check whether the result matches the respective golden run.
+
+    If the result does not match, ``cancel`` is set. Results of commands
+    that were cancelled do not count towards the statistics.
+    """
+    state = __state()
+    args = options.args()
+    adaptive = state.adaptive_timeouts[index]
+    if index == 0:
+        cmd, timeout, golden = args.cmd, args.timeout, state.golden
+        ignore_out, match_out, match_err = (args.ignore_output,
+                                            args.match_out, args.match_err)
+    else:
+        cmd, timeout, golden = args.cmd_cc, args.timeout_cc, state.golden_cc
+        ignore_out, match_out, match_err = (args.ignore_output_cc,
+                                            args.match_out_cc,
+                                            args.match_err_cc)
+    if adaptive is not None:
+        timeout = adaptive.get()
+    ri = execute(cmd, filename, timeout, input,
+                 __early_kill_golden(golden, ignore_out, match_out, match_err),
+                 (match_out, match_err), args.output_capture == 'digest',
+                 cancel)
+    if cancel is not None and cancel.is_set():
+        return False
+    res = matches_golden(golden, ri, ignore_out, match_out, match_err)
+    if not res and cancel is not None:
+        cancel.set()
+    stats = state.command_stats[index]
+    stats[0] += 1
+    stats[1] += 0 if res else 1
+    stats[2] += ri.runtime
+    if res and adaptive is not None:
+        adaptive.add(get_elapsed(ri))
+    return res
+
+
+def __expected_cost(index):
+    """Return the expected runtime per rejected candidate for ``cmd`` (for
+    ``index`` 0) or ``cmd_cc`` (for ``index`` 1), based on the statistics
+    of previous runs in this process."""
+    runs, rejected, runtime = __state().command_stats[index]
+    if runs == 0:
+        return 0
+    # use a prior of one accepted and one rejected run
+    return (runtime / runs) / ((rejected + 1) / (runs + 2))
+
+
+def __check_concurrent(filename, input):
+    """Run ``cmd`` and ``cmd_cc`` concurrently. As soon as one of them does
+    not match its golden run, the other one is killed."""
+    cancel = threading.Event()
+    results = [False]
+
+    def run_cc():
+        results[0] = __check_command(1, filename, input, cancel)
+
+    thread = threading.Thread(target=context.bind(run_cc))
+    thread.start()
+    res = __check_command(0, filename, input, cancel)
+    thread.join()
+    return res and results[0]
+
+
+def classify_answer(ri):
+    """Classify the result of a run for ``--differential`` as ``sat``,
+    ``unsat``, ``unknown``, ``timeout`` or ``error``."""
+    if ri.out is None:
+        return 'timeout'
+    answer = ri.out.strip()
+    if answer in ('sat', 'unsat', 'unknown'):
+        return answer
+    return 'error'
+
+
+def __differential_answer(index, filename, input, key, cancel):
+    """Execute ``cmd`` (for ``index`` 0) or ``cmd_cc`` (for ``index`` 1)
+    and return its answer (see ``classify_answer``) and elapsed time.
+
+    The answer is cached under ``key``. If it decides the verdict on its
+    own, ``cancel`` is set. Returns ``(None, None)`` if the command was
+    cancelled.
+    """
+    state = __state()
+    args = options.args()
+    if index == 0:
+        cmd, timeout = args.cmd, args.timeout
+    else:
+        cmd, timeout = args.cmd_cc, args.timeout_cc
+    if state.adaptive_timeouts[index] is not None:
+        timeout = state.adaptive_timeouts[index].get()
+    ri = execute(cmd, filename, timeout, input, cancel=cancel)
+    if cancel.is_set():
+        return None, None
+    answer = classify_answer(ri)
+    if answer not in __DIFFERENTIAL_ANSWERS:
+        cancel.set()
+    cache = state.answers[index]
+    cache[key] = answer
+    if len(cache) > __ANSWERS_SIZE:
+        cache.popitem(last=False)
+    return answer, get_elapsed(ri)
+
+
+def __check_differential(filename, input):
+    """Check whether ``cmd`` and ``cmd_cc`` answer ``sat`` and ``unsat``
+    (in any order) on the given candidate.
+
+    Answers are cached by the digest of the candidate, and only the
+    commands without cached answer are executed. They run concurrently,
+    and as soon as one of them gives another answer, the other one is
+    killed.
+    """
+    state = __state()
+    if input is None:
+        with open(filename, 'rb') as file:
+            key = hashlib.sha256(file.read()).digest()
+    else:
+        key = hashlib.sha256(input).digest()
+    answers = [state.answers[i].get(key) for i in (0, 1)]
+    if any(a not in (None, ) + __DIFFERENTIAL_ANSWERS for a in answers):
+        return False
+    missing = [i for i in (0, 1) if answers[i] is None]
+    elapsed = [None, None]
+    cancel = threading.Event()
+
+    def run(index):
+        answers[index], elapsed[index] = __differential_answer(
+            index, filename, input, key, cancel)
+
+    threads = [
+        threading.Thread(target=context.bind(run), args=(i, ))
+        for i in missing[1:]
+    ]
+    for thread in threads:
+        thread.start()
+    if missing:
+        run(missing[0])
+    for thread in threads:
+        thread.join()
+    logging.debug(f'differential: {answers[0]} / {answers[1]}')
+    if set(answers) != set(__DIFFERENTIAL_ANSWERS):
+        return False
+    for index in missing:
+        if state.adaptive_timeouts[index] is not None:
+            state.adaptive_timeouts[index].add(elapsed[index])
+    return True
+
+
+def __measure_performance(filename, input):
+    """Run ``cmd_cc`` and then ``cmd`` once and return whether ``cmd``
+    took at least ``--performance`` times the cpu time of ``cmd_cc``.
+
+    The measurement fails if ``cmd_cc`` does not match its golden run or
+    takes less than ``--performance-min-time``. ``cmd`` is stopped as
+    soon as it exceeds this cpu time (up to the granularity of
+    ``RLIMIT_CPU``).
+    """
+    state = __state()
+    args = options.args()
+    golden = __early_kill_golden(state.golden_cc, args.ignore_output_cc,
+                                 args.match_out_cc, args.match_err_cc)
+    ri = execute(args.cmd_cc, filename, args.timeout_cc, input, golden,
+                 (args.match_out_cc, args.match_err_cc),
+                 args.output_capture == 'digest')
+    if ri.out is None or not matches_golden(
+            state.golden_cc, ri, args.ignore_output_cc, args.match_out_cc,
+            args.match_err_cc):
+        return False
+    if ri.user + ri.sys < args.performance_min_time:
+        logging.debug(f'performance: {ri.user + ri.sys:.3f} seconds of the '
+                      'cross check are too short to measure')
+        return False
+    limit = args.performance * (ri.user + ri.sys)
+    if limit <= 0:
+        return False
+    timeout = args.timeout
+    if state.adaptive_timeouts[0] is not None:
+        timeout = state.adaptive_timeouts[0].get()
+    ri_slow = execute(args.cmd, filename,
+                      min(limit, timeout) if timeout else limit, input)
+    logging.debug(f'performance: {ri_slow.user + ri_slow.sys:.3f} / '
+                  f'{ri.user + ri.sys:.3f} seconds')
+    return ri_slow.user + ri_slow.sys >= limit
+
+
+def __check_performance(filename, input):
+    """Check whether ``cmd`` takes at least ``--performance`` times the
+    cpu time of ``cmd_cc`` on the given candidate.
+
+    Measurements are repeated until Wald's sequential probability ratio
+    test decides whether the probability that a single measurement shows
+    the factor is at most 0.2 or at least 0.8, with error probability
+    ``--performance-error``. After ``--performance-runs`` measurements,
+    the test decides for the more likely of the two.
+    """
+    args = options.args()
+    p0, p1 = __PERFORMANCE_HYPOTHESES
+    success = math.log(p1 / p0)
+    failure = math.log((1 - p1) / (1 - p0))
+    bound = math.log((1 - args.performance_error) / args.performance_error)
+    llr = 0
+    for _ in range(args.performance_runs):
+        llr += success if __measure_performance(filename, input) else failure
+        if abs(llr) >= bound:
+            break
+    return llr > 0
+
+
+def check(filename, input=None):
     """Check whether the given file behaves as the original input.
 
     First execute the command and then call ``matches_golden``. If a
     cross-check command is specified, do the same for that one as well.
+    ``input`` is passed on to ``execute``. If stdout and stderr are
+    compared with the golden run, the command is killed as soon as its
+    output diverges.
+
+    With ``--cross-check-mode concurrent``, both commands are executed
+    at the same time. With ``--cross-check-mode adaptive``, the command
+    with the lower expected runtime per rejected candidate is executed
+    first. With ``--differential``, the answers of both commands are
+    compared with each other instead, see ``__check_differential``, and
+    with ``--performance`` their cpu times, see ``__check_performance``.
     """
-    ri = execute(options.args().cmd, filename, options.args().timeout)
-    if not matches_golden(__GOLDEN, ri,
-                          options.args().ignore_output,
-                          options.args().match_out,
-                          options.args().match_err):
-        return False
+    if not options.args().cmd_cc:
+        return __check_command(0, filename, input)
+    if options.args().differential:
+        return __check_differential(filename, input)
+    if options.args().performance is not None:
+        return __check_performance(filename, input)
+    if options.args().cross_check_mode == 'concurrent':
+        return __check_concurrent(filename, input)
+    order = [0, 1]
+    if options.args().cross_check_mode == 'adaptive':
+        order.sort(key=__expected_cost)
+    return all(__check_command(i, filename, input) for i in order)
 
-    if options.args().cmd_cc:
-        ri = execute(options.args().cmd_cc, filename,
-                     options.args().timeout_cc)
-        if not matches_golden(__GOLDEN_CC, ri,
-                              options.args().ignore_output_cc,
-                              options.args().match_out_cc,
-                              options.args().match_err_cc):
-            return False
 
-    return True
+def set_oracle(oracle):
+    """Use the Python callable ``oracle`` instead of the command.
+
+    ``check_exprs(exprs)`` then returns ``oracle(exprs)``, without writing
+    the candidate or executing anything. Pass ``None`` to use the command
+    again.
+    """
+    __state().predicate = oracle
+
+
+def set_scheduler(share):
+    """Run all commands within the given ``scheduler.Share``, such that
+    several reductions can share the available cores. Pass ``None`` to
+    run commands right away again."""
+    __state().share = share
+
+
+def uses_threads():
+    """Whether the strategies shall run the checks in threads instead of
+    processes (``--executor thread``). This is also the case with
+    ``--listen``, where the workers mostly wait for agents."""
+    return options.args().executor == 'thread' or bool(options.args().listen)
 
 
 def check_exprs(exprs):
     """Run the check on the given expressions.
 
     Returns (True,runtime) if the check was successful and (False,0)
-    otherwise.
+    otherwise. With ``--stdin``, the expressions are passed to the
+    command via stdin instead of a file. If an oracle was set via
+    ``set_oracle()``, it is called instead.
     """
-    tmpfile = tmpfiles.get_tmp_filename()
-    nodeio.write_smtlib_for_checking(tmpfile, exprs)
-    return check(tmpfile)
+    state = __state()
+    if state.predicate is not None:
+        return bool(state.predicate(exprs))
+    return check(*__write_candidate(exprs))
+
+
+def __write_candidate(exprs):
+    """Write ``exprs`` to the candidate file, or to a buffer if ``--stdin``
+    is given, and return the ``filename`` and ``input`` for ``execute``."""
+    if options.args().stdin:
+        file = io.StringIO()
+        nodeio.write_smtlib_for_checking(file, exprs)
+        return None, file.getvalue().encode()
+    file, filename = tmpfiles.get_candidate_file()
+    nodeio.write_smtlib_for_checking(file, exprs)
+    file.flush()
+    return filename, None
+
 
+def supports_batches():
+    """Return true if ``check_exprs_batch`` can be used, i.e., if
+    ``--batch-size`` is given and the golden run is simple enough."""
+    state = __state()
+    return state.batch_golden is not None and state.predicate is None
 
-def do_golden_runs():
+
+def __split_batch_candidate(exprs):
+    """Return the commands before the single ``check-sat`` of ``exprs`` and
+    the ``check-sat`` command itself, or ``None`` if ``exprs`` can not be
+    checked as part of a batch."""
+    body = []
+    for i, expr in enumerate(exprs):
+        if not expr.has_ident():
+            return None
+        ident = expr.get_ident().data
+        if ident == 'check-sat':
+            if all(e.has_ident() and e.get_ident().data == 'exit'
+                   for e in exprs[i + 1:]):
+                return body, expr
+            return None
+        if ident not in __BATCH_COMMANDS + __BATCH_SCOPED_COMMANDS:
+            return None
+        body.append(expr)
+    return None
+
+
+def check_exprs_batch(candidates):
+    """Check several ``candidates`` with a single run of the command.
+
+    The candidates are combined into one script that starts with the
+    longest common prefix of the candidates, followed by a block ``(push
+    1) ... (check-sat) (pop 1)`` for every candidate, and the command is
+    expected to print one answer per ``check-sat``. Returns a list of
+    verdicts: ``False`` if the candidate certainly does not behave like
+    the golden run, ``True`` if it does in incremental mode, and
+    ``None`` if this could not be determined (for example, because the
+    command failed before answering for this candidate, or answered
+    ``unknown`` in incremental mode only). Candidates with
+    a verdict other than ``False`` should be checked individually.
+    """
+    state = __state()
+    verdicts = [None] * len(candidates)
+    split = [__split_batch_candidate(exprs) for exprs in candidates]
+    batch = [i for i, s in enumerate(split) if s is not None]
+    if len(batch) < 2:
+        return verdicts
+
+    # nodes that were not touched by a simplification are shared
+    prefix = split[batch[0]][0]
+    for i in batch[1:]:
+        body = split[i][0]
+        length = min(len(prefix), len(body))
+        end = next((j for j in range(length) if prefix[j].id != body[j].id),
+                   length)
+        prefix = prefix[:end]
+    for i in batch:
+        if any(expr.get_ident().data not in __BATCH_SCOPED_COMMANDS
+               for expr in split[i][0][len(prefix):]):
+            split[i] = None
+    batch = [i for i in batch if split[i] is not None]
+    if len(batch) < 2:
+        return verdicts
+
+    script = list(prefix)
+    for i in batch:
+        body, check_sat = split[i]
+        script.append(nodes.Node('push', '1'))
+        script.extend(body[len(prefix):])
+        script.append(check_sat)
+        script.append(nodes.Node('pop', '1'))
+
+    timeout = options.args().timeout
+    if state.adaptive_timeouts[0] is not None:
+        timeout = state.adaptive_timeouts[0].get()
+    if timeout:
+        timeout *= len(batch)
+    filename, input = __write_candidate(script)
+    ri = execute(options.args().cmd, filename, timeout, input)
+    if ri.out is None or ri.err:
+        # a timeout, or an error that may not show up on stdout
+        return verdicts
+    answers = ri.out.splitlines()
+    if len(answers) > len(batch):
+        return verdicts
+    # an error message on stdout ends the answers, previous ones are valid
+    for i, answer in zip(batch, answers):
+        answer = answer.strip()
+        if answer not in __BATCH_ANSWERS:
+            break
+        if answer == 'unknown' and state.batch_golden.out != 'unknown\n':
+            # the solver may only give up in incremental mode
+            continue
+        verdicts[i] = matches_golden(state.batch_golden,
+                                     RunInfo(0, f'{answer}\n', '', 0), False,
+                                     options.args().match_out, None)
+    return verdicts
+
+
+def __calibrate(cmd, golden, input):
+    """Repeat the golden run under load and return the largest runtime (as
+    measured by ``--timeout-clock``).
+
+    Runs ``--calibration-runs`` rounds of ``--jobs`` concurrent copies of
+    the golden run, mimicking the load during the actual checks. Warns if
+    a run does not match the golden run.
+    """
+    jobs = max(options.args().jobs, 1)
+    nruns = options.args().calibration_runs * jobs
+    logging.info(f'calibrating timeout with {nruns} runs on {jobs} jobs...')
+    with multiprocessing.pool.ThreadPool(jobs, context.activate,
+                                         (context.current(), )) as pool:
+        runs = pool.map(
+            lambda _: execute(cmd, options.args().infile, None, input),
+            range(nruns),
+            chunksize=1)
+    if any(run.exit != golden.exit or run.out != golden.out
+           or run.err != golden.err for run in runs):
+        logging.warning('calibration runs do not match the golden run, '
+                        'the command may be nondeterministic')
+    runtimes = [get_elapsed(run) for run in runs]
+    logging.info(f'calibration runtimes: min {min(runtimes):.2f}, '
+                 f'median {statistics.median(runtimes):.2f}, '
+                 f'max {max(runtimes):.2f} seconds')
+    return max(runtimes)
+
+
+def __automatic_timeout(cmd, golden, input):
+    """Compute the automatic timeout from the runtime of the golden run, or
+    from the calibration runs if ``--calibration-runs`` is given."""
+    runtime = get_elapsed(golden)
+    if options.args().calibration_runs > 0:
+        runtime = max(runtime, __calibrate(cmd, golden, input))
+    return round((runtime + 1) * 1.5, 2)
+
+
+def __init_batches():
+    """Enable ``check_exprs_batch`` if ``--batch-size`` is given and the
+    golden run only prints a single check-sat answer."""
+    state = __state()
+    state.batch_golden = None
+    args = options.args()
+    if args.batch_size <= 1:
+        return
+    reason = None
+    if args.cmd_cc:
+        reason = 'not supported with --cross-check'
+    elif args.oracle:
+        reason = 'not supported with --oracle'
+    elif args.unchecked or args.ignore_output or args.match_err:
+        reason = 'the output of the golden run is not compared'
+    elif (state.golden.exit != 0 or state.golden.err
+          or state.golden.out.strip() not in __BATCH_ANSWERS):
+        reason = 'the golden run does not print a single check-sat answer'
+    if reason:
+        logging.warning(f'disabling --batch-size: {reason}')
+        return
+    # answers are compared without surrounding whitespace (e.g., '\r')
+    state.batch_golden = state.golden._replace(
+        out=f'{state.golden.out.strip()}\n')
+    logging.info(f'checking up to {args.batch_size} candidates at once')
+
+
+def do_golden_runs():  # noqa: C901
     """Do the initial runs to obtain the golden run results."""
-    global __GOLDEN
-    global __GOLDEN_CC
+    state = __state()
 
     logging.info('')
     if options.args().cmd_cc:
@@ -153,39 +1212,71 @@ def do_golden_runs():
         logging.info('starting initial run...')
     logging.info('')
 
-    __GOLDEN = execute(options.args().cmd, options.args().infile, None)
+    input = None
+    if options.args().stdin:
+        with open(options.args().infile, 'rb') as infile:
+            input = infile.read()
+
+    state.golden = execute(options.args().cmd,
+                           options.args().infile, None, input)
+    if state.golden.exit is None:
+        logging.error('The oracle did not reply for the golden run')
+        sys.exit(1)
 
-    logging.info(f'golden exit: {__GOLDEN.exit}')
-    logging.info(f'golden err:\n{__GOLDEN.err}')
-    logging.info(f'golden out:\n{__GOLDEN.out}')
-    logging.info(f'golden runtime: {__GOLDEN.runtime:.2f} seconds')
+    logging.info(f'golden exit: {state.golden.exit}')
+    logging.info(f'golden err:\n{state.golden.err}')
+    logging.info(f'golden out:\n{state.golden.out}')
+    logging.info(f'golden runtime: {state.golden.runtime:.2f} seconds')
+    logging.info(f'golden cpu time: {state.golden.user + state.golden.sys:.2f} '
+                 'seconds')
+    logging.info(f'golden peak memory: {state.golden.maxrss // 1024} MiB')
+    if options.args().memout is None and options.args().memout_factor:
+        options.args().memout = math.ceil(
+            options.args().memout_factor * state.golden.maxrss / 1024)
+        logging.info(f'automatic memout: {options.args().memout} MiB')
     if options.args().match_out:
         logging.info(f'match (stdout): "{options.args().match_out}"')
-        if options.args().match_out not in __GOLDEN.out:
+        if options.args().match_out not in state.golden.out:
             logging.error(
                 f'Expected stdout to match "{options.args().match_out}"')
             sys.exit(1)
     if options.args().match_err:
         logging.info(f'match (stderr): "{options.args().match_err}"')
-        if options.args().match_err not in __GOLDEN.err:
+        if options.args().match_err not in state.golden.err:
             logging.error(
                 f'Expected stderr to match "{options.args().match_err}"')
             sys.exit(1)
 
     if options.args().timeout is None:
-        options.args().timeout = round((__GOLDEN.runtime + 1) * 1.5, 2)
+        options.args().timeout = __automatic_timeout(
+            options.args().cmd, state.golden, input)
         logging.info(
             f'automatic timeout: {options.args().timeout:.2f} seconds')
+        if options.args().adaptive_timeout:
+            state.adaptive_timeouts[0] = AdaptiveTimeout(
+                'timeout', options.args().timeout,
+                options.args().adaptive_timeout_floor,
+                options.args().adaptive_timeout_factor)
+
+    __init_batches()
+    answer = classify_answer(state.golden)
+
+    if options.args().output_capture == 'digest':
+        state.golden = state.golden._replace(
+            out=OutputCapture.from_bytes(state.golden.out.encode(),
+                                         [options.args().match_out]),
+            err=OutputCapture.from_bytes(state.golden.err.encode(),
+                                         [options.args().match_err]))
 
     if options.args().cmd_cc:
-        __GOLDEN_CC = execute(options.args().cmd_cc,
-                              options.args().infile, None)
+        state.golden_cc = execute(options.args().cmd_cc,
+                                  options.args().infile, None, input)
 
         logging.info("")
-        logging.info(f'golden exit (cc): {__GOLDEN_CC.exit}')
-        logging.info(f'golden err (cc):\n{__GOLDEN_CC.err}')
-        logging.info(f'golden out (cc):\n{__GOLDEN_CC.out}')
-        logging.info(f'golden runtime (cc): {__GOLDEN_CC.runtime:.2f} s')
+        logging.info(f'golden exit (cc): {state.golden_cc.exit}')
+        logging.info(f'golden err (cc):\n{state.golden_cc.err}')
+        logging.info(f'golden out (cc):\n{state.golden_cc.out}')
+        logging.info(f'golden runtime (cc): {state.golden_cc.runtime:.2f} s')
         if options.args().match_out_cc:
             logging.info(
                 f'match (cc) (stdout): "{options.args().match_out_cc}"')
@@ -194,7 +1285,42 @@ def do_golden_runs():
                 f'match (cc) (stderr): "{options.args().match_err_cc}"')
 
         if options.args().timeout_cc is None:
-            options.args().timeout_cc = round((__GOLDEN_CC.runtime + 1) * 1.5,
-                                              2)
+            options.args().timeout_cc = __automatic_timeout(
+                options.args().cmd_cc, state.golden_cc, input)
             logging.info(
                 f'automatic timeout (cc): {options.args().timeout_cc:.2f} s')
+            if options.args().adaptive_timeout:
+                state.adaptive_timeouts[1] = AdaptiveTimeout(
+                    'timeout (cc)', options.args().timeout_cc,
+                    options.args().adaptive_timeout_floor,
+                    options.args().adaptive_timeout_factor)
+
+        if options.args().differential:
+            answer_cc = classify_answer(state.golden_cc)
+            logging.info(f'golden answers: {answer} / {answer_cc}')
+            if {answer, answer_cc} != set(__DIFFERENTIAL_ANSWERS):
+                logging.error('Expected the command and the cross check '
+                              'command to answer sat and unsat')
+                sys.exit(1)
+
+        if options.args().performance is not None:
+            cpu = state.golden.user + state.golden.sys
+            cpu_cc = state.golden_cc.user + state.golden_cc.sys
+            logging.info(f'golden cpu times: {cpu:.2f} / {cpu_cc:.2f} s')
+            if cpu_cc < options.args().performance_min_time:
+                logging.error('Expected the cross check command to take at '
+                              'least --performance-min-time seconds of cpu '
+                              'time')
+                sys.exit(1)
+            if cpu < options.args().performance * cpu_cc:
+                logging.error('Expected the command to take at least '
+                              f'{options.args().performance} times the cpu '
+                              'time of the cross check command')
+                sys.exit(1)
+
+        if options.args().output_capture == 'digest':
+            state.golden_cc = state.golden_cc._replace(
+                out=OutputCapture.from_bytes(state.golden_cc.out.encode(),
+                                             [options.args().match_out_cc]),
+                err=OutputCapture.from_bytes(state.golden_cc.err.encode(),
+                                             [options.args().match_err_cc]))
@@ -25,6 +25,7 @@ import sys
 import time
 
 from . import checker
+from . import distributed
 from . import strategy_ddmin
 from . import strategy_hierarchical
 from . import mutators
@@ -33,6 +34,7 @@ from . import nodes
 from . import options
 from . import debug_utils
 from . import tmpfiles
+from . import writer
 
 
 class DDSMTException(Exception):
@@ -43,14 +45,14 @@ class DDSMTException(Exception):
         return "[ddsmt] Error: {}".format(self.__msg)
 
 
-def check_options():
+def check_options():  # noqa: C901
     # check input file
     if not os.path.isfile(options.args().infile):
         raise DDSMTException('input file is not a regular file')
 
     if options.args().parser_test:
         # only parse and print
-        exprs = list(nodeio.parse_smtlib(open(options.args().infile).read()))
+        exprs = list(nodeio.parse_smtlib_file(options.args().infile))
         print(nodeio.write_smtlib(sys.stdout, exprs))
         sys.exit(0)
 
@@ -63,9 +65,44 @@ def check_options():
     if not os.access(options.args().cmd[0], os.X_OK):
         raise DDSMTException('Command "{}" is not executable'.format(
             options.args().cmd[0]))
-
-
-def setup_logging():
+    if options.args().oracle and options.args().stdin:
+        raise DDSMTException('--oracle can not be used with --stdin')
+    if options.args().oracle and options.args().timeout_clock == 'cpu':
+        raise DDSMTException(
+            '--oracle can not be used with --timeout-clock cpu')
+    if options.args().listen:
+        try:
+            distributed.parse_address(options.args().listen)
+        except ValueError as e:
+            raise DDSMTException(f'--listen: {e}')
+        if not options.args().secret_file:
+            raise DDSMTException('--listen requires --secret-file')
+        try:
+            distributed.read_secret(options.args().secret_file)
+        except (OSError, ValueError) as e:
+            raise DDSMTException(f'--secret-file: {e}')
+    if options.args().differential and not options.args().cmd_cc:
+        raise DDSMTException('--differential requires --cross-check')
+    if options.args().performance is not None:
+        if not options.args().cmd_cc:
+            raise DDSMTException('--performance requires --cross-check')
+        if options.args().differential:
+            raise DDSMTException(
+                '--performance can not be used with --differential')
+        if options.args().timeout_clock != 'cpu':
+            raise DDSMTException(
+                '--performance requires --timeout-clock cpu')
+        if not 0 < options.args().performance_error < 0.5:
+            raise DDSMTException(
+                '--performance-error must be between 0 and 0.5')
+        if options.args().performance_min_time < 1:
+            raise DDSMTException(
+                '--performance-min-time must be at least 1 second')
+
+
+def add_log_levels():
+    """Add the log levels ``CHAT`` and ``TRACE`` and the respective
+    functions ``logging.chat`` and ``logging.trace``."""
     logging.CHAT = 25
     logging.addLevelName(logging.CHAT, "CHAT")
     logging.chat = lambda msg, *args, **kwargs: logging.log(
@@ -74,6 +111,10 @@ def setup_logging():
     logging.addLevelName(logging.TRACE, "TRACE")
     logging.trace = lambda msg, *args, **kwargs: logging.log(
         logging.TRACE, msg, *args, **kwargs)
+
+
+def setup_logging():
+    add_log_levels()
     logging.basicConfig(format='[ddSMT %(levelname)s] %(message)s')
     verbositymap = {
         -2: logging.ERROR,
@@ -89,69 +130,97 @@ def setup_logging():
 
 
 def ddsmt_main():
-    start_time_process = time.process_time()
     # general setup
     setup_logging()
     check_options()
     tmpfiles.init()
 
     with debug_utils.Profiler(True):
-        # show what we are going to do
-        logging.info("input file:   '{}'".format(options.args().infile))
-        logging.info("output file:  '{}'".format(options.args().outfile))
-        logging.info("command:      '{}'".format(" ".join(
-            map(str,
-                options.args().cmd))))
-        if options.args().cmd_cc:
-            logging.info("command (cc): '{}'".format(options.args().cmd_cc))
-
-        # parse the input
-        start_time = time.time()
-        with open(options.args().infile, 'r') as infile:
-            exprs = list(nodeio.parse_smtlib(infile.read()))
-            nexprs = nodes.count_exprs(exprs)
-
-        logging.debug("parsed {} s-expressions in {:.2f} seconds".format(
-            nexprs,
-            time.time() - start_time))
-
-        if options.args().parser_test:
-            nodes.write_smtlib_to_file(options.args().outfile, exprs)
-            return
-
-        # disable unused theories
-        mutators.auto_detect_theories(exprs)
-        # copy binaries to temp folder
-        tmpfiles.copy_binaries()
-        # perform golden runs to see what the solver is doing
-        checker.do_golden_runs()
-
-        orig_exprs = exprs
-        # do the reduction
+        reduce_file()
+
+
+def reduce_file():
+    """Reduce the input file as configured by the options of the current
+    reduction context, after the general setup by ``ddsmt_main()``."""
+    start_time_process = time.process_time()
+    # show what we are going to do
+    logging.info("input file:   '{}'".format(options.args().infile))
+    logging.info("output file:  '{}'".format(options.args().outfile))
+    logging.info("command:      '{}'".format(" ".join(
+        map(str,
+            options.args().cmd))))
+    if options.args().cmd_cc:
+        logging.info("command (cc): '{}'".format(options.args().cmd_cc))
+
+    # parse the input
+    start_time = time.time()
+    if options.args().parse_cache:
+        exprs = nodeio.parse_smtlib_file_cached(
+            options.args().infile,
+            options.args().parse_cache,
+            options.args().lazy_parsing,
+            options.args().jobs)
+    else:
+        exprs = nodeio.parse_smtlib_file_parallel(
+            options.args().infile,
+            options.args().jobs,
+            options.args().lazy_parsing)
+    nexprs = nodes.count_exprs(exprs)
+
+    logging.debug("parsed {} s-expressions in {:.2f} seconds".format(
+        nexprs,
+        time.time() - start_time))
+
+    if options.args().parser_test:
+        nodes.write_smtlib_to_file(options.args().outfile, exprs)
+        return
+
+    # disable unused theories
+    mutators.auto_detect_theories(exprs)
+    # accept agents that run the checks
+    coordinator = None
+    if options.args().listen:
+        coordinator = distributed.Coordinator(
+            distributed.parse_address(options.args().listen))
+    # copy binaries to temp folder
+    tmpfiles.copy_binaries()
+    # perform golden runs to see what the solver is doing
+    checker.do_golden_runs()
+    if coordinator:
+        checker.set_oracle(coordinator.check_exprs)
+
+    orig_exprs = exprs
+    # do the reduction, the output file is written in the background
+    writer.start(options.args().outfile)
+    try:
         if options.args().strategy in ('ddmin', 'hybrid'):
             exprs, ntests = strategy_ddmin.reduce(exprs)
         if options.args().strategy in ('hierarchical', 'hybrid'):
             exprs, ntests = strategy_hierarchical.reduce(exprs)
-        end_time = time.time()
-
-        # show the results
-        if exprs != orig_exprs:
-            ifilesize = os.path.getsize(options.args().infile)
-            ofilesize = os.path.getsize(options.args().outfile)
-            exprcount = nodes.count_exprs(exprs)
-            proctime = time.process_time() - start_time_process
-            sizeperc = ofilesize / ifilesize * 100
-            exprperc = exprcount / nexprs * 100
-
-            logging.info('')
-            logging.info(f'runtime:         {end_time - start_time:.2f} s')
-            logging.debug(f'main process:   {proctime:.2f} s')
-            logging.info(f'tests:           {ntests}')
-            logging.info('input file:')
-            logging.info(f'  file size:     {ifilesize} B')
-            logging.info(f'  s-expressions: {nexprs}')
-            logging.info('reduced file:')
-            logging.info(f'  file size:     {ofilesize} B ({sizeperc:3.1f}%)')
-            logging.info(f'  s-expressions: {exprcount} ({exprperc:3.1f}%)')
-        else:
-            logging.warning('unable to minimize input file')
+    finally:
+        writer.finish()
+        if coordinator:
+            coordinator.close()
+    end_time = time.time()
+
+    # show the results
+    if exprs != orig_exprs:
+        ifilesize = os.path.getsize(options.args().infile)
+        ofilesize = os.path.getsize(options.args().outfile)
+        exprcount = nodes.count_exprs(exprs)
+        proctime = time.process_time() - start_time_process
+        sizeperc = ofilesize / ifilesize * 100
+        exprperc = exprcount / nexprs * 100
+
+        logging.info('')
+        logging.info(f'runtime:         {end_time - start_time:.2f} s')
+        logging.debug(f'main process:   {proctime:.2f} s')
+        logging.info(f'tests:           {ntests}')
+        logging.info('input file:')
+        logging.info(f'  file size:     {ifilesize} B')
+        logging.info(f'  s-expressions: {nexprs}')
+        logging.info('reduced file:')
+        logging.info(f'  file size:     {ofilesize} B ({sizeperc:3.1f}%)')
+        logging.info(f'  s-expressions: {exprcount} ({exprperc:3.1f}%)')
+    else:
+        logging.warning('unable to minimize input file')
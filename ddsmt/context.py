@@ -0,0 +1,108 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+
+
+class ReductionContext:
+    """The state of a single reduction.
+
+    Holds the options (see ``options.args()``) and the state that modules
+    keep for a reduction, e.g., the golden runs of ``checker`` or the
+    lookups of ``smtlib``. Every thread has a current context, which is
+    set via ``with context:`` and returned by ``current()``. Threads
+    without context use a process-wide default context. Several
+    reductions can thus run concurrently in different threads of one
+    process.
+    """
+    def __init__(self, args=None):
+        self.args = args
+        self.__states = {}
+        self.__lock = threading.Lock()
+
+    def state(self, name, factory):
+        """Return the state of module ``name`` in this context, which is
+        created via ``factory()`` when it is first used."""
+        try:
+            return self.__states[name]
+        except KeyError:
+            with self.__lock:
+                if name not in self.__states:
+                    self.__states[name] = factory()
+                return self.__states[name]
+
+    def __getstate__(self):
+        """Pickle the context without its lock, e.g., as initializer
+        argument of a worker pool that spawns its processes."""
+        state = self.__dict__.copy()
+        del state['_ReductionContext__lock']
+        return state
+
+    def __setstate__(self, state):
+        """Unpickle the context and create a new lock."""
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        """Make this context the current context of this thread."""
+        _push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        """Restore the previous context of this thread."""
+        _pop()
+
+
+# The current context of every thread and the contexts it replaced.
+_LOCAL = threading.local()
+__DEFAULT = ReductionContext()
+
+
+def _push(context):
+    _LOCAL.stack = getattr(_LOCAL, 'stack', [])
+    _LOCAL.stack.append(getattr(_LOCAL, 'context', None))
+    _LOCAL.context = context
+
+
+def _pop():
+    _LOCAL.context = _LOCAL.stack.pop()
+
+
+def current():
+    """Return the current context of this thread."""
+    return getattr(_LOCAL, 'context', None) or __DEFAULT
+
+
+def activate(context):
+    """Make ``context`` the current context of this thread for good, e.g.,
+    as initializer of a worker pool."""
+    _LOCAL.context = context
+
+
+def bind(func):
+    """Return a function that calls ``func`` within the current context,
+    e.g., as target of another thread."""
+    context = current()
+
+    def run(*args, **kwargs):
+        with context:
+            return func(*args, **kwargs)
+
+    return run
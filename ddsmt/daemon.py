@@ -0,0 +1,437 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from . import context
+from . import mutators
+from . import options
+from . import scheduler
+
+# The commands that are handled by ``main()`` instead of a regular reduction.
+COMMANDS = ('serve', 'submit', 'status')
+# States of a job that do not change anymore.
+__FINAL_STATES = ('done', 'failed')
+# How often (in seconds) ``--wait`` asks the daemon for the state of a job.
+__POLL_INTERVAL = 0.5
+
+
+def default_socket():
+    """Return the default path of the socket of the daemon."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'ddsmt.sock')
+    return os.path.join(tempfile.gettempdir(), f'ddsmt-{os.getuid()}.sock')
+
+
+class Job:
+    """A reduction job of the daemon."""
+    def __init__(self, id, args):
+        self.id = id
+        self.args = args
+        self.state = 'queued'
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.sizes = None
+
+    def status(self):
+        """Return the state of the job as dictionary."""
+        res = {
+            'id': self.id,
+            'state': self.state,
+            'infile': self.args.infile,
+            'outfile': self.args.outfile,
+        }
+        if self.started is not None:
+            res['runtime'] = (self.finished or time.time()) - self.started
+        if self.sizes is not None:
+            res['infile_size'], res['outfile_size'] = self.sizes
+        if self.error is not None:
+            res['error'] = self.error
+        return res
+
+
+class Daemon:
+    """Runs reduction jobs on behalf of clients.
+
+    Every job runs in a process of its own with its own
+    ``ReductionContext``, at most ``max_jobs`` of them concurrently while
+    further jobs are queued. The processes are forked from a server that
+    has ``ddsmt`` imported already (and never from the daemon itself, whose
+    threads could leave locks held in the forked process). All commands
+    that the jobs execute share ``slots`` cores via a
+    ``scheduler.FairScheduler``.
+    """
+    def __init__(self, slots, max_jobs):
+        self.__slots = slots
+        self.__max_jobs = max_jobs
+        self.__mp = multiprocessing.get_context('forkserver')
+        self.__mp.set_forkserver_preload([__name__])
+        self.__scheduler = scheduler.FairScheduler(slots, max_jobs, self.__mp)
+        self.__lock = threading.Lock()
+        self.__jobs = collections.OrderedDict()
+        self.__queue = collections.deque()
+        self.__running = 0
+
+    def submit(self, argv, cwd):
+        """Queue a new job for the ``ddsmt`` command line ``argv``, and
+        return its id.
+
+        Relative paths of the input file, the output file and the commands
+        are relative to ``cwd``. Unless ``--jobs`` is given, the job uses
+        as many worker processes as the daemon has cores.
+        """
+        try:
+            args = options.parse_options(
+                mutators, ['--jobs', str(self.__slots)] + list(argv))
+        except SystemExit:
+            raise ValueError('invalid arguments: {}'.format(' '.join(argv)))
+        if args.parser_test or args.profile:
+            raise ValueError('--parser-test and --profile are not supported')
+        args.infile = os.path.join(cwd, args.infile)
+        args.outfile = os.path.join(cwd, args.outfile)
+        if args.cmd:
+            args.cmd[0] = os.path.join(cwd, args.cmd[0])
+        if args.cmd_cc:
+            args.cmd_cc[0] = os.path.join(cwd, args.cmd_cc[0])
+        if args.parse_cache:
+            args.parse_cache = os.path.join(cwd, args.parse_cache)
+        if args.secret_file:
+            args.secret_file = os.path.join(cwd, args.secret_file)
+        with self.__lock:
+            job = Job(len(self.__jobs) + 1, args)
+            self.__jobs[job.id] = job
+            self.__queue.append(job)
+            self.__start_jobs()
+        logging.chat(f'job {job.id}: queued {job.args.infile}')
+        return job.id
+
+    def status(self, id=None):
+        """Return the state of job ``id``, or of all jobs."""
+        with self.__lock:
+            if id is None:
+                return [job.status() for job in self.__jobs.values()]
+            if id not in self.__jobs:
+                raise ValueError(f'unknown job {id}')
+            return [self.__jobs[id].status()]
+
+    def __start_jobs(self):
+        """Start queued jobs while fewer than ``max_jobs`` are running."""
+        while self.__queue and self.__running < self.__max_jobs:
+            job = self.__queue.popleft()
+            job.state = 'running'
+            job.started = time.time()
+            self.__running += 1
+            threading.Thread(target=self.__run,
+                             args=(job, self.__scheduler.register()),
+                             daemon=True).start()
+
+    def __run(self, job, share):
+        """Run ``job`` within ``share`` of the scheduler."""
+        from . import checker
+        from . import cli
+        from . import tmpfiles
+        try:
+            with context.ReductionContext(job.args) as ctx:
+                cli.check_options()
+                tmpfiles.init()
+                tmpfiles.copy_binaries()
+                checker.set_scheduler(share)
+            job.error = self.__run_process(ctx)
+            if job.error is None:
+                if os.path.isfile(job.args.outfile):
+                    job.sizes = (os.path.getsize(job.args.infile),
+                                 os.path.getsize(job.args.outfile))
+                job.state = 'done'
+            else:
+                job.state = 'failed'
+        except (Exception, SystemExit) as e:
+            job.state = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            self.__scheduler.unregister(share)
+            logging.chat(f'job {job.id}: {job.state} after '
+                         f'{job.finished - job.started:.2f} seconds')
+            with self.__lock:
+                self.__running -= 1
+                self.__start_jobs()
+
+    def __run_process(self, ctx):
+        """Run the reduction of ``ctx`` in a new process and return the
+        error message if it failed, or ``None``."""
+        reader, writer = self.__mp.Pipe(duplex=False)
+        proc = self.__mp.Process(target=_run_job,
+                                 args=(ctx, multiprocessing.get_start_method(),
+                                       logging.getLogger().level, writer))
+        proc.start()
+        writer.close()
+        try:
+            return reader.recv()
+        except EOFError:
+            proc.join()
+            return f'reduction process died with exit code {proc.exitcode}'
+        finally:
+            reader.close()
+            proc.join()
+
+    def handle(self, request):
+        """Handle a single request and return the response."""
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('malformed request')
+            if request.get('command') == 'submit':
+                return {'id': self.submit(request['argv'], request['cwd'])}
+            if request.get('command') == 'status':
+                return {'jobs': self.status(request.get('id'))}
+            raise ValueError('unknown request')
+        except (KeyError, TypeError, ValueError) as e:
+            return {'error': str(e)}
+
+
+def _run_job(ctx, start_method, loglevel, conn):
+    """Run the reduction of ``ctx`` in the current process (see
+    ``Daemon``) and send the error message if it failed, or ``None``, via
+    ``conn``.
+
+    The worker processes of the reduction are started via
+    ``start_method``, as they would be by a regular reduction.
+    """
+    multiprocessing.set_start_method(start_method, force=True)
+    # the strategies (and debug_utils) read the options on import
+    context.activate(ctx)
+    from . import cli
+    cli.setup_logging()
+    logging.getLogger().setLevel(loglevel)
+    try:
+        cli.reduce_file()
+    except (Exception, SystemExit) as e:
+        conn.send(str(e))
+    else:
+        conn.send(None)
+
+
+class __RequestHandler(socketserver.StreamRequestHandler):
+    """Handles the requests of a connection, one JSON object per line."""
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.daemon.handle(json.loads(line))
+            except ValueError:
+                response = {'error': 'malformed request'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+def __is_listening(path):
+    """Check whether a daemon listens on the socket ``path``."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+        return True
+
+
+def serve(path, slots, max_jobs):
+    """Run the daemon on the socket ``path`` until it is interrupted."""
+    from . import cli
+    if __is_listening(path):
+        raise cli.DDSMTException(f'a daemon is already listening on {path}')
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socketserver.ThreadingUnixStreamServer(path, __RequestHandler)
+    server.daemon_threads = True
+    server.daemon = Daemon(slots, max_jobs)
+    logging.chat(f'listening on {path} with {slots} cores')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def request(path, request):
+    """Send ``request`` to the daemon on the socket ``path`` and return its
+    response."""
+    from . import cli
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            raise cli.DDSMTException(
+                f'no daemon is listening on {path} (see ddsmt serve)')
+        file = sock.makefile('rwb')
+        file.write(json.dumps(request).encode() + b'\n')
+        file.flush()
+        response = json.loads(file.readline())
+    if 'error' in response:
+        raise cli.DDSMTException(response['error'])
+    return response
+
+
+def __format_job(job):
+    """Format the state of a job as a single line."""
+    res = f'{job["id"]:>4} {job["state"]:<8}'
+    res += f' {job["runtime"]:8.2f} s' if 'runtime' in job else ' ' * 11
+    res += f' {job["infile"]} -> {job["outfile"]}'
+    if job.get('outfile_size') is not None:
+        res += f' ({job["outfile_size"] / job["infile_size"] * 100:.1f}%)'
+    if 'error' in job:
+        res += f': {job["error"]}'
+    return res
+
+
+def __wait(path, id):
+    """Wait until job ``id`` is done or failed and return its state."""
+    while True:
+        job = request(path, {'command': 'status', 'id': id})['jobs'][0]
+        if job['state'] in __FINAL_STATES:
+            return job
+        time.sleep(__POLL_INTERVAL)
+
+
+def __check_submission(argv):
+    """Check the arguments of a job like a regular reduction would, to
+    report errors right away."""
+    from . import cli
+    args = options.parse_options(mutators, argv)
+    if args.parser_test or args.profile:
+        raise cli.DDSMTException(
+            '--parser-test and --profile are not supported by ddsmt submit')
+    with context.ReductionContext(args):
+        cli.check_options()
+
+
+def main(command, argv):
+    """Main entry point for ``ddsmt serve``, ``ddsmt submit`` and ``ddsmt
+    status``."""
+    ap = argparse.ArgumentParser(
+        prog=f'ddsmt {command}',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    ap.add_argument('--socket',
+                    metavar='path',
+                    default=default_socket(),
+                    help='the socket of the daemon')
+    if command == 'serve':
+        ap.description = ('run a daemon that reduces the inputs submitted '
+                          'via ddsmt submit')
+        ap.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        metavar='n',
+                        default=os.cpu_count(),
+                        help='number of cores shared by all reductions')
+        ap.add_argument('--max-jobs',
+                        type=int,
+                        metavar='n',
+                        default=4,
+                        help='number of reductions that run concurrently, '
+                        'further reductions are queued')
+        ap.add_argument('-v',
+                        action='count',
+                        dest='verbosity',
+                        default=0,
+                        help='increase verbosity')
+        ap.add_argument('-q',
+                        action='count',
+                        dest='quietness',
+                        default=0,
+                        help='decrease verbosity')
+    elif command == 'submit':
+        ap.description = ('submit a reduction to the daemon and print its '
+                          'id, the arguments are the same as for ddsmt')
+        ap.add_argument('--wait',
+                        action='store_true',
+                        help='wait until the reduction is done')
+        ap.add_argument('arguments',
+                        nargs=argparse.REMAINDER,
+                        help='the arguments of the reduction, preceded by -- '
+                        'if they start with an option')
+    else:
+        ap.description = 'show the state of the reductions of the daemon'
+        ap.add_argument('--wait',
+                        action='store_true',
+                        help='wait until the reduction is done')
+        ap.add_argument('--json',
+                        action='store_true',
+                        help='print the state as JSON, one job per line')
+        ap.add_argument('id',
+                        nargs='?',
+                        type=int,
+                        help='the reduction (default: all reductions)')
+    daemon_args = ap.parse_args(argv)
+
+    # the strategies (and debug_utils) read the options on import
+    context.current().args = options.parse_options(
+        mutators, ['<input>', '<output>'])
+    from . import cli
+    try:
+        if command == 'serve':
+            context.current().args.verbosity = daemon_args.verbosity
+            context.current().args.quietness = daemon_args.quietness
+            cli.setup_logging()
+            serve(daemon_args.socket, daemon_args.jobs, daemon_args.max_jobs)
+            return 0
+        if command == 'submit':
+            arguments = daemon_args.arguments
+            if arguments[:1] == ['--']:
+                arguments = arguments[1:]
+            __check_submission(arguments)
+            id = request(daemon_args.socket, {
+                'command': 'submit',
+                'argv': arguments,
+                'cwd': os.getcwd()
+            })['id']
+            if not daemon_args.wait:
+                print(id)
+                return 0
+            jobs = [__wait(daemon_args.socket, id)]
+        elif daemon_args.wait:
+            if daemon_args.id is None:
+                ap.error('--wait requires a job id')
+            jobs = [__wait(daemon_args.socket, daemon_args.id)]
+        else:
+            jobs = request(daemon_args.socket, {
+                'command': 'status',
+                'id': daemon_args.id
+            })['jobs']
+        for job in jobs:
+            print(json.dumps(job) if command == 'status'
+                  and daemon_args.json else __format_job(job))
+        if daemon_args.wait and jobs[0]['state'] == 'failed':
+            return 1
+        return 0
+    except cli.DDSMTException as e:
+        print(e)
+    except KeyboardInterrupt:
+        print("[ddsmt] interrupted")
+    return 1
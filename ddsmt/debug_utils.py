@@ -6,6 +6,7 @@ import logging
 import multiprocessing
 import os
 import subprocess
+import threading
 
 from . import nodeio
 from . import options
@@ -48,7 +49,10 @@ class Profiler:
     def __init__(self, is_main=False):
         """Create a profiler."""
         if Profiler.enabled:
-            if multiprocessing.parent_process() is None:
+            if threading.current_thread() is not threading.main_thread():
+                # worker threads (--executor thread) are not profiled
+                self.enabled = False
+            elif multiprocessing.parent_process() is None:
                 self.enabled = True
                 self.filename = '.profile.prof'
             else:
@@ -0,0 +1,509 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import collections
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+from . import checker
+from . import context
+from . import mutators
+from . import nodeio
+from . import options
+from . import tmpfiles
+
+# How long (in seconds) an agent waits before it reconnects, after the
+# coordinator closed the connection or after the setup failed.
+__RECONNECT_INTERVAL = 1
+__RETRY_INTERVAL = 10
+# Number of inputs an agent keeps its golden runs for.
+__SESSIONS_SIZE = 4
+
+
+def parse_address(address):
+    """Parse ``host:port`` and return the pair ``(host, port)``.
+
+    The host may be omitted (``port`` or ``:port``) and defaults to the
+    loopback address. Raises ``ValueError`` if ``address`` is malformed.
+    """
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f'expected host:port instead of "{address}"')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+def read_secret(filename):
+    """Return the secret that coordinator and agents share, as stored in
+    ``filename`` (without surrounding whitespace).
+
+    Raises ``ValueError`` if the file is empty.
+    """
+    with open(filename, 'rb') as file:
+        secret = file.read().strip()
+    if not secret:
+        raise ValueError(f'{filename} is empty')
+    return secret
+
+
+def sign(secret, role, nonce):
+    """Return the HMAC of the challenge ``nonce`` that proves that ``role``
+    (``agent`` or ``coordinator``) knows ``secret``."""
+    return hmac.new(secret, f'{role}:{nonce}'.encode(),
+                    hashlib.sha256).hexdigest()
+
+
+def _verify(secret, role, nonce, mac):
+    """Check the HMAC ``mac`` of ``nonce`` for ``role``, see ``sign()``."""
+    return hmac.compare_digest(
+        str(mac).encode(),
+        sign(secret, role, nonce).encode())
+
+
+def delta(base, data):
+    """Return ``(prefix, suffix, middle)`` such that ``data`` is
+    ``base[:prefix] + middle + base[len(base) - suffix:]``."""
+    size = min(len(base), len(data))
+    base_view = memoryview(base)
+    data_view = memoryview(data)
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if base_view[:mid] == data_view[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, size - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if base_view[len(base) - mid:] == data_view[len(data) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, lo, data[prefix:len(data) - lo]
+
+
+def apply_delta(base, prefix, suffix, middle):
+    """Reconstruct the data from ``base`` and a delta (see ``delta()``)."""
+    return base[:prefix] + middle + base[len(base) - suffix:]
+
+
+class Connection:
+    """A connection between coordinator and agent.
+
+    Every message consists of a JSON object on a single line, followed by
+    ``size`` bytes of payload. ``base`` is the input version the agent
+    uses as base for deltas.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.name = '{}:{}'.format(*sock.getpeername()[:2])
+        self.file = sock.makefile('rwb')
+        self.base = None
+
+    def send(self, header, payload=b''):
+        """Send a message."""
+        header = dict(header, size=len(payload))
+        self.file.write(json.dumps(header).encode() + b'\n' + payload)
+        self.file.flush()
+
+    def send_delta(self, op, base, data):
+        """Send ``data`` as delta to ``base``."""
+        prefix, suffix, middle = delta(base, data)
+        self.send({'op': op, 'prefix': prefix, 'suffix': suffix}, middle)
+
+    def receive(self):
+        """Receive a message and return its header and payload."""
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('connection closed')
+        header = json.loads(line)
+        payload = self.file.read(header['size'])
+        if len(payload) != header['size']:
+            raise ConnectionError('connection closed')
+        return header, payload
+
+    def close(self):
+        """Close the connection, unblocking pending reads and writes."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class Coordinator:
+    """Lets agents (see ``ddsmt agent``) run the checks of the current
+    reduction.
+
+    Listens on ``address`` (a pair of host and port) for agents. Agent
+    and coordinator first prove to each other that they know the secret
+    of ``--secret-file`` by answering a challenge with its HMAC. Every
+    agent connection then gets the options (without the commands, agents
+    use their own) and the input, does its own golden runs and then
+    checks one candidate at a time. Candidates are
+    sent as delta to the current input, which in turn is sent as delta to
+    the previous input whenever a candidate was successful. If an agent
+    is lost, its candidate is checked by another agent. If no agent is
+    connected (anymore), candidates are checked locally, which requires
+    the golden runs to be done locally as well.
+    """
+
+    # How long (in seconds) to wait for an agent before reporting it, or
+    # checking locally if no agent is connected.
+    WAIT_INTERVAL = 10
+
+    def __init__(self, address):
+        self.__secret = read_secret(options.args().secret_file)
+        args = dict(vars(options.args()))
+        args['cmd'] = None
+        args['cmd_cc'] = None
+        args['listen'] = None
+        args['secret_file'] = None
+        self.__setup = {
+            'op': 'setup',
+            'args': args,
+            'cross_check': bool(options.args().cmd_cc),
+            'ext': os.path.splitext(args['infile'])[1]
+        }
+        with open(args['infile'], 'rb') as infile:
+            self.__input = infile.read()
+        self.__version = None
+        self.__idle = queue.Queue()
+        self.__connections = set()
+        # whether no agent was connected when a check last needed one
+        self.__local = False
+        self.__lock = threading.Lock()
+        self.__server = socket.socket(socket.AF_INET6 if ':' in address[0]
+                                      else socket.AF_INET)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind(address)
+        self.__server.listen()
+        self.address = self.__server.getsockname()[:2]
+        logging.chat('waiting for agents on {}:{}'.format(*self.address))
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    def __accept(self):
+        """Accept agents until the coordinator is closed."""
+        while True:
+            try:
+                sock, _ = self.__server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.__add_agent,
+                             args=(sock, ),
+                             daemon=True).start()
+
+    def __add_agent(self, sock):
+        """Authenticate a new agent, send it the setup and wait until it is
+        ready."""
+        conn = Connection(sock)
+        with self.__lock:
+            self.__connections.add(conn)
+        try:
+            nonce = os.urandom(16).hex()
+            conn.send({'op': 'challenge', 'nonce': nonce})
+            header, _ = conn.receive()
+            if not _verify(self.__secret, 'agent', nonce, header['mac']):
+                raise ValueError('authentication failed')
+            mac = sign(self.__secret, 'coordinator', header['nonce'])
+            conn.send(dict(self.__setup, mac=mac), self.__input)
+            header, _ = conn.receive()
+            if 'error' in header:
+                raise ValueError(header['error'])
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'agent {conn.name} failed: {e}')
+            self.__drop(conn)
+            return
+        logging.info(f'agent {conn.name} is ready')
+        with self.__lock:
+            self.__local = False
+        self.__idle.put(conn)
+
+    def __drop(self, conn):
+        with self.__lock:
+            self.__connections.discard(conn)
+        conn.close()
+
+    def __get_agent(self):
+        """Return an idle agent, wait until one is available.
+
+        Returns ``None`` if no agent is connected, after ``WAIT_INTERVAL``
+        seconds or right away if no agent was connected the last time.
+        """
+        while True:
+            with self.__lock:
+                local = self.__local and not self.__connections
+            try:
+                return self.__idle.get(block=not local,
+                                       timeout=self.WAIT_INTERVAL)
+            except queue.Empty:
+                pass
+            with self.__lock:
+                if not self.__connections:
+                    if not self.__local:
+                        logging.warning('no agent connected, checking '
+                                        'locally')
+                    self.__local = True
+                    return None
+            logging.warning('no agent available for '
+                            f'{self.WAIT_INTERVAL} seconds')
+
+    def __reply_timeout(self):
+        """Return how long to wait for a verdict before an agent is
+        considered lost."""
+        timeout = (options.args().timeout or 0) + (options.args().timeout_cc
+                                                   or 0)
+        return max(60, 10 * timeout)
+
+    def check(self, candidate):
+        """Check the SMT-LIB input ``candidate`` (as bytes) on an agent, or
+        locally if no agent is connected."""
+        while True:
+            conn = self.__get_agent()
+            if conn is None:
+                verdict = bool(_check(candidate))
+                if verdict or self.__version is None:
+                    self.__version = candidate
+                return verdict
+            version = self.__version or candidate
+            try:
+                conn.sock.settimeout(self.__reply_timeout())
+                if conn.base is not version:
+                    conn.send_delta('version', conn.base or b'', version)
+                    conn.base = version
+                conn.send_delta('check', version, candidate)
+                header, _ = conn.receive()
+                verdict = header['verdict']
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f'lost agent {conn.name} ({e}), checking '
+                                'on another agent')
+                self.__drop(conn)
+                continue
+            self.__idle.put(conn)
+            if verdict or self.__version is None:
+                self.__version = candidate
+            return verdict
+
+    def check_exprs(self, exprs):
+        """Check ``exprs`` on an agent, see ``checker.set_oracle()``."""
+        file = io.StringIO()
+        nodeio.write_smtlib_for_checking(file, exprs)
+        return self.check(file.getvalue().encode())
+
+    def close(self):
+        """Stop accepting agents and close all connections."""
+        self.__server.close()
+        with self.__lock:
+            for conn in self.__connections:
+                conn.close()
+            self.__connections.clear()
+
+
+# Reduction contexts of the agent with completed golden runs, indexed by
+# the digest of their setup.
+__SESSIONS = collections.OrderedDict()
+__SESSIONS_LOCK = threading.Lock()
+
+
+def __get_session(header, input, cmd, cmd_cc):
+    """Return the reduction context for the setup ``header`` and ``input``
+    with the commands ``cmd`` and ``cmd_cc`` of the agent, and do the golden
+    runs if they were not yet done."""
+    key = hashlib.sha256(json.dumps(header).encode() + input).hexdigest()
+    with __SESSIONS_LOCK:
+        if key in __SESSIONS:
+            __SESSIONS.move_to_end(key)
+            return __SESSIONS[key]
+        fd, infile = tempfile.mkstemp(suffix=header['ext'],
+                                      prefix='ddsmt-agent-')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(input)
+        args = argparse.Namespace(**header['args'])
+        args.cmd = list(cmd)
+        args.cmd_cc = list(cmd_cc) if header['cross_check'] else None
+        args.infile = infile
+        args.outfile = None
+        ctx = context.ReductionContext(args)
+        with ctx:
+            try:
+                tmpfiles.copy_binaries()
+                checker.do_golden_runs()
+            except SystemExit:
+                ctx = None
+        __SESSIONS[key] = ctx
+        if len(__SESSIONS) > __SESSIONS_SIZE:
+            _, old = __SESSIONS.popitem(last=False)
+            if old is not None:
+                os.unlink(old.args.infile)
+        return ctx
+
+
+def _check(candidate):
+    """Check ``candidate`` in the current reduction context."""
+    if options.args().stdin:
+        return checker.check(None, candidate)
+    file, filename = tmpfiles.get_candidate_file()
+    file.write(candidate.decode())
+    file.flush()
+    return checker.check(filename)
+
+
+def __serve(conn, secret, cmd, cmd_cc):
+    """Serve the coordinator on ``conn`` until it closes the connection.
+
+    Checks run the commands ``cmd`` and ``cmd_cc`` of the agent, never
+    commands of the coordinator.
+    """
+    header, _ = conn.receive()
+    if header.get('op') != 'challenge':
+        raise ValueError('expected challenge')
+    nonce = os.urandom(16).hex()
+    conn.send({
+        'op': 'auth',
+        'mac': sign(secret, 'agent', header['nonce']),
+        'nonce': nonce
+    })
+    header, input = conn.receive()
+    if header.get('op') != 'setup':
+        raise ValueError('expected setup')
+    if not _verify(secret, 'coordinator', nonce, header.pop('mac', '')):
+        raise ValueError('authentication failed')
+    if header['cross_check'] and not cmd_cc:
+        error = 'the reduction uses a cross check, but the agent has none'
+        conn.send({'error': error})
+        raise ValueError(error)
+    ctx = __get_session(header, input, cmd, cmd_cc)
+    if ctx is None:
+        conn.send({'error': 'the golden runs failed'})
+        raise ValueError('the golden runs failed')
+    logging.info(f'connected to {conn.name}')
+    with ctx:
+        conn.send({'ready': True})
+        base = b''
+        while True:
+            header, middle = conn.receive()
+            data = apply_delta(base, header['prefix'], header['suffix'],
+                               middle)
+            if header['op'] == 'version':
+                base = data
+            else:
+                conn.send({'verdict': bool(_check(data))})
+
+
+def __run_agent(address, secret, cmd, cmd_cc):
+    """Connect to the coordinator at ``address`` and serve it, reconnect
+    whenever the connection is closed."""
+    while True:
+        interval = __RECONNECT_INTERVAL
+        try:
+            with socket.create_connection(address) as sock:
+                conn = Connection(sock)
+                __serve(conn, secret, cmd, cmd_cc)
+        except ConnectionError as e:
+            logging.debug(f'disconnected: {e}')
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'disconnected: {e}')
+            interval = __RETRY_INTERVAL
+        time.sleep(interval)
+
+
+def main(argv):
+    """Main entry point for ``ddsmt agent``."""
+    ap = argparse.ArgumentParser(
+        prog='ddsmt agent',
+        description='run the checks of a reduction with --listen',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    ap.add_argument('address', help='the address (host:port) of the '
+                    'coordinator')
+    ap.add_argument('cmd',
+                    nargs=argparse.REMAINDER,
+                    help='the command (with optional arguments) that checks '
+                    'the candidates')
+    ap.add_argument('--cross-check',
+                    metavar='cmd-cc',
+                    dest='cmd_cc',
+                    help='the cross check command, for reductions with '
+                    '--cross-check')
+    ap.add_argument('--secret-file',
+                    metavar='file',
+                    required=True,
+                    help='the file with the secret shared with the '
+                    'coordinator (see --secret-file of ddsmt)')
+    ap.add_argument('-j',
+                    '--jobs',
+                    type=int,
+                    metavar='n',
+                    default=os.cpu_count(),
+                    help='number of parallel checks')
+    ap.add_argument('-v',
+                    action='count',
+                    dest='verbosity',
+                    default=0,
+                    help='increase verbosity')
+    ap.add_argument('-q',
+                    action='count',
+                    dest='quietness',
+                    default=0,
+                    help='decrease verbosity')
+    agent_args = ap.parse_args(argv)
+    try:
+        address = parse_address(agent_args.address)
+        secret = read_secret(agent_args.secret_file)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+    cmd = agent_args.cmd
+    cmd_cc = agent_args.cmd_cc.split() if agent_args.cmd_cc else None
+    for command in (cmd, cmd_cc):
+        if command is None:
+            continue
+        if not command or not os.path.isfile(command[0]) \
+                or not os.access(command[0], os.X_OK):
+            ap.error(f'"{" ".join(command)}" is not an executable command')
+
+    # the strategies (and debug_utils) read the options on import
+    context.current().args = options.parse_options(
+        mutators, ['<input>', '<output>'])
+    from . import cli
+    context.current().args.verbosity = agent_args.verbosity
+    context.current().args.quietness = agent_args.quietness
+    cli.setup_logging()
+    tmpfiles.init('auto')
+    for _ in range(agent_args.jobs):
+        threading.Thread(target=__run_agent,
+                         args=(address, secret, cmd, cmd_cc),
+                         daemon=True).start()
+    logging.chat(f'running {agent_args.jobs} checks for {agent_args.address}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("[ddsmt] interrupted")
+    return 1
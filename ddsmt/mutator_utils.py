@@ -28,8 +28,42 @@ Simplification = collections.namedtuple('Simplification',
 
 def apply_simp(exprs, simp):
     assert isinstance(simp, Simplification)
-    mexprs = nodes.substitute(exprs, simp.substs)
+    # ``substitute`` consumes the substitutions, keep ``simp`` intact such
+    # that it can be composed with others (see ``compose_simps``)
+    mexprs = nodes.substitute(exprs, dict(simp.substs))
     if mexprs is not exprs and simp.fresh_vars:
         assert isinstance(mexprs, list)
         mexprs = smtlib.introduce_variables(mexprs, simp.fresh_vars)
     return mexprs
+
+
+def compose_simps(exprs, simps):
+    """Greedily compose the simplifications ``simps`` of ``exprs`` that
+    substitute disjoint subtrees.
+
+    Simplifications are considered in the given order, and one is added
+    if none of the nodes it substitutes is within or contains a node
+    substituted by one that was already added. Only local substitutions
+    (by node id) are composed. Returns the indices of the composed
+    simplifications and the composed ``Simplification``.
+    """
+    keys = {k for simp in simps for k in simp.substs if isinstance(k, int)}
+    subtrees = {}
+    for node in nodes.dfs(exprs, expand=False):
+        if node.id in keys and node.id not in subtrees:
+            subtrees[node.id] = {n.id for n in nodes.dfs([node], expand=False)}
+    used = set()
+    indices = []
+    substs = {}
+    fresh_vars = []
+    for i, simp in enumerate(simps):
+        if not all(k in subtrees for k in simp.substs):
+            continue
+        ids = set().union(*(subtrees[k] for k in simp.substs))
+        if ids & used:
+            continue
+        used.update(ids)
+        indices.append(i)
+        substs.update(simp.substs)
+        fresh_vars.extend(v for v in simp.fresh_vars if v not in fresh_vars)
+    return indices, Simplification(substs, fresh_vars)
@@ -43,7 +43,7 @@ class BinaryReduction:
             yield Simplification({node.id: node[:sec[0]] + node[sec[1]:]}, [])
 
     def global_mutations(self, node, input_):
-        if node != input_[0]:
+        if node.id != input_[0].id:
             return []
         # generate all sublists as generated by binary-search in bfs order
         # let den be the denominator of the list length (the tree level)
@@ -18,105 +18,411 @@
 # You should have received a copy of the GNU General Public License
 # along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
 import io
+import itertools
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import tempfile
 import textwrap
 import typing
 
+from . import nodes
 from .nodes import Node
 
-
-def parse_smtlib(text: str):  # noqa: C901
+# Token patterns for the lexer used by ``parse_smtlib``. Leading whitespace
+# (only space, tab and newline) is skipped as part of every token. String
+# literals may contain escaped quotes ("") and must not be followed by another
+# quote, so that an unterminated literal like ``"a""`` does not match.
+# Identifiers need to be followed by a delimiter. Everything that does not
+# match (unterminated literals, an identifier at the very end of the input)
+# stops the parser.
+__TOKENS = r'''(?x) [ \t\n]* (?:
+    (?P<string>"[^"]*(?:""[^"]*)*"(?!")) |
+    (?P<symbol>\|[^|]*\|) |
+    (?P<comment>;[^\n]*\n?) |
+    (?P<open>\() |
+    (?P<close>\)) |
+    (?P<token>[^ \t\n()";|][^ \t\n();]*(?=[ \t\n();]))
+)'''
+__TOKENS_STR = re.compile(__TOKENS)
+__TOKENS_BYTES = re.compile(__TOKENS.encode())
+
+
+def __scan_lazy(text, match, decode, start, ident, ids):
+    """Scan the s-expression that starts at ``start`` (right after its
+    opening parenthesis) without building any nodes.
+
+    ``ident`` is the match for the identifier of the s-expression.
+    Returns the end position and a ``LazyNode`` holding the source of
+    the s-expression, or ``None`` if the input ends before the
+    s-expression is closed. The ids of the ``LazyNode``, its identifier
+    and its (reserved) nodes are taken from ``ids`` if it is given.
+    """
+    depth = 1
+    nchildren = 1
+    nexprs = 1
+    nnodes = 2
+    pos = ident.end()
+    while depth > 0:
+        m = match(text, pos)
+        if m is None:
+            return None
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'close':
+            depth -= 1
+            continue
+        if depth == 1:
+            nchildren += 1
+        nnodes += 1
+        if kind == 'open':
+            depth += 1
+            nexprs += 1
+    source = text[start - 1:pos]
+    ident = Node(decode(ident.group('token')), _id=next(ids) if ids else None)
+    _id = first_id = None
+    if ids:
+        _id = next(ids)
+        first_id = next(ids)
+        # reserve the remaining consecutive ids
+        for _ in range(nnodes - 1):
+            next(ids)
+    return pos, nodes.LazyNode(source,
+                               ident,
+                               nchildren,
+                               nexprs,
+                               nnodes,
+                               _id=_id,
+                               _first_id=first_id)
+
+
+def parse_smtlib(text, lazy=False, ids=None):  # noqa: C901
     """Parse SMT-LIB input to list of ``Node`` objects.
 
     Every node represents an s-expression. This generator yields top-
-    level s-expressions (commands) or comments.
+    level s-expressions (commands) or comments. The input can either be
+    a string or a bytes-like object (for example an ``mmap``), in which
+    case only the individual tokens are decoded.
+
+    If ``lazy`` is true, top-level assertions are not parsed but yielded
+    as ``LazyNode`` objects that only parse their source when their
+    children are accessed. If ``ids`` is given, the ids for new nodes
+    (and the ids reserved by lazy nodes) are taken from this iterator,
+    which needs to yield consecutive ids.
     """
+    new_id = ids.__next__ if ids else lambda: None
+    if isinstance(text, str):
+        match = __TOKENS_STR.match
+        decode = str
+        assertion = 'assert'
+    else:
+        match = __TOKENS_BYTES.match
+        decode = bytes.decode
+        assertion = b'assert'
+
     exprs = []
     cur_expr = None
 
     pos = 0
     size = len(text)
     while pos < size:
-        char = text[pos]
-        pos += 1
-
-        # String literals/quoted symbols
-        if char in ('"', '|'):
-            first_char = char
-            literal = [char]
-            # Read until terminating " or |
-            while True:
-                if pos >= size:
-                    return
-                char = text[pos]
-                pos += 1
-                literal.append(char)
-                if char == first_char:
-                    # Check is quote is escaped "a "" b" is one string literal
-                    if char == '"' and pos < size and text[pos] == '"':
-                        literal.append(text[pos])
-                        pos += 1
-                        continue
-                    break
-            cur_expr.append(Node(''.join(literal)))
-
-        # Comments
-        elif char == ';':
-            comment = [char]
-            # Read until newline
-            while pos < size:
-                char = text[pos]
-                pos += 1
-                comment.append(char)
-                if char == '\n':
-                    break
-            comment = ''.join(comment)
-            if cur_expr:
-                cur_expr.append(Node(comment))
-            else:
-                yield Node(comment)
+        m = match(text, pos)
+        if m is None:
+            return
+        pos = m.end()
+        kind = m.lastgroup
 
         # Open s-expression
-        elif char == '(':
+        if kind == 'open':
+            if lazy and not exprs:
+                ident = match(text, pos)
+                if ident is not None and ident.group('token') == assertion:
+                    res = __scan_lazy(text, match, decode, pos, ident, ids)
+                    if res is None:
+                        return
+                    pos, node = res
+                    yield node
+                    continue
             cur_expr = []
             exprs.append(cur_expr)
 
         # Close s-expression
-        elif char == ')':
+        elif kind == 'close':
             cur_expr = exprs.pop()
 
             # Do we have nested s-expressions?
             if exprs:
-                exprs[-1].append(Node(*cur_expr))
+                exprs[-1].append(Node(*cur_expr, _id=new_id()))
                 cur_expr = exprs[-1]
             else:
-                yield Node(*cur_expr)
+                yield Node(*cur_expr, _id=new_id())
                 cur_expr = None
 
-        # Identifier
-        elif char not in (' ', '\t', '\n'):
-            token = [char]
-            while True:
-                if pos >= size:
-                    return
-                char = text[pos]
-                pos += 1
-                if char in (' ', '\t', '\n'):
-                    break
-                if char in ('(', ')', ';'):
-                    pos -= 1
-                    break
-                token.append(char)
-
-            token = Node(''.join(token))
-
-            # Append to current s-expression
+        # Comments
+        elif kind == 'comment':
+            comment = Node(decode(m.group(kind)), _id=new_id())
+            if cur_expr:
+                cur_expr.append(comment)
+            else:
+                yield comment
+
+        # String literals, quoted symbols and identifiers
+        else:
+            token = Node(decode(m.group(kind)), _id=new_id())
             if cur_expr is not None:
                 cur_expr.append(token)
             else:
                 yield token
 
 
+def parse_smtlib_file(filename: str, lazy=False):
+    """Parse the given SMT-LIB file to list of ``Node`` objects.
+
+    Instead of reading the whole file into memory, the file is mapped
+    into memory via ``mmap`` and parsed incrementally by
+    ``parse_smtlib``. Top-level s-expressions are yielded as soon as
+    they have been parsed. ``lazy`` is passed on to ``parse_smtlib``.
+    """
+    with open(filename, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from parse_smtlib(data, lazy)
+
+
+def __split_chunks(data, chunk_size):
+    """Split ``data`` into chunks of at least ``chunk_size`` bytes that end
+    right after a top-level s-expression.
+
+    The pre-scan matches the same tokens as ``parse_smtlib`` and stops
+    where it stops. Returns a list of ``(start, end, nexprs, nnodes)``
+    tuples that cover ``data`` (up to where the pre-scan stopped), where
+    ``nexprs`` is the number of top-level nodes and ``nnodes`` the number
+    of all nodes of a chunk. Returns ``None`` if a parenthesis is closed
+    that was never opened.
+    """
+    res = []
+    start = 0
+    pos = 0
+    depth = 0
+    nexprs = 0
+    nnodes = 0
+    for m in __TOKENS_BYTES.finditer(data):
+        if m.start() != pos:
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'open':
+            depth += 1
+            continue
+        nnodes += 1
+        if kind == 'close':
+            depth -= 1
+            if depth < 0:
+                return None
+        if depth == 0:
+            nexprs += 1
+            # identifiers need the next character, only split after ')'
+            if kind == 'close' and pos - start >= chunk_size:
+                res.append((start, pos, nexprs, nnodes))
+                start = pos
+                nexprs = 0
+                nnodes = 0
+    if start < len(data):
+        res.append((start, len(data), nexprs, nnodes))
+    return res
+
+
+def __parse_chunk(args):
+    """Parse a single chunk of a file in a worker process, using the ids
+    starting with ``first_id``."""
+    filename, start, end, lazy, first_id = args
+    with open(filename, 'rb') as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return [(expr.__getstate__(), *__get_counts(expr))
+                    for expr in parse_smtlib(data[start:end],
+                                             lazy,
+                                             ids=itertools.count(first_id))]
+
+
+def parse_smtlib_file_parallel(filename: str,
+                               jobs: int,
+                               lazy=False,
+                               min_size=2**24):
+    """Parse the given SMT-LIB file using ``jobs`` worker processes.
+
+    A pre-scan splits the file into chunks at the end of top-level
+    s-expressions, which are then parsed in parallel by
+    ``parse_smtlib``. The ids for all chunks are reserved upfront, and
+    every worker gets its own range of ids. The workers return
+    the pickled states of the top-level nodes. If ``lazy`` is true, they
+    are only unpickled when they are expanded (see ``read_snapshot``),
+    otherwise they are unpickled right away. Files smaller than
+    ``min_size`` bytes are parsed by ``parse_smtlib_file`` directly, as
+    well as files where the pre-scan and the workers do not agree on the
+    number of top-level nodes. Returns the list of top-level nodes.
+    """
+    with open(filename, 'rb') as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if jobs < 2 or size == 0 or size < min_size:
+            return list(parse_smtlib_file(filename, lazy))
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # use more chunks than workers to balance the load
+            chunks = __split_chunks(data, size // (4 * jobs))
+    if chunks is None or len(chunks) < 2:
+        return list(parse_smtlib_file(filename, lazy))
+    # a lazy node takes two more ids than the nodes it contains
+    factor = 2 if lazy else 1
+    first_id = Node.reserve_ids(factor * sum(c[3] for c in chunks))
+    tasks = []
+    for start, end, _, nnodes in chunks:
+        tasks.append((filename, start, end, lazy, first_id))
+        first_id += factor * nnodes
+    logging.debug(f'parsing {len(chunks)} chunks with {jobs} processes')
+    res = []
+    with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+        for chunk, states in zip(chunks, pool.imap(__parse_chunk, tasks)):
+            if len(states) != chunk[2]:
+                logging.debug('chunks were not parsed as expected, parsing '
+                              'serially instead')
+                return list(parse_smtlib_file(filename, lazy))
+            res.extend(__load_state(*state, lazy) for state in states)
+    return res
+
+
+# Snapshot files start with a magic string, the last node id and the number of
+# top-level nodes. An index follows, storing offset, length, number of
+# children, number of s-expressions and number of nodes for every top-level
+# node. The payload consists of the pickled states of the top-level nodes.
+__SNAPSHOT_MAGIC = b'DDSMTSN2'
+__SNAPSHOT_HEADER = struct.Struct('=8sqq')
+__SNAPSHOT_INDEX = struct.Struct('=qqiii')
+
+
+def __get_counts(expr: Node):
+    """Return the number of children, s-expressions and nodes of ``expr``
+    as stored along with its pickled state."""
+    if expr.is_leaf():
+        return 0, 0, 1
+    return len(expr), nodes.count_exprs(expr), nodes.count_nodes(expr)
+
+
+def __load_state(state, nchildren, nexprs, nnodes, lazy):
+    """Create a node from its pickled state as returned by
+    ``Node.__getstate__()``.
+
+    If ``lazy`` is true, nodes that have an identifier become
+    ``StateNode`` objects and are only unpickled when they are expanded.
+    """
+    if lazy and len(state) > 5 and state[0] == 40 and state[5] == 76:
+        # b'(' followed by a leaf identifier
+        return nodes.StateNode(state, nchildren, nexprs, nnodes)
+    if state[0] == 90:  # b'Z'
+        node = nodes.LazyNode.__new__(nodes.LazyNode)
+    else:
+        node = Node.__new__(Node)
+    node.__setstate__(bytes(state))
+    return node
+
+
+def write_snapshot(filename: str, exprs: typing.List[Node]):
+    """Write a binary snapshot of ``exprs`` to the given filename.
+
+    The snapshot uses the same format as pickling (via
+    ``Node.__getstate__()``) for every top-level node and is written to
+    a temporary file first, which then replaces ``filename``.
+    """
+    states = [expr.__getstate__() for expr in exprs]
+    offset = __SNAPSHOT_HEADER.size + __SNAPSHOT_INDEX.size * len(exprs)
+    index = []
+    for expr, state in zip(exprs, states):
+        index.append(
+            __SNAPSHOT_INDEX.pack(offset, len(state), *__get_counts(expr)))
+        offset += len(state)
+
+    dirname = os.path.dirname(filename)
+    with tempfile.NamedTemporaryFile(dir=dirname, delete=False) as tmp:
+        tmp.write(
+            __SNAPSHOT_HEADER.pack(__SNAPSHOT_MAGIC, Node.last_id(),
+                                   len(exprs)))
+        tmp.writelines(index)
+        tmp.writelines(states)
+    os.replace(tmp.name, filename)
+
+
+def read_snapshot(filename: str, lazy=False):
+    """Read a binary snapshot as written by ``write_snapshot``.
+
+    The snapshot is mapped into memory. If ``lazy`` is true, top-level
+    nodes that have an identifier are returned as ``StateNode`` objects
+    that are only unpickled when they are expanded. Otherwise, all nodes
+    are unpickled right away. Raises ``ValueError`` if the file is not a
+    valid snapshot.
+    """
+    with open(filename, 'rb') as infile:
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(data) < __SNAPSHOT_HEADER.size:
+        raise ValueError(f'{filename} is not a snapshot')
+    magic, last_id, count = __SNAPSHOT_HEADER.unpack_from(data)
+    if magic != __SNAPSHOT_MAGIC:
+        raise ValueError(f'{filename} is not a snapshot')
+    Node.skip_ids(last_id)
+
+    view = memoryview(data)
+    res = []
+    for i in range(count):
+        offset, length, nchildren, nexprs, nnodes = \
+            __SNAPSHOT_INDEX.unpack_from(
+                data, __SNAPSHOT_HEADER.size + i * __SNAPSHOT_INDEX.size)
+        state = view[offset:offset + length]
+        if len(state) != length:
+            raise ValueError(f'{filename} is truncated')
+        res.append(__load_state(state, nchildren, nexprs, nnodes, lazy))
+    return res
+
+
+def parse_smtlib_file_cached(filename: str,
+                             cachedir: str,
+                             lazy=False,
+                             jobs=1):
+    """Parse the given SMT-LIB file using a snapshot cache.
+
+    Snapshots are stored in ``cachedir`` and are identified by a digest
+    of the file contents (and ``lazy``). If a snapshot exists, it is
+    loaded via ``read_snapshot``. Otherwise, the file is parsed with
+    ``parse_smtlib_file_parallel`` and a new snapshot is written.
+    """
+    with open(filename, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+    suffix = '-lazy' if lazy else ''
+    snapshot = os.path.join(cachedir, f'{digest}{suffix}.snapshot')
+
+    if os.path.isfile(snapshot):
+        try:
+            res = read_snapshot(snapshot, lazy)
+            logging.info(f'loaded snapshot {snapshot}')
+            return res
+        except (ValueError, struct.error) as e:
+            logging.warning(f'ignoring invalid snapshot {snapshot}: {e}')
+
+    res = parse_smtlib_file_parallel(filename, jobs, lazy)
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        write_snapshot(snapshot, res)
+        logging.info(f'wrote snapshot {snapshot}')
+    except OSError as e:
+        logging.warning(f'unable to write snapshot {snapshot}: {e}')
+    return res
+
+
 def __write_smtlib(file: typing.TextIO, expr: Node):
     """Write the given smtlib expression in one line into the file object."""
     visit = [expr]
@@ -131,6 +437,13 @@ def __write_smtlib(file: typing.TextIO, expr: Node):
         if needs_space:
             file.write(' ')
 
+        if isinstance(ex, nodes.LazyNode):
+            source = ex.get_source()
+            if source is not None:
+                file.write(source)
+                needs_space = True
+                continue
+
         if ex.is_leaf():
             if ex.data == '':
                 continue
@@ -230,9 +543,16 @@ def write_smtlib_to_str(exprs: typing.List[Node]):
     return f.getvalue()
 
 
-def write_smtlib_for_checking(filename: str, exprs: typing.List[Node]):
+def write_smtlib_for_checking(file: typing.Union[str, typing.TextIO],
+                              exprs: typing.List[Node]):
     """Slightly faster writing without wrapping or pretty-printing during
-    checking."""
-    with open(filename, 'w') as file:
-        for expr in exprs:
-            __write_smtlib(file, expr)
+    checking.
+
+    ``file`` is either a filename or a file object.
+    """
+    if isinstance(file, str):
+        with open(file, 'w') as f:
+            write_smtlib_for_checking(f, exprs)
+        return
+    for expr in exprs:
+        __write_smtlib(file, expr)
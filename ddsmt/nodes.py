@@ -19,7 +19,9 @@
 # along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
 
 import collections
+import itertools
 import multiprocessing
+import re
 import struct
 
 
@@ -39,6 +41,30 @@ class Node:
             self.__ID_COUNTER.value += 1
             return self.__ID_COUNTER.value
 
+    @classmethod
+    def reserve_ids(self, count):
+        """Reserve ``count`` consecutive ids and return the first one."""
+        with self.__ID_COUNTER.get_lock():
+            self.__ID_COUNTER.value += count
+            return self.__ID_COUNTER.value - count + 1
+
+    @classmethod
+    def last_id(self):
+        """Return the id that was handed out most recently."""
+        with self.__ID_COUNTER.get_lock():
+            return self.__ID_COUNTER.value
+
+    @classmethod
+    def skip_ids(self, last_id):
+        """Make sure that all ids handed out from now on are larger than
+        ``last_id``.
+
+        This is necessary when nodes with ids from another process (for
+        example from a snapshot) are loaded.
+        """
+        with self.__ID_COUNTER.get_lock():
+            self.__ID_COUNTER.value = max(self.__ID_COUNTER.value, last_id)
+
     def __init__(self, *args, _id=None, _data=None, _hash=None):
         """
         Node("str") -> "str"
@@ -154,7 +180,11 @@ class Node:
         return self.hash
 
     def __getstate__(self):
-        """Callback method for custom (non-recursive) pickling."""
+        """Callback method for custom (non-recursive) pickling.
+
+        Hashes are not part of the state, they differ between processes
+        (see ``PYTHONHASHSEED``) and are recomputed by ``__setstate__()``.
+        """
         res = []
         visit = [self]
         while visit:
@@ -170,7 +200,7 @@ class Node:
                 res.append(data)
             else:
                 res.append(b'(')
-                res.append(struct.pack("=iq", expr.id, expr.hash))
+                res.append(struct.pack("=i", expr.id))
                 visit.append(b')')
                 visit.extend(reversed(expr.data))
 
@@ -184,15 +214,14 @@ class Node:
         while i < smax:
             cur = state[i]
             if cur == 40:  # b'('
-                exprs.append(list(struct.unpack('=iq', state[i + 1:i + 13])))
-                i += 13
+                exprs.append(list(struct.unpack('=i', state[i + 1:i + 5])))
+                i += 5
                 continue
             if cur == 41:  # b')'
                 i += 1
                 children = exprs.pop()
                 _id = children.pop(0)
-                _hash = children.pop(0)
-                node = Node(_data=tuple(children), _id=_id, _hash=_hash)
+                node = Node(_data=tuple(children), _id=_id)
                 exprs[-1].append(node)
                 continue
             if cur == 76:  # b'L'
@@ -223,6 +252,257 @@ class Node:
         return self.data[0]
 
 
+class LazyNode(Node):
+    """A non-leaf node whose children are only parsed on first access.
+
+    ``source`` holds the unparsed SMT-LIB text of the whole node (as
+    ``str`` or ``bytes``) and ``ident`` its already parsed identifier.
+    ``nchildren``, ``nexprs`` and ``nnodes`` are the number of children,
+    s-expressions and nodes within ``source``, as determined by the
+    parser. As long as the node is not expanded, ``is_leaf()``,
+    ``has_ident()``, ``get_ident()`` and ``len()`` work without parsing
+    ``source``. Accessing ``data`` or ``hash`` expands the node, after
+    which it behaves like a regular ``Node`` and ``source`` is ``None``.
+
+    The ids for the nodes within ``source`` are reserved upfront,
+    starting with ``first_id``. Thus copies of the same lazy node (for
+    example in another process) yield the same ids when expanded.
+    """
+    __slots__ = 'source', 'ident', 'nchildren', 'nexprs', 'nnodes', 'first_id'
+
+    def __init__(self,
+                 source,
+                 ident,
+                 nchildren,
+                 nexprs,
+                 nnodes,
+                 _id=None,
+                 _first_id=None):
+        self.id = _id if _id else self._Node__get_id()
+        self.source = source
+        self.ident = ident
+        self.nchildren = nchildren
+        self.nexprs = nexprs
+        self.nnodes = nnodes
+        if _first_id is None:
+            _first_id = self.reserve_ids(nnodes)
+        self.first_id = _first_id
+
+    def _parse(self, source):
+        """Parse ``source`` into a regular ``Node``."""
+        from . import nodeio
+        ids = itertools.count(self.first_id)
+        *_, node = nodeio.parse_smtlib(source, ids=ids)
+        return node
+
+    def __expand(self):
+        """Parse ``source`` and populate ``data`` and ``hash``.
+
+        ``source`` is only reset after ``data`` and ``hash`` have been
+        set. If two threads expand the same node concurrently, both parse
+        ``source`` and set the same ``data``.
+        """
+        source = self.source
+        if source is None:
+            return
+        node = self._parse(source)
+        data = (self.ident, ) + node.data[1:]
+        Node.data.__set__(self, data)
+        Node.hash.__set__(self, hash(data))
+        self.source = None
+
+    @property
+    def data(self):
+        if self.source is not None:
+            self.__expand()
+        return Node.data.__get__(self)
+
+    @data.setter
+    def data(self, value):
+        Node.data.__set__(self, value)
+
+    @property
+    def hash(self):
+        if self.source is not None:
+            self.__expand()
+        return Node.hash.__get__(self)
+
+    @hash.setter
+    def hash(self, value):
+        Node.hash.__set__(self, value)
+
+    def __len__(self):
+        if self.source is not None:
+            return self.nchildren
+        return len(self.data)
+
+    def __getstate__(self):
+        """Callback method for custom (non-recursive) pickling.
+
+        Unexpanded nodes are pickled with their ``source``, expanded
+        nodes like regular ``Node`` objects.
+        """
+        if self.source is None:
+            return super().__getstate__()
+        ident = self.ident.data.encode()
+        if isinstance(self.source, str):
+            source = self.source.encode()
+        else:
+            source = bytes(self.source)
+        return b''.join([
+            b'Z',
+            struct.pack("=iiiiiii", self.id, self.ident.id, len(ident),
+                        self.nchildren, self.nexprs, self.nnodes,
+                        self.first_id), ident,
+            source
+        ])
+
+    def __setstate__(self, state):
+        """Callback method for custom (non-recursive) unpickling."""
+        if state[:1] != b'Z':
+            self.source = None
+            super().__setstate__(state)
+            self.ident = self.data[0]
+            return
+        (self.id, ident_id, identlen, self.nchildren, self.nexprs,
+         self.nnodes, self.first_id) = struct.unpack('=iiiiiii', state[1:29])
+        self.ident = Node(state[29:29 + identlen].decode(), _id=ident_id)
+        self.source = state[29 + identlen:]
+
+    def expand(self):
+        """Expand the node, if it has not been expanded yet."""
+        self.__expand()
+
+    def may_contain_ids(self, ids):
+        """Return whether the node may contain a node whose id is in
+        ``ids``, i.e., whether any of ``ids`` is within the ids reserved
+        for ``source``."""
+        if self.source is None:
+            return True
+        end = self.first_id + self.nnodes
+        return any(
+            isinstance(i, int) and self.first_id <= i < end for i in ids)
+
+    def may_contain(self, leaves):
+        """Return whether the node may contain a leaf node whose data is in
+        ``leaves``.
+
+        Only scans ``source`` without expanding the node, and may thus
+        yield false positives (e.g., for tokens in string literals).
+        Returns true if the node was already expanded.
+        """
+        source = self.source
+        if source is None:
+            return True
+        tokens = '|'.join(map(re.escape, leaves))
+        pattern = rf'(?<![^\s()])(?:{tokens})(?![^\s()])'
+        if isinstance(source, str):
+            return re.search(pattern, source) is not None
+        return re.search(pattern.encode(), source) is not None
+
+    def get_source(self):
+        """Return ``source`` as a string, or ``None`` if the node has
+        already been expanded."""
+        source = self.source
+        if source is None or isinstance(source, str):
+            return source
+        return bytes(source).decode()
+
+    def is_leaf(self):
+        """Return false, a lazy node is never a leaf node."""
+        return False
+
+    def has_ident(self):
+        """Return true, a lazy node always has an identifier."""
+        return True
+
+    def get_ident(self):
+        """Get the identifier of this node without expanding it."""
+        return self.ident
+
+
+class StateNode(LazyNode):
+    """A ``LazyNode`` whose ``source`` is not SMT-LIB text, but the pickled
+    state of a ``Node`` as returned by ``Node.__getstate__()``.
+
+    ``source`` may be any bytes-like object, for example a
+    ``memoryview`` into a memory-mapped snapshot file. The ids of the
+    nodes are taken from the pickled state.
+    """
+    __slots__ = ()
+
+    def __init__(self, source, nchildren, nexprs, nnodes):
+        source = memoryview(source)
+        assert source[0] == 40  # b'('
+        assert source[5] == 76  # b'L'
+        _id = struct.unpack('=i', source[1:5])[0]
+        ident_id, identlen = struct.unpack('=ii', source[6:14])
+        ident = Node(bytes(source[14:14 + identlen]).decode(), _id=ident_id)
+        # all ids are part of the pickled state, no need to reserve any
+        super().__init__(source,
+                         ident,
+                         nchildren,
+                         nexprs,
+                         nnodes,
+                         _id=_id,
+                         _first_id=0)
+
+    def get_source(self):
+        """Return ``None``, ``source`` is not SMT-LIB text."""
+        return None
+
+    def may_contain_ids(self, ids):
+        """Return true, the ids are only known after unpickling
+        ``source``."""
+        return True
+
+    def may_contain(self, leaves):
+        """Return whether the node may contain a leaf node whose data is in
+        ``leaves``, by searching the pickled leaves in ``source``."""
+        source = self.source
+        if source is None:
+            return True
+        source = bytes(source)
+        for leaf in leaves:
+            data = leaf.encode()
+            if struct.pack('=i', len(data)) + data in source:
+                return True
+        return False
+
+    def _parse(self, source):
+        """Unpickle ``source`` into a regular ``Node``."""
+        node = Node.__new__(Node)
+        node.__setstate__(bytes(source))
+        return node
+
+    def __getstate__(self):
+        """Callback method for custom (non-recursive) pickling.
+
+        Unexpanded nodes are pickled with their ``source``, expanded
+        nodes like regular ``Node`` objects.
+        """
+        if self.source is None:
+            return super().__getstate__()
+        return b''.join([
+            b'S',
+            struct.pack("=iii", self.nchildren, self.nexprs, self.nnodes),
+            self.source
+        ])
+
+    def __setstate__(self, state):
+        """Callback method for custom (non-recursive) unpickling."""
+        if state[:1] != b'S':
+            super().__setstate__(state)
+            return
+        self.__init__(state[13:], *struct.unpack('=iii', state[1:13]))
+
+
+def is_lazy(node):
+    """Return true if ``node`` is a ``LazyNode`` that has not been expanded
+    yet."""
+    return isinstance(node, LazyNode) and node.source is not None
+
+
 def reduplicate(exprs):
     """Re-duplicates nodes with the same id using deepcopy."""
     ids = set()
@@ -238,6 +518,14 @@ def reduplicate(exprs):
             else:
                 args[-1].append(expr)
                 ids.add(expr.id)
+        elif is_lazy(expr):
+            if expr.id in ids:
+                args[-1].append(
+                    LazyNode(expr.source, Node(expr.ident.data),
+                             expr.nchildren, expr.nexprs, expr.nnodes))
+            else:
+                args[-1].append(expr)
+                ids.add(expr.id)
         else:
             if visited:
                 children = args.pop()
@@ -256,8 +544,12 @@ def reduplicate(exprs):
     return args[0]
 
 
-def dfs(exprs, max_depth=None):
-    """DFS traversal of s-expressions in exprs up to a maximum depth."""
+def dfs(exprs, max_depth=None, expand=True):
+    """DFS traversal of s-expressions in exprs up to a maximum depth.
+
+    If ``expand`` is false, unexpanded ``LazyNode`` objects are yielded
+    but not traversed.
+    """
     if isinstance(exprs, Node):
         yield exprs
     visit = [(1, x) for x in reversed(exprs)]
@@ -265,7 +557,7 @@ def dfs(exprs, max_depth=None):
         cur_depth, expr = visit.pop()
         if isinstance(expr, Node) and (not max_depth or cur_depth < max_depth):
             yield expr
-            if not expr.is_leaf():
+            if not expr.is_leaf() and (expand or not is_lazy(expr)):
                 visit.extend([(cur_depth + 1, x) for x in reversed(expr.data)])
         else:
             yield expr
@@ -296,6 +588,9 @@ def substitute(exprs, repl):  # noqa: C901
     """
     if len(repl) == 0:
         return exprs
+    # Unexpanded lazy nodes only need to be expanded if we replace by nodes,
+    # or by ids of nodes they contain
+    node_keys = any(not isinstance(k, int) for k in repl)
     if isinstance(exprs, Node):
         if exprs.is_leaf():
             if exprs.id and exprs.id in repl:
@@ -316,7 +611,7 @@ def substitute(exprs, repl):  # noqa: C901
         if expr.id and expr.id in repl:
             expr = repl.pop(expr.id)
             didrepl = True
-        if expr in repl:
+        if node_keys and expr in repl:
             expr = repl[expr]
             didrepl = True
         if didrepl:
@@ -332,7 +627,9 @@ def substitute(exprs, repl):  # noqa: C901
             else:
                 args[-1].append(node)
         else:
-            if not repl or expr.is_leaf():
+            if not repl or expr.is_leaf() or (
+                    not node_keys and is_lazy(expr)
+                    and not expr.may_contain_ids(repl)):
                 args[-1].append(expr)
             else:
                 visit.append((expr, True))
@@ -359,6 +656,9 @@ def count_nodes(node):
         visit = [x for x in node]
     while visit:
         expr = visit.pop()
+        if is_lazy(expr):
+            res += expr.nnodes
+            continue
         res += 1
         if not expr.is_leaf():
             visit.extend([x for x in expr.data])
@@ -376,7 +676,9 @@ def count_exprs(node):
         visit = [x for x in node]
     while visit:
         expr = visit.pop()
-        if not expr.is_leaf():
+        if is_lazy(expr):
+            res += expr.nexprs
+        elif not expr.is_leaf():
             res += 1
             visit.extend([x for x in expr.data if not x.is_leaf()])
     return res
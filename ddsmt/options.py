@@ -22,6 +22,7 @@ import argparse
 import os
 
 from . import argparsemod
+from . import context
 from . import version
 
 
@@ -119,6 +120,19 @@ def parse_options(mutators, cmdlineoptions=None):
     ap.add_argument('--parser-test',
                     action='store_true',
                     help='only test the parser')
+    ap.add_argument('--lazy-parsing',
+                    action='store_true',
+                    default=False,
+                    help='only parse top-level assertions when needed')
+    ap.add_argument('--parse-cache',
+                    metavar='dir',
+                    nargs='?',
+                    const=os.path.join(
+                        os.environ.get('XDG_CACHE_HOME',
+                                       os.path.expanduser('~/.cache')),
+                        'ddsmt'),
+                    help='cache parsed inputs as snapshots in the given '
+                    'directory')
     ap.add_argument('--pretty-print',
                     action='store_true',
                     default=False,
@@ -127,6 +141,18 @@ def parse_options(mutators, cmdlineoptions=None):
                     action='store_true',
                     default=False,
                     help='wrap lines in output file')
+    ap.add_argument('--write-interval',
+                    metavar='seconds',
+                    type=float,
+                    default=1,
+                    help='write the output file at most every given number '
+                    'of seconds')
+    ap.add_argument('--write-every',
+                    metavar='n',
+                    type=int,
+                    default=0,
+                    help='write the output file after n reductions, even if '
+                    'the write interval has not passed yet')
     ap.add_argument('--strategy',
                     choices=['ddmin', 'hierarchical', 'hybrid'],
                     default='hybrid',
@@ -146,11 +172,97 @@ def parse_options(mutators, cmdlineoptions=None):
                          type=int,
                          metavar='megabytes',
                          help='memout for individual checks')
+    apcheck.add_argument('--memout-factor',
+                         type=float,
+                         metavar='factor',
+                         help='set the memout to factor times the peak memory '
+                         'usage of the golden run (note that the memout '
+                         'limits the address space, so be generous)')
+    apcheck.add_argument('--launcher',
+                         choices=['auto', 'shim', 'prlimit'],
+                         default='auto',
+                         help='how to apply resource limits: shim applies '
+                         'them in a shell before executing the command, '
+                         'prlimit applies them right after the command was '
+                         'started; auto uses shim only if a memout is set')
+    apcheck.add_argument('--batch-size',
+                         type=int,
+                         metavar='K',
+                         default=1,
+                         help='check up to K candidates in a single run of '
+                         'an incremental command, using (push 1) and (pop 1) '
+                         'over their common prefix (only for ddmin, and only '
+                         'if the golden run prints a single check-sat answer)')
+    apcheck.add_argument('--oracle',
+                         action='store_true',
+                         help='keep the command running and pass it one '
+                         'filename per line via stdin (see ddsmt.oracle)')
+    apcheck.add_argument('--executor',
+                         choices=['process', 'thread'],
+                         default='process',
+                         help='run parallel checks in processes or in threads '
+                         'of the main process; threads avoid pickling '
+                         'candidates but share the interpreter lock')
+    apcheck.add_argument('--listen',
+                         metavar='host:port',
+                         help='let agents (see ddsmt agent) that connect to '
+                         'the given address run the checks, use --jobs to set '
+                         'the total number of parallel checks; the host '
+                         'defaults to 127.0.0.1, agents run their own command '
+                         'and need to know the secret of --secret-file')
+    apcheck.add_argument('--secret-file',
+                         metavar='file',
+                         help='file with the secret that agents need to know '
+                         'to connect, required by --listen')
+    apcheck.add_argument('--stdin',
+                         action='store_true',
+                         help='pass the input to the command via stdin '
+                         'instead of a filename')
+    apcheck.add_argument(
+        '--output-capture',
+        choices=['full', 'digest'],
+        default='full',
+        help='keep the full output of every check, or only its length and '
+        'digest (constant memory for solvers with a lot of output)')
+    apcheck.add_argument(
+        '--candidate-transport',
+        choices=['auto', 'shm', 'memfd', 'file'],
+        default='auto',
+        help='how to pass candidates to the solver: files in /dev/shm, '
+        'anonymous memory files (the solver reads /proc/self/fd/N, which has '
+        'no file extension), or files in the temporary directory')
     apcheck.add_argument('--timeout',
                          metavar='timeout',
                          type=float,
                          help='timeout for test runs in seconds '
                          '(default: 1.5 * golden runtime)')
+    apcheck.add_argument('--timeout-clock',
+                         choices=['wall', 'cpu'],
+                         default='wall',
+                         help='measure timeouts in wall clock or cpu time')
+    apcheck.add_argument('--calibration-runs',
+                         metavar='n',
+                         type=int,
+                         default=0,
+                         help='derive the automatic timeout from n rounds of '
+                         'golden runs with --jobs concurrent runs each')
+    apcheck._add_action(
+        ToggleAction('adaptive-timeout',
+                     dest='adaptive_timeout',
+                     help='shrink the automatic timeout based on the runtime '
+                     'of accepted candidates'))
+    apcheck.add_argument('--adaptive-timeout-floor',
+                         metavar='seconds',
+                         type=float,
+                         default=1,
+                         help='lower bound for the adaptive timeout')
+    apcheck.add_argument('--adaptive-timeout-factor',
+                         metavar='factor',
+                         type=float,
+                         default=2,
+                         help='safety factor for the adaptive timeout, applied '
+                         'to the largest recent runtime of accepted '
+                         'candidates')
     apcheck.add_argument(
         '--ignore-output',
         action='store_true',
@@ -169,6 +281,46 @@ def parse_options(mutators, cmdlineoptions=None):
                          metavar='cmd-cc',
                          dest='cmd_cc',
                          help='cross check command')
+    apcheck.add_argument(
+        '--cross-check-mode',
+        choices=['sequential', 'concurrent', 'adaptive'],
+        default='sequential',
+        help='run the cross check command after the command, at the same '
+        'time, or first if it is expected to reject candidates faster')
+    apcheck.add_argument(
+        '--differential',
+        action='store_true',
+        help='run the command and the cross check command concurrently and '
+        'keep candidates for which one answers sat and the other unsat, '
+        'instead of comparing each with its golden run')
+    apcheck.add_argument(
+        '--performance',
+        metavar='factor',
+        type=float,
+        help='keep candidates on which the command takes at least factor '
+        'times the cpu time of the cross check command, instead of comparing '
+        'each with its golden run')
+    apcheck.add_argument(
+        '--performance-error',
+        metavar='p',
+        type=float,
+        default=0.05,
+        help='error probability of the sequential test that decides '
+        '--performance')
+    apcheck.add_argument(
+        '--performance-runs',
+        metavar='n',
+        type=int,
+        default=5,
+        help='maximal number of measurements per candidate for --performance')
+    apcheck.add_argument(
+        '--performance-min-time',
+        metavar='seconds',
+        type=float,
+        default=1.0,
+        help='minimal cpu time of the cross check command for a measurement '
+        'of --performance, shorter runs are not interesting (at least 1 '
+        'second, the granularity of the cpu time limit)')
     apcheck.add_argument(
         '--timeout-cc',
         metavar='timeout',
@@ -215,18 +367,15 @@ def parse_options(mutators, cmdlineoptions=None):
     return res
 
 
-__PARSED_ARGS = None
-
-
 def args(cmdlineoptions=None):
-    '''Returns the commandline options.
+    '''Returns the commandline options of the current reduction context.
 
     Calls ``parse_options()`` if parsing has not yet happened. The
     ``cmdlineoptions`` is passed on to ``parse_options`` in this case.
     '''
-    global __PARSED_ARGS
-    if __PARSED_ARGS is None:
+    ctx = context.current()
+    if ctx.args is None:
         # make sure that options as a whole does not depend on other modules
         from . import mutators
-        __PARSED_ARGS = parse_options(mutators, cmdlineoptions)
-    return __PARSED_ARGS
+        ctx.args = parse_options(mutators, cmdlineoptions)
+    return ctx.args
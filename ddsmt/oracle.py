@@ -0,0 +1,78 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import io
+import json
+import os
+import sys
+import traceback
+
+
+def check_file(check, filename):
+    """Call ``check(filename)`` and return its exit code, and what it wrote
+    to stdout and stderr.
+
+    The exit code is the return value of ``check``, or the argument of
+    ``sys.exit()`` if ``check`` calls it. Both are interpreted like the
+    argument of ``sys.exit()``. Uncaught exceptions are printed to stderr
+    and result in exit code 1.
+    """
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            code = check(filename)
+        except SystemExit as e:
+            code = e.code
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        if code is None:
+            code = 0
+        elif not isinstance(code, int):
+            print(code, file=sys.stderr)
+            code = 1
+    return code, out.getvalue(), err.getvalue()
+
+
+def run(check):
+    """Run the function ``check`` as command.
+
+    If the script was called with a filename, ``check`` is called once
+    for this file and the script exits accordingly. Otherwise, this
+    implements the persistent oracle protocol and calls ``check`` for
+    every filename read from stdin.
+    """
+    if len(sys.argv) > 1:
+        code, out, err = check_file(check, sys.argv[1])
+        sys.stdout.write(out)
+        sys.stderr.write(err)
+        sys.exit(code)
+
+    # keep stdout for the replies, and make sure that child processes that
+    # inherit stdout do not write into the replies
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    for line in sys.stdin:
+        code, out, err = check_file(check, line.rstrip('\n'))
+        replies.write(json.dumps({'exit': code, 'out': out, 'err': err}))
+        replies.write('\n')
+        replies.flush()
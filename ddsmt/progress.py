@@ -22,7 +22,24 @@ import logging
 import progressbar
 import sys
 
-__BAR = None
+from . import context
+
+
+class __State:
+    """State of the progress bar, stored per ``ReductionContext``."""
+    def __init__(self):
+        self.bar = None
+
+    def __reduce__(self):
+        """Pickle without the progress bar, it is only shown by the process
+        that owns the reduction."""
+        return (type(self), ())
+
+
+def __state():
+    """Return the state of the progress bar in the current reduction
+    context."""
+    return context.current().state('progress', __State)
 
 
 def start(max):
@@ -31,15 +48,15 @@ def start(max):
     Only initialize if the current log level is at least
     ``logging.INFO``.
     """
-    global __BAR
     if not sys.stdout.isatty():
         return
     if logging.getLogger().level > logging.INFO:
         return
     widgets = [progressbar.Bar(), ' ', progressbar.Counter(), ' / ', str(max)]
-    __BAR = progressbar.ProgressBar(maxval=max, widgets=widgets)
-    __BAR.start()
-    __BAR.update_interval = 1
+    bar = progressbar.ProgressBar(maxval=max, widgets=widgets)
+    bar.start()
+    bar.update_interval = 1
+    __state().bar = bar
 
 
 def update(newval=None):
@@ -48,12 +65,12 @@ def update(newval=None):
     The value is incremented by one, or set to newval if newval is not
     ``None``.
     """
-    global __BAR
-    if __BAR:
+    bar = __state().bar
+    if bar:
         if newval is not None:
-            __BAR.update(min(newval, __BAR.maxval))
+            bar.update(min(newval, bar.maxval))
         else:
-            __BAR.update(__BAR.currval + 1)
+            bar.update(bar.currval + 1)
 
 
 def finish():
@@ -61,7 +78,7 @@ def finish():
 
     Delete the object and write a newline.
     """
-    global __BAR
-    if __BAR:
-        __BAR = None
+    state = __state()
+    if state.bar:
+        state.bar = None
         sys.stdout.write('\n')
@@ -0,0 +1,155 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import multiprocessing
+import os
+import signal
+import time
+
+
+class FairScheduler:
+    """Shares a fixed number of slots (usually cores) among several jobs.
+
+    Every command that is executed for a job occupies a slot while it
+    runs. A job gets up to its fair share of the slots, i.e., the number
+    of slots divided by the number of jobs, and more only if no other job
+    below its fair share is waiting for a slot. The state lives in shared
+    memory, such that the worker processes of all jobs use the same
+    scheduler, as long as they are forked after the scheduler was created.
+    Slots of processes that died (e.g., due to ``Pool.terminate()``) are
+    reclaimed. Processes that are not forked need to be started via the
+    multiprocessing context ``mp``.
+    """
+
+    # How often (in seconds) a waiting command checks for a free slot.
+    __POLL_INTERVAL = 0.01
+    # How long (in seconds) a job counts as waiting after it last found no
+    # free slot.
+    __WAIT_WINDOW = 0.1
+
+    def __init__(self, slots, jobs, mp=multiprocessing):
+        self.__slots = slots
+        self.__jobs = jobs
+        self.__lock = mp.Lock()
+        # process id (0 if free) and job of every slot
+        self.__pids = mp.RawArray('i', slots)
+        self.__owners = mp.RawArray('i', slots)
+        # whether a job is registered and when it last waited for a slot
+        self.__active = mp.RawArray('b', jobs)
+        self.__waiting = mp.RawArray('d', jobs)
+
+    @contextlib.contextmanager
+    def __locked(self):
+        """Hold the lock and defer ``SIGTERM`` until it is released, such
+        that a terminated worker process never leaves it locked."""
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])
+        try:
+            with self.__lock:
+                yield
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+    def register(self):
+        """Register a new job and return its ``Share``."""
+        with self.__locked():
+            for job in range(self.__jobs):
+                if not self.__active[job]:
+                    self.__active[job] = 1
+                    self.__waiting[job] = 0
+                    return Share(self, job)
+        raise RuntimeError(f'more than {self.__jobs} concurrent jobs')
+
+    def unregister(self, share):
+        """Unregister the job of ``share`` and release all its slots."""
+        with self.__locked():
+            self.__active[share.job] = 0
+            for slot in range(self.__slots):
+                if self.__owners[slot] == share.job:
+                    self.__pids[slot] = 0
+
+    def __is_alive(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def __try_acquire(self, job):
+        """Occupy a free slot for ``job`` and return it, or return ``None``
+        if ``job`` has to wait."""
+        now = time.monotonic()
+        running = [0] * self.__jobs
+        free = None
+        for slot in range(self.__slots):
+            pid = self.__pids[slot]
+            if pid and not self.__is_alive(pid):
+                self.__pids[slot] = pid = 0
+            if pid:
+                running[self.__owners[slot]] += 1
+            elif free is None:
+                free = slot
+        share = -(-self.__slots // max(1, sum(self.__active)))
+        if free is not None and running[job] >= share:
+            for other in range(self.__jobs):
+                if other != job and self.__active[other] \
+                        and running[other] < share \
+                        and now - self.__waiting[other] < self.__WAIT_WINDOW:
+                    free = None
+                    break
+        if free is None:
+            self.__waiting[job] = now
+            return None
+        self.__pids[free] = os.getpid()
+        self.__owners[free] = job
+        return free
+
+    def acquire(self, job):
+        """Wait until ``job`` may occupy a slot and return the slot."""
+        while True:
+            with self.__locked():
+                slot = self.__try_acquire(job)
+            if slot is not None:
+                return slot
+            time.sleep(self.__POLL_INTERVAL)
+
+    def release(self, slot):
+        """Release ``slot``."""
+        with self.__locked():
+            if self.__pids[slot] == os.getpid():
+                self.__pids[slot] = 0
+
+
+class Share:
+    """The share of a single job of a ``FairScheduler``."""
+    def __init__(self, scheduler, job):
+        self.scheduler = scheduler
+        self.job = job
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Occupy a slot for the duration of the ``with`` block."""
+        slot = self.scheduler.acquire(self.job)
+        try:
+            yield
+        finally:
+            self.scheduler.release(slot)
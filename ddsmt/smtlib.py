@@ -22,39 +22,50 @@ import logging
 import re
 import string
 
+from . import context
 from . import nodes
 from .nodes import Node
 
-# Stores all declared or defined (first-order) constants with their sorts
-__constants = {}
-# Stores all defined functions with their return sorts
-__defined_functions = {}
-# Stores the ids of all nodes that are symbols within their definitions
-# i.e. the id of x within ``(declare-const x Int)``
-__definition_node_ids = set()
-# Stores the sorts for all declared or defined symbols
-__sort_lookup = {}
-# Stores indices that should not be replaced by constants
-__indices = set()
-# Caches calls to get_sort
-__get_sort_cache = {}
-# Stores constants for datatype sorts
-__datatypes_constants = {}
-# Stores the sorts of datatype constructors
-__datatypes_constructors = {}
+
+class __Information:
+    """Information gathered via ``collect_information``, stored per
+    ``ReductionContext``."""
+    def __init__(self):
+        # Stores all declared or defined (first-order) constants with their
+        # sorts
+        self.constants = {}
+        # Stores all defined functions with their return sorts
+        self.defined_functions = {}
+        # Stores the ids of all nodes that are symbols within their
+        # definitions
+        # i.e. the id of x within ``(declare-const x Int)``
+        self.definition_node_ids = set()
+        # Stores the sorts for all declared or defined symbols
+        self.sort_lookup = {}
+        # Stores indices that should not be replaced by constants
+        self.indices = set()
+        # Caches calls to get_sort
+        self.get_sort_cache = {}
+        # Stores constants for datatype sorts
+        self.datatypes_constants = {}
+        # Stores the sorts of datatype constructors
+        self.datatypes_constructors = {}
+
+
+def __info():
+    """Return the information of the current reduction context."""
+    return context.current().state('smtlib', __Information)
+
+
+# Leaf nodes that indicate term level information (see collect_information).
+__TERM_INFO_LEAVES = ('_', 'let', 'exists', 'forall')
 
 
 def collect_information(exprs):  # noqa: C901
     """Initialize global lookups for first-order constants, defined functions
     and sorts of all these symbols."""
-    global __constants
-    global __defined_functions
-    global __definition_node_ids
-    global __sort_lookup
-    global __indices
-    global __datatypes_constants
-    global __datatypes_constructors
     reset_information()
+    info = __info()
 
     for cmd in exprs:
         if not cmd.has_ident():
@@ -68,9 +79,9 @@ def collect_information(exprs):  # noqa: C901
             if not cmd[1].is_leaf():
                 logging.trace(f'Ignored command: "{cmd[1]}" is not a leaf')
                 continue
-            __constants[cmd[1].data] = cmd[2]
-            __definition_node_ids.add(cmd[1].id)
-            __sort_lookup[cmd[1].data] = cmd[2]
+            info.constants[cmd[1].data] = cmd[2]
+            info.definition_node_ids.add(cmd[1].id)
+            info.sort_lookup[cmd[1].data] = cmd[2]
         if name == 'declare-fun':
             if not len(cmd) == 4:
                 logging.trace(
@@ -83,9 +94,9 @@ def collect_information(exprs):  # noqa: C901
                 logging.trace(f'Ignored command: "{cmd[2]}" is a leaf')
                 continue
             if cmd[2] == tuple():
-                __constants[cmd[1].data] = cmd[3]
-            __definition_node_ids.add(cmd[1].id)
-            __sort_lookup[cmd[1].data] = cmd[3]
+                info.constants[cmd[1].data] = cmd[3]
+            info.definition_node_ids.add(cmd[1].id)
+            info.sort_lookup[cmd[1].data] = cmd[3]
         if name == 'define-fun':
             if not len(cmd) == 5:
                 logging.trace(
@@ -98,14 +109,14 @@ def collect_information(exprs):  # noqa: C901
                 logging.trace(f'Ignored command: "{cmd[2]}" is a leaf')
                 continue
             if cmd[2] == tuple():
-                __constants[cmd[1]] = cmd[3]
-            __defined_functions[cmd[1]] = (len(
+                info.constants[cmd[1]] = cmd[3]
+            info.defined_functions[cmd[1]] = (len(
                 cmd[2]), lambda args, cmd=cmd: nodes.substitute(
                     cmd[4], {cmd[2][i][0]: args[i]
                              for i in range(len(args))}))
-            __definition_node_ids.add(cmd[1].id)
-            __definition_node_ids.add(cmd[4].id)
-            __sort_lookup[cmd[1].data] = cmd[3]
+            info.definition_node_ids.add(cmd[1].id)
+            info.definition_node_ids.add(cmd[4].id)
+            info.sort_lookup[cmd[1].data] = cmd[3]
         if name == 'declare-datatype':
             if not len(cmd) == 3:
                 logging.trace(
@@ -116,10 +127,10 @@ def collect_information(exprs):  # noqa: C901
                 continue
             sort = cmd[1]
             for constr in cmd[2]:
-                __datatypes_constructors[constr[0]] = sort
+                info.datatypes_constructors[constr[0]] = sort
                 if len(constr) == 1:
-                    __datatypes_constants.setdefault(sort, [])
-                    __datatypes_constants[sort].append(constr[0])
+                    info.datatypes_constants.setdefault(sort, [])
+                    info.datatypes_constants[sort].append(constr[0])
 
         if name == 'declare-datatypes':
             if not len(cmd) == 3:
@@ -142,18 +153,22 @@ def collect_information(exprs):  # noqa: C901
                         f'Ignore "{sorts[id]}" as it lacks a constructor')
                     continue
                 for constr in cmd[2][id]:
-                    __datatypes_constructors[constr[0]] = sorts[id]
+                    info.datatypes_constructors[constr[0]] = sorts[id]
                     if len(constr) == 1:
-                        __datatypes_constants.setdefault(sorts[id], [])
-                        __datatypes_constants[sorts[id]].append(constr[0])
-
-    # Collect additional term level information.
-    for node in nodes.dfs(exprs):
+                        info.datatypes_constants.setdefault(sorts[id], [])
+                        info.datatypes_constants[sorts[id]].append(constr[0])
+
+    # Collect additional term level information. Nodes that have not been
+    # parsed yet are only expanded if they may contain indexed terms or
+    # binders, all other nodes do not contribute any information.
+    for node in nodes.dfs(exprs, expand=False):
+        if nodes.is_lazy(node) and node.may_contain(__TERM_INFO_LEAVES):
+            node.expand()
         # Mark indices of indexed terms.
         if not node.is_leaf() and len(node) > 2 and node[0] == '_':
             for num in node[2:]:
                 if num.data.isdigit():
-                    __indices.add(num.id)
+                    info.indices.add(num.id)
         # Determine sort of symbols introduced by let.
         if is_operator_app(node, 'let'):
             for var in node[1]:
@@ -161,8 +176,8 @@ def collect_information(exprs):  # noqa: C901
                     continue
                 sym, term = var
                 if sym.is_leaf():
-                    __sort_lookup[sym.data] = get_sort(term)
-                    __definition_node_ids.add(sym.id)
+                    info.sort_lookup[sym.data] = get_sort(term)
+                    info.definition_node_ids.add(sym.id)
         # Determine sort of symbols introduced by quantifiers
         if is_operator_app(node, 'exists') or is_operator_app(node, 'forall'):
             for var in node[1]:
@@ -170,8 +185,8 @@ def collect_information(exprs):  # noqa: C901
                     continue
                 sym, term = var
                 if sym.is_leaf():
-                    __sort_lookup[sym.data] = term
-                    __definition_node_ids.add(sym.id)
+                    info.sort_lookup[sym.data] = term
+                    info.definition_node_ids.add(sym.id)
 
 
 def reset_information():
@@ -179,22 +194,7 @@ def reset_information():
 
     This is mainly to be used in the unit tests.
     """
-    global __constants
-    global __defined_functions
-    global __definition_node_ids
-    global __sort_lookup
-    global __indices
-    global __get_sort_cache
-    global __datatypes_constants
-    global __datatypes_constructors
-    __constants = {}
-    __defined_functions = {}
-    __definition_node_ids = set()
-    __sort_lookup = {}
-    __indices = set()
-    __get_sort_cache = {}
-    __datatypes_constants = {}
-    __datatypes_constructors = {}
+    context.current().state('smtlib', __Information).__init__()
 
 
 # General utilities
@@ -206,7 +206,8 @@ def get_variables_with_sort(var_sort):
     Requires that global information has been populated via
     ``collect_information``.
     """
-    return [v for v in __sort_lookup if __sort_lookup[v] == var_sort]
+    sort_lookup = __info().sort_lookup
+    return [v for v in sort_lookup if sort_lookup[v] == var_sort]
 
 
 def introduce_variables(exprs, vars):
@@ -232,8 +233,7 @@ def introduce_variables(exprs, vars):
 
 
 def is_index(node):
-    global __indices
-    return node.id in __indices
+    return node.id in __info().indices
 
 
 def is_leaf(node):
@@ -247,7 +247,7 @@ def is_var(node):
     Requires that global information has been populated via
     ``collect_information``.
     """
-    return node.is_leaf() and node in __constants
+    return node.is_leaf() and node in __info().constants
 
 
 def is_piped_symbol(node):
@@ -382,8 +382,9 @@ def get_default_constants(sort):
             Node('as', 'emptyset', sort),
             *[Node('singleton', c) for c in get_default_constants(sort[1])]
         ]
-    if sort in __datatypes_constants:
-        return __datatypes_constants[sort]
+    datatypes_constants = __info().datatypes_constants
+    if sort in datatypes_constants:
+        return datatypes_constants[sort]
     return []
 
 
@@ -393,8 +394,8 @@ def _get_sort_aux(node):  # noqa: C901
     Return ``None`` if it can not be inferred. Requires that global
     information has been populated via ``collect_information``.
     """
-    if node.is_leaf() and node.data in __sort_lookup:
-        return __sort_lookup[node]
+    if node.is_leaf() and node.data in __info().sort_lookup:
+        return __info().sort_lookup[node]
     if is_bool_const(node):
         return Node('Bool')
     if is_bv_const(node):
@@ -518,8 +519,8 @@ def _get_sort_aux(node):  # noqa: C901
             return None
         if ident == 'store':
             return get_sort(node[1])
-        if ident in __datatypes_constructors:
-            return __datatypes_constructors[ident]
+        if ident in __info().datatypes_constructors:
+            return __info().datatypes_constructors[ident]
 
     # indexed operators
     if is_indexed_operator_app(node, 'divisible'):
@@ -538,15 +539,15 @@ def get_sort(node):
     Return ``None`` if it can not be inferred. Requires that global
     information has been populated via ``collect_information``.
     """
-    global __get_sort_cache
+    info = __info()
 
-    if node.id in __get_sort_cache:
-        return __get_sort_cache[node.id]
-    if node in __get_sort_cache:
-        return __get_sort_cache[node]
+    if node.id in info.get_sort_cache:
+        return info.get_sort_cache[node.id]
+    if node in info.get_sort_cache:
+        return info.get_sort_cache[node]
     sort = _get_sort_aux(node)
-    __get_sort_cache[node.id] = sort
-    __get_sort_cache[node] = sort
+    info.get_sort_cache[node.id] = sort
+    info.get_sort_cache[node] = sort
     return sort
 
 
@@ -651,6 +652,7 @@ def get_bv_width(node):  # noqa: C901
     Asserts that ``node`` is a bit-vector node. Requires that global
     information has been populated via ``collect_information``.
     """
+    info = __info()
     if is_bv_const(node):
         if node.is_leaf():
             data = node.data
@@ -659,8 +661,8 @@ def get_bv_width(node):  # noqa: C901
             assert data.startswith('#x')
             return len(data[2:]) * 4
         return int(node[2].data)
-    if node in __sort_lookup:
-        bvsort = __sort_lookup[node]
+    if node in info.sort_lookup:
+        bvsort = info.sort_lookup[node]
         if is_bv_sort(bvsort):
             return int(bvsort[2].data)
         return -1
@@ -755,7 +757,7 @@ def is_definition_node(node):
     This would be the case for the node ``x`` within ``(declare-const x
     Int)``, but not for any other occurrence of ``x``.
     """
-    return node.id in __definition_node_ids
+    return node.id in __info().definition_node_ids
 
 
 def is_defined_fun(node):
@@ -765,8 +767,8 @@ def is_defined_fun(node):
     ``collect_information``.
     """
     if isinstance(node, str) or node.is_leaf():
-        return node in __defined_functions
-    return node.has_ident() and node.get_ident() in __defined_functions
+        return node in __info().defined_functions
+    return node.has_ident() and node.get_ident() in __info().defined_functions
 
 
 def get_defined_fun(node):
@@ -778,9 +780,9 @@ def get_defined_fun(node):
     """
     assert is_defined_fun(node)
     if node.is_leaf():
-        _, func = __defined_functions[node.data]
+        _, func = __info().defined_functions[node.data]
         return func([])
-    arity, func = __defined_functions[node.get_ident()]
+    arity, func = __info().defined_functions[node.get_ident()]
     if arity == len(node[1:]):
         return func(node[1:])
     return node
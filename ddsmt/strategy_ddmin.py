@@ -19,26 +19,33 @@
 # along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
 
 import collections
+import itertools
 import multiprocessing
+import multiprocessing.pool
 import logging
 import pickle
 import sys
+import threading
 import time
 import traceback
 
 from . import checker
+from . import context
 from . import mutators
-from . import nodeio
 from . import nodes
 from . import options
 from . import debug_utils
 from . import smtlib
-from .mutator_utils import Simplification, apply_simp
+from . import writer
+from .mutator_utils import Simplification, apply_simp, compose_simps
 
 Task = collections.namedtuple('Task', ['id', 'exprs', 'simplifications'])
 
+# simp: the successful ``Simplification``, used to compose the successes of
+# concurrent tasks
 Result = collections.namedtuple(
-    'Result', ['task_id', 'success', 'reduced', 'exprs', 'tests'])
+    'Result',
+    ['task_id', 'success', 'reduced', 'exprs', 'simp', 'tests', 'usage'])
 
 
 def _partition(exprs, gran):
@@ -63,7 +70,8 @@ class TaskGenerator:
         self.subsets = _partition(filtered, self.gran) if self.gran else []
 
         njobs = options.args().jobs
-        if njobs > 1 and len(self.subsets) > 2 * njobs:
+        self.parallel = njobs > 1 and len(self.subsets) > 2 * njobs
+        if self.parallel and not checker.uses_threads():
             self.pickled_exprs = pickle.dumps(exprs)
         else:
             self.pickled_exprs = None
@@ -190,17 +198,51 @@ def ddmin_passes():
 
 
 def _simp(exprs, simplifications):
-    """Apply ``simplifications`` to ``exprs`` and return simplified
-    formulas."""
+    """Apply ``simplifications`` to ``exprs`` and yield each simplification
+    together with the simplified formulas.
+
+    Simplifications that do not change ``exprs`` (e.g., because they were
+    already applied) are skipped.
+    """
     for simp in simplifications:
         mexprs = apply_simp(exprs, simp)
-        if mexprs is not None:
-            yield mexprs
+        if mexprs is not None and mexprs != exprs:
+            yield simp, mexprs
 
 
 __cached_exprs = None
 __cached_exprs_hash = None
-__abort_flag = None
+# The flag that tells the workers in this process or thread to skip their
+# tasks, see ``_init_worker()``.
+__worker = threading.local()
+
+
+def _load_task(task):
+    """Return the expressions and simplifications of ``task``, unpickling
+    them if necessary."""
+    global __cached_exprs
+    global __cached_exprs_hash
+
+    if isinstance(task.exprs, bytes):
+        hashval = hash(task.exprs)
+        if __cached_exprs_hash != hashval:
+            __cached_exprs = pickle.loads(task.exprs)
+            __cached_exprs_hash = hashval
+        return __cached_exprs, pickle.loads(task.simplifications)
+    return task.exprs, task.simplifications
+
+
+def _init_worker(ctx, abort_flag):
+    """Initialize a worker process with the reduction context ``ctx`` and
+    the flag that tells workers to skip their tasks."""
+    context.activate(ctx)
+    __worker.abort_flag = abort_flag
+
+
+def __aborted():
+    """Check whether the workers shall skip their tasks."""
+    abort_flag = getattr(__worker, 'abort_flag', None)
+    return abort_flag is not None and abort_flag.is_set()
 
 
 def _worker(task):
@@ -210,42 +252,81 @@ def _worker(task):
     ``task.simplifications`` are pickled and need to be unpickled before
     performing the substitutions and checks.
     """
-    global __cached_exprs
-    global __cached_exprs_hash
-    global __abort_flag
-
     with debug_utils.Profiler():
         try:
-            if __abort_flag and __abort_flag.is_set():
+            if __aborted():
                 logging.debug(f'Worker: Abort task {task.id}')
-                return Result(task.id, False, 0, [], 0)
-
-            if isinstance(task.exprs, bytes):
-                hashval = hash(task.exprs)
-                if __cached_exprs_hash != hashval:
-                    __cached_exprs = pickle.loads(task.exprs)
-                    __cached_exprs_hash = hashval
-
-                exprs = __cached_exprs
-                substs = pickle.loads(task.simplifications)
-            else:
-                exprs = task.exprs
-                substs = task.simplifications
+                return Result(task.id, False, 0, [], None, 0,
+                              checker.ResourceUsage(0.0, 0.0, 0))
 
+            exprs, substs = _load_task(task)
             ntests = 0
-            for mexprs in _simp(exprs, substs):
+            checker.take_usage()
+            for simp, mexprs in _simp(exprs, substs):
                 ntests += 1
                 if checker.check_exprs(mexprs):
                     nreduced = (nodes.count_exprs(exprs)
                                 - nodes.count_exprs(mexprs))
-                    return Result(task.id, True, nreduced, mexprs, ntests)
-            return Result(task.id, False, 0, [], ntests)
+                    return Result(task.id, True, nreduced, mexprs, simp,
+                                  ntests, checker.take_usage())
+            return Result(task.id, False, 0, [], None, ntests,
+                          checker.take_usage())
+        except Exception as e:
+            logging.info(f'{type(e)} in ddmin worker: {e}')
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            traceback.print_tb(exc_traceback, limit=10, file=sys.stderr)
+
+
+def _batch_worker(tasks):
+    """Process the list ``tasks`` like ``_worker``, but check up to
+    ``--batch-size`` candidates at once via ``checker.check_exprs_batch``.
+
+    Candidates that may be successful are checked individually. Returns
+    the result for the first successful candidate, or an unsuccessful
+    result for the last task.
+    """
+    with debug_utils.Profiler():
+        try:
+            ntests = 0
+            checker.take_usage()
+            candidates = ((task.id, exprs, simp, mexprs) for task in tasks
+                          for exprs, substs in [_load_task(task)]
+                          for simp, mexprs in _simp(exprs, substs))
+            while not __aborted():
+                batch = list(
+                    itertools.islice(candidates, options.args().batch_size))
+                if not batch:
+                    break
+                verdicts = checker.check_exprs_batch([b[3] for b in batch])
+                for (task_id, exprs, simp,
+                     mexprs), verdict in zip(batch, verdicts):
+                    ntests += 1
+                    if verdict is not False and checker.check_exprs(mexprs):
+                        nreduced = (nodes.count_exprs(exprs)
+                                    - nodes.count_exprs(mexprs))
+                        return Result(task_id, True, nreduced, mexprs, simp,
+                                      ntests, checker.take_usage())
+            return Result(tasks[-1].id, False, 0, [], None, ntests,
+                          checker.take_usage())
         except Exception as e:
             logging.info(f'{type(e)} in ddmin worker: {e}')
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_tb(exc_traceback, limit=10, file=sys.stderr)
 
 
+def _get_tasks(taskgen):
+    """Return the worker function and the tasks generated by ``taskgen``.
+
+    If ``--batch-size`` is supported, tasks are grouped into lists of
+    ``--batch-size`` tasks that are processed by ``_batch_worker``.
+    """
+    if not checker.supports_batches():
+        return _worker, taskgen
+    size = options.args().batch_size
+    return _batch_worker, iter(lambda: list(itertools.islice(taskgen, size)),
+                               [])
+
+
 __last_msg = ""
 
 
@@ -269,71 +350,108 @@ def _print_progress(msg, update=True):
         __last_msg = msg
 
 
-def _check_seq(taskgen, nexprs, stats):
-    """Sequentially process tasks generated by ``taskgen``."""
+def _add_usage(stats, usage):
+    """Add the resource usage of a result to ``stats``."""
+    stats['cpu'] += usage.user + usage.sys
+    stats['maxrss'] = max(stats['maxrss'], usage.maxrss)
 
-    outfile = options.args().outfile
 
-    for task in taskgen:
-        result = _worker(task)
+def _check_seq(taskgen, nexprs, stats):
+    """Sequentially process tasks generated by ``taskgen``."""
+    worker, tasks = _get_tasks(taskgen)
+    for task in tasks:
+        result = worker(task)
         stats['tests'] += result.tests
+        _add_usage(stats, result.usage)
 
         if result.success:
             stats['tests_success'] += 1
             stats['reduced'] += result.reduced
             taskgen.update(result.exprs)
-            nodeio.write_smtlib_to_file(outfile, taskgen.exprs)
+            writer.update(taskgen.exprs)
             smtlib.collect_information(taskgen.exprs)
+            # continue right after the successful task, as the remaining
+            # tasks of a batch were not checked
+            taskgen.reset(result.task_id + 1)
 
         _print_progress(
             f"{taskgen.mutator}: "
             f"nodes: {taskgen.num_filtered}, "
             f"gran: {taskgen.gran}, "
-            f"subset {task.id} of {len(taskgen.subsets)}, "
+            f"subset {result.task_id} of {len(taskgen.subsets)}, "
             f"exprs: {nexprs - stats['reduced']}/{nexprs}",
             options.args().verbosity == 1)
 
     return taskgen.exprs
 
 
+def _compose(exprs, successes, stats):
+    """Combine the ``successes`` of concurrent tasks on ``exprs``.
+
+    The simplifications of successes that substitute disjoint parts of
+    ``exprs`` are composed and verified with a single check. If nothing
+    can be composed or the check fails, the success with the largest
+    reduction is used. Returns the result to apply and the number of
+    successes it combines.
+    """
+    successes = sorted(successes, key=lambda r: r.reduced, reverse=True)
+    if len(successes) > 1:
+        indices, simp = compose_simps(exprs, [r.simp for r in successes])
+        if len(indices) > 1:
+            mexprs = apply_simp(exprs, simp)
+            checker.take_usage()
+            success = checker.check_exprs(mexprs)
+            stats['tests'] += 1
+            _add_usage(stats, checker.take_usage())
+            logging.debug(f'Composed {len(indices)} successful tests: '
+                          f'{"ok" if success else "failed"}')
+            if success:
+                nreduced = nodes.count_exprs(exprs) - nodes.count_exprs(mexprs)
+                task_id = min(successes[i].task_id for i in indices)
+                return Result(task_id, True, nreduced, mexprs, simp, 1,
+                              None), len(indices)
+    return successes[0], 1
+
+
 def _check_par(taskgen, nexprs, stats):
-    """Process tasks generated by ``taskgen`` with multiple processes.
+    """Process tasks generated by ``taskgen`` with multiple processes (or
+    threads, see ``--executor``).
 
     As soon as one process performs a successful check with task N the
     main process stops the task generator and notifies all worker
-    processes to stop ASAP. ``taskgen.exprs`` will be updated with the
-    reduced expressions and ``taskgen`` is reset to start with task N+1.
+    processes to stop ASAP. Tasks that were already running may succeed
+    as well, these successes are combined via ``_compose()``.
+    ``taskgen.exprs`` will be updated with the reduced expressions and
+    ``taskgen`` is reset to start with task N+1, where N is the first
+    task that was applied.
     """
-    global __abort_flag
-
-    outfile = options.args().outfile
-
-    __abort_flag = multiprocessing.Manager().Event()
+    if checker.uses_threads():
+        abort_flag = threading.Event()
+        pool_type = multiprocessing.pool.ThreadPool
+    else:
+        abort_flag = multiprocessing.Manager().Event()
+        pool_type = multiprocessing.Pool
 
     start_index = 0
-    with multiprocessing.Pool(options.args().jobs) as pool:
+    with pool_type(options.args().jobs, _init_worker,
+                   (context.current(), abort_flag)) as pool:
         while start_index >= 0:
             start_index = -1
-            skip = False
-            for result in pool.imap_unordered(_worker, taskgen):
+            successes = []
+            worker, tasks = _get_tasks(taskgen)
+            for result in pool.imap_unordered(worker, tasks):
                 stats['tests'] += result.tests
-
-                if result.success and not skip:
-                    __abort_flag.set()
-                    logging.debug('Main: Set abort flag')
-                    taskgen.stop()
-                    taskgen.update(result.exprs)
-                    nodeio.write_smtlib_to_file(outfile, taskgen.exprs)
-                    stats['tests_success'] += 1
-                    stats['reduced'] += result.reduced
-                    start_index = result.task_id + 1
-                    skip = True
+                _add_usage(stats, result.usage)
+
+                if result.success:
+                    if not successes:
+                        abort_flag.set()
+                        logging.debug('Main: Set abort flag')
+                        taskgen.stop()
+                    successes.append(result)
                     logging.debug(
                         f'Successful test with subset {result.task_id}: '
                         f'{result.reduced}')
-                elif result.success and skip:
-                    logging.debug(f'Skip test with subset {result.task_id}: '
-                                  f'{result.reduced}')
 
                 _print_progress(
                     f"{taskgen.mutator}: "
@@ -343,8 +461,16 @@ def _check_par(taskgen, nexprs, stats):
                     f"exprs: {nexprs - stats['reduced']}/{nexprs}",
                     options.args().verbosity == 1)
 
-            if __abort_flag.is_set():
-                __abort_flag.clear()
+            if successes:
+                result, nsuccesses = _compose(taskgen.exprs, successes, stats)
+                taskgen.update(result.exprs)
+                writer.update(taskgen.exprs)
+                stats['tests_success'] += nsuccesses
+                stats['reduced'] += result.reduced
+                start_index = result.task_id + 1
+
+            if abort_flag.is_set():
+                abort_flag.clear()
                 smtlib.collect_information(taskgen.exprs)
                 taskgen.reset(start_index)
                 taskgen.start()
@@ -362,11 +488,17 @@ def _apply_mutator(mutator, exprs, max_depth=None):
 
     start_time = time.time()
     nexprs = nodes.count_exprs(exprs)
-    stats = {'tests': 0, 'tests_success': 0, 'reduced': 0}
+    stats = {
+        'tests': 0,
+        'tests_success': 0,
+        'reduced': 0,
+        'cpu': 0.0,
+        'maxrss': 0
+    }
     taskgen = TaskGenerator(exprs, None, mutator, max_depth)
     gran = taskgen.gran
     while gran > 0:
-        check_func = _check_par if taskgen.pickled_exprs else _check_seq
+        check_func = _check_par if taskgen.parallel else _check_seq
         exprs = check_func(taskgen, nexprs, stats)
         exprs = nodes.reduplicate(exprs)
         gran = gran // 2
@@ -376,7 +508,8 @@ def _apply_mutator(mutator, exprs, max_depth=None):
         _print_progress(
             f"{mutator}: diff {-stats['reduced']:+} exprs, "
             f"{stats['tests']} tests ({stats['tests_success']}), "
-            f"{time.time() - start_time:.1f}s", False)
+            f"{time.time() - start_time:.1f}s, cpu {stats['cpu']:.1f}s, "
+            f"peak {stats['maxrss'] // 1024} MiB", False)
 
     return exprs, stats['tests'], stats['reduced']
 
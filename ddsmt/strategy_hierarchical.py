@@ -21,20 +21,23 @@
 import collections
 import logging
 import multiprocessing
+import multiprocessing.pool
 import pickle
 import sys
+import threading
 import time
 import traceback
 
 from . import checker
+from . import context
 from . import mutators
-from . import nodeio
 from . import nodes
 from . import options
 from . import debug_utils
 from . import progress
 from . import smtlib
-from .mutator_utils import Simplification, apply_simp
+from . import writer
+from .mutator_utils import Simplification, apply_simp, compose_simps
 
 
 def get_passes():
@@ -90,10 +93,11 @@ def get_pass(passes, id):
 # nodeid: id of the mutated node in bfs order. Only used for progress indication
 # name: name of the mutator
 # exprs: the current input
-# simp: the substitution to be checked
+# simp: the substitution to be checked (or that was successful)
 # runtime: time needed to check this task
-Task = collections.namedtuple('Task',
-                              ['nodeid', 'name', 'exprs', 'simp', 'runtime'])
+# usage: resource usage (``checker.ResourceUsage``) of the commands
+Task = collections.namedtuple(
+    'Task', ['nodeid', 'name', 'exprs', 'simp', 'runtime', 'usage'])
 
 
 class Producer:
@@ -102,14 +106,22 @@ class Producer:
     Performs a walk through the current input and applies the
     ``mutators`` to every node. Supports skipping the first ``skip``
     nodes. As soon as ``abort_flag`` is triggered, stops generation as
-    soon as possible.
+    soon as possible. Tasks are pickled unless ``pickled`` is false,
+    i.e., unless the checks run in threads.
     """
-    def __init__(self, mutators, abort_flag, original):
+    def __init__(self, mutators, abort_flag, original, pickled=True):
         self.__node_count = 0
         self.__mutators = mutators
         self.__abort = abort_flag
         self.__original = original
-        self.__pickled = pickle.dumps(original)
+        self.__pickled = pickled
+        self.__exprs = pickle.dumps(original) if pickled else original
+
+    def __task(self, count, name, simp):
+        """Create the ``Task`` that checks ``simp``."""
+        if self.__pickled:
+            simp = pickle.dumps(simp)
+        return Task(count, name, self.__exprs, simp, None, None)
 
     def __mutate_node(self, count, linput):
         """Apply all mutators to the given node.
@@ -127,15 +139,13 @@ class Producer:
                         if self.__abort.is_set():
                             break
                         assert isinstance(x, Simplification)
-                        yield Task(count, str(m), self.__pickled,
-                                   pickle.dumps(x), None)
+                        yield self.__task(count, str(m), x)
                 if hasattr(m, 'global_mutations'):
                     for x in m.global_mutations(linput, self.__original):
                         if self.__abort.is_set():
                             break
                         assert isinstance(x, Simplification)
-                        yield Task(count, f'(global) {m}', self.__pickled,
-                                   pickle.dumps(x), None)
+                        yield self.__task(count, f'(global) {m}', x)
             except Exception as e:
                 logging.info(f'{type(e)} in application of {m}: {e}')
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -158,37 +168,58 @@ class Consumer:
     valid simplifications.
 
     Uses the ``abort_flag`` to stop as soon as a valid simplification
-    has been found.
+    has been found. Tasks and results are pickled unless ``pickled`` is
+    false.
     """
-    def __init__(self, abort_flag):
+    def __init__(self, abort_flag, pickled=True):
         self.__abort = abort_flag
+        self.__pickled = pickled
+
+    def __result(self, success, task):
+        """Create the result for ``task``, pickled if necessary."""
+        if self.__pickled:
+            return pickle.dumps((success, task))
+        return success, task
 
     def check(self, task):
         with debug_utils.Profiler():
-            abortres = pickle.dumps(
-                (False, Task(task.nodeid, task.name, None, None, None)))
+            abortres = self.__result(
+                False, Task(task.nodeid, task.name, None, None, None, None))
             if self.__abort.is_set():
                 return abortres
             try:
                 start = time.time()
-                simp = pickle.loads(task.simp)
+                simp = task.simp
+                exprs = task.exprs
+                if self.__pickled:
+                    simp = pickle.loads(simp)
+                    exprs = pickle.loads(exprs)
                 assert isinstance(simp, Simplification)
                 if self.__abort.is_set():
                     return abortres
-                exprs = apply_simp(pickle.loads(task.exprs), simp)
+                mexprs = apply_simp(exprs, simp)
+                # a candidate that equals the input is no simplification
+                if mexprs is None or mexprs == exprs:
+                    return abortres
 
                 if self.__abort.is_set():
                     return abortres
-                res = checker.check_exprs(exprs)
+                checker.take_usage()
+                res = checker.check_exprs(mexprs)
                 runtime = time.time() - start
+                usage = checker.take_usage()
+                # report successes even if aborted, they may be composed
+                # with the success that triggered the abort
+                if res:
+                    return self.__result(
+                        True,
+                        Task(task.nodeid, task.name, mexprs, simp, runtime,
+                             usage))
                 if self.__abort.is_set():
                     return abortres
-                if res:
-                    return pickle.dumps((True,
-                                         Task(task.nodeid, task.name, exprs,
-                                              None, runtime)))
-                return pickle.dumps(
-                    (False, Task(task.nodeid, task.name, None, None, runtime)))
+                return self.__result(
+                    False,
+                    Task(task.nodeid, task.name, None, None, runtime, usage))
             except Exception as e:
                 logging.info(f'{type(e)} in check of {task.name}: {e}')
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -197,35 +228,70 @@ class Consumer:
 
 
 class MutatorStats:
-    """Gather information about the performance of the individual mutators."""
+    """Gather information about the performance of the individual mutators
+    and passes."""
     def __init__(self):
         self.data = {}
+        self.passes = {}
         self.__enabled = logging.getLogger().isEnabledFor(logging.INFO)
 
-    def add(self, success, task, original):
+    def add(self, success, task, original, passid):
         """Add results from one check."""
         if task.runtime is None or not self.__enabled:
             return
-        d = self.data.setdefault(task.name, {
-            'tests': 0,
-            'success': 0,
-            'diff': 0,
-            'runtime': 0
-        })
-        d['tests'] += 1
+        diff = 0
         if success:
-            d['success'] += 1
-            d['diff'] += nodes.count_exprs(
-                task.exprs) - nodes.count_exprs(original)
-        d['runtime'] += task.runtime
+            diff = nodes.count_exprs(task.exprs) - nodes.count_exprs(original)
+        for d in [
+                self.data.setdefault(task.name, {}),
+                self.passes.setdefault(passid, {})
+        ]:
+            d['tests'] = d.get('tests', 0) + 1
+            d['success'] = d.get('success', 0) + (1 if success else 0)
+            d['diff'] = d.get('diff', 0) + diff
+            d['runtime'] = d.get('runtime', 0) + task.runtime
+            d['cpu'] = d.get('cpu', 0) + task.usage.user + task.usage.sys
+            d['maxrss'] = max(d.get('maxrss', 0), task.usage.maxrss)
 
     def print(self):
         """Print cumulative results."""
         if self.__enabled:
             for name, data in sorted(self.data.items()):
-                logging.info(f'{name}: diff {data["diff"]:+} expressions, '
-                             f'{data["tests"]} tests ({data["success"]}), '
-                             f'{data["runtime"]:.1f}s')
+                logging.info(f'{name}: {self.__format(data)}')
+            for passid, data in sorted(self.passes.items()):
+                logging.info(f'pass {passid + 1}: {self.__format(data)}')
+
+    def __format(self, data):
+        return (f'diff {data["diff"]:+} expressions, '
+                f'{data["tests"]} tests ({data["success"]}), '
+                f'{data["runtime"]:.1f}s, cpu {data["cpu"]:.1f}s, '
+                f'peak {data["maxrss"] // 1024} MiB')
+
+
+def compose(exprs, successes):
+    """Combine the successful tasks ``successes`` that were checked
+    concurrently on ``exprs``.
+
+    The simplifications that substitute disjoint parts of ``exprs`` are
+    composed and verified with a single check. If nothing can be
+    composed or the check fails, the task with the smallest result is
+    used. Returns the task to apply and the number of checks performed.
+    """
+    successes = sorted(successes, key=lambda t: nodes.count_exprs(t.exprs))
+    if len(successes) < 2:
+        return successes[0], 0
+    indices, simp = compose_simps(exprs, [t.simp for t in successes])
+    if len(indices) < 2:
+        return successes[0], 0
+    start = time.time()
+    mexprs = apply_simp(exprs, simp)
+    checker.take_usage()
+    if not checker.check_exprs(mexprs):
+        logging.debug(f'Composing {len(indices)} successes failed')
+        return successes[0], 1
+    return Task(min(successes[i].nodeid for i in indices),
+                ', '.join(successes[i].name for i in indices), mexprs, simp,
+                time.time() - start, checker.take_usage()), 1
 
 
 def reduce(exprs):
@@ -241,10 +307,18 @@ def reduce(exprs):
     loop_checker.add(exprs)
 
     # use one pool for the whole reduction
-    with multiprocessing.Pool(options.args().jobs) as pool:
+    threads = checker.uses_threads()
+    pool_type = multiprocessing.Pool
+    if threads:
+        pool_type = multiprocessing.pool.ThreadPool
+    with pool_type(options.args().jobs, context.activate,
+                   (context.current(), )) as pool:
         # abort flag is passed to both producer and consumer
         # important: the pool will break if the abort_flag is destroyed early
-        abort_flag = multiprocessing.Manager().Event()
+        if threads:
+            abort_flag = threading.Event()
+        else:
+            abort_flag = multiprocessing.Manager().Event()
         # iterate over all passes
         for passid in range(len(passes)):
             cur_passes, params = get_pass(passes, passid)
@@ -260,35 +334,44 @@ def reduce(exprs):
                 progress.start(cnt)
                 progress.update(min(cnt, skip))
                 abort_flag.clear()
-                prod = Producer(cur_passes, abort_flag, exprs)
-                cons = Consumer(abort_flag)
+                successes = []
+                prod = Producer(cur_passes, abort_flag, exprs, not threads)
+                cons = Consumer(abort_flag, not threads)
                 for result in pool.imap_unordered(cons.check,
                                                   prod.generate(skip, params)):
                     nchecks += 1
-                    success, task = pickle.loads(result)
+                    if not threads:
+                        result = pickle.loads(result)
+                    success, task = result
                     if abort_flag.is_set():
-                        # skip remaining results if we had a success
+                        # skip remaining results if we had a success, but
+                        # keep concurrent successes for composition
                         skip = min(skip, task.nodeid - 1)
+                        if success:
+                            successes.append(task)
                         continue
                     progress.update(task.nodeid)
-                    stats.add(success, task, exprs)
+                    stats.add(success, task, exprs, passid)
                     if success:
-                        # trigger abort, then process the result
+                        # trigger abort, process the result(s) afterwards
                         abort_flag.set()
                         progress.finish()
-                        nreduce += 1
-                        runtime = time.time() - start
-                        logging.chat(
-                            f'#{nreduce}: {task.name} ({runtime:.2f}s, '
-                            f'{nodes.count_nodes(task.exprs)} expressions)')
-                        reduction = True
-                        debug_utils.dump_diff(task.name, exprs, task.exprs)
-                        exprs = nodes.reduplicate(task.exprs)
-                        loop_checker.add(exprs)
+                        successes.append(task)
                         skip = task.nodeid - 1
-                        fresh_run = False
-                        nodeio.write_smtlib_to_file(options.args().outfile,
-                                                    exprs)
+                if successes:
+                    task, ncomposed = compose(exprs, successes)
+                    nchecks += ncomposed
+                    nreduce += 1
+                    runtime = time.time() - start
+                    logging.chat(
+                        f'#{nreduce}: {task.name} ({runtime:.2f}s, '
+                        f'{nodes.count_nodes(task.exprs)} expressions)')
+                    reduction = True
+                    debug_utils.dump_diff(task.name, exprs, task.exprs)
+                    exprs = nodes.reduplicate(task.exprs)
+                    loop_checker.add(exprs)
+                    fresh_run = False
+                    writer.update(exprs)
                 if not reduction:
                     progress.finish()
                     logging.info('No further simplification found')
@@ -0,0 +1,94 @@
+import io
+import os
+import pytest
+import threading
+
+import ddsmt
+from .. import context
+from .. import nodeio
+from .. import nodes
+
+INPUT = '''(declare-const x Int)
+(declare-const y Int)
+(assert (> (+ x 3) y))
+(assert (= x (* y 2)))
+(check-sat)
+'''
+
+
+def test_reduce(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = context.current().args
+    for strategy in ['ddmin', 'hierarchical', 'hybrid']:
+        res = ddsmt.reduce(INPUT,
+                           lambda text: '(* y 2)' in text,
+                           strategy=strategy,
+                           jobs=2)
+        assert '(* y 2)' in res and len(res) < len(INPUT) / 2
+    # nothing was written
+    assert os.listdir(tmp_path) == []
+    assert context.current().args is args
+
+
+def test_reduce_exprs():
+    exprs = list(nodeio.parse_smtlib(INPUT))
+    res = ddsmt.reduce(exprs,
+                       lambda exprs: len(exprs) >= 2,
+                       strategy='ddmin',
+                       arguments=['--disable-all', '--core'])
+    assert len(res) == 2
+
+    with pytest.raises(ValueError):
+        ddsmt.reduce(exprs, lambda exprs: False)
+
+
+def test_reduce_lazy():
+    def oracle(exprs):
+        file = io.StringIO()
+        nodeio.write_smtlib_for_checking(file, exprs)
+        return '(* y 2)' in file.getvalue()
+
+    exprs = list(nodeio.parse_smtlib(INPUT, lazy=True))
+    assert any(nodes.is_lazy(expr) for expr in exprs)
+    # the workers get unexpanded lazy nodes and expand them as needed
+    res = ddsmt.reduce(exprs, oracle, strategy='hierarchical', jobs=2)
+    assert oracle(res) and nodes.count_exprs(res) < nodes.count_exprs(exprs)
+
+
+def test_reduce_threads():
+    for strategy in ['ddmin', 'hierarchical']:
+        checks = []
+
+        def oracle(text):
+            checks.append(text)
+            return '(* y 2)' in text
+
+        res = ddsmt.reduce(INPUT,
+                           oracle,
+                           strategy=strategy,
+                           jobs=2,
+                           arguments=['--executor', 'thread'])
+        assert '(* y 2)' in res and len(res) < len(INPUT) / 2
+        # the oracle runs within this process
+        assert len(checks) > 1
+
+
+def test_concurrent_reductions():
+    results = {}
+
+    def run(term):
+        results[term] = ddsmt.reduce(INPUT,
+                                     lambda text: term in text,
+                                     strategy='ddmin')
+
+    threads = [
+        threading.Thread(target=run, args=(term, ))
+        for term in ['(* y 2)', '(+ x 3)']
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for term, res in results.items():
+        assert term in res and len(res) < len(INPUT) / 2
+    assert len(results) == 2
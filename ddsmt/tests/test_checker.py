@@ -0,0 +1,337 @@
+import time
+
+from .. import checker
+from .. import context
+from .. import mutators
+from .. import nodeio
+from .. import options
+from .. import tmpfiles
+
+
+def test_execute_early_kill():
+    args = options.parse_options(mutators, ['in', 'out', 'bin'])
+    with context.ReductionContext(args):
+        golden = checker.RunInfo(0, 'sat\n', '', 0)
+        cmd = ['sh', '-c', 'echo $0; sleep 10']
+
+        start = time.time()
+        ri = checker.execute(cmd, 'unsat', 20, golden=golden)
+        assert time.time() - start < 5
+        assert ri.out == 'unsat\n'
+        assert not checker.matches_golden(golden, ri, False, None, None)
+
+        golden = checker.RunInfo(0, 'sat\n', 'err\n', 0)
+        cmd = ['sh', '-c', 'cat; echo err >&2']
+        ri = checker.execute(cmd, None, 20, b'sat\n', golden)
+        assert checker.matches_golden(golden, ri, False, None, None)
+
+
+def test_output_capture():
+    golden = checker.OutputCapture.from_bytes(b'unsat\nstats', ['unsat'])
+    capture = checker.OutputCapture(['unsat', 'sat'])
+    for chunk in [b'un', b'sa', b't\nst', b'ats']:
+        assert capture.write(chunk)
+    assert capture == golden
+    assert 'unsat' in capture and 'sat' in capture
+    assert 'unknown' not in capture
+    assert capture.data is None
+
+    other = checker.OutputCapture(expected=golden.data)
+    assert other.write(b'unsat\n')
+    assert not other.write(b'model')
+    assert other != golden
+
+    args = options.parse_options(mutators, ['in', 'out', 'bin'])
+    with context.ReductionContext(args):
+        ri = checker.execute(['sh', '-c', 'echo unsat; echo stats >&2'],
+                             None,
+                             20,
+                             b'',
+                             patterns=('unsat', None),
+                             digest=True)
+        assert 'unsat' in ri.out
+        assert ri.out == checker.OutputCapture.from_bytes(b'unsat\n')
+        assert ri.err == checker.OutputCapture.from_bytes(b'stats\n')
+
+
+def test_cross_check_modes(tmp_path):
+    cmd = tmp_path / 'cmd'
+    cmd.write_text('#!/bin/sh\ngrep -q bad "$1" && sleep 5\ncat "$1"\n')
+    cmd_cc = tmp_path / 'cmd_cc'
+    cmd_cc.write_text('#!/bin/sh\ngrep good "$1"\n')
+    for script in [cmd, cmd_cc]:
+        script.chmod(0o755)
+    input = tmp_path / 'input.smt2'
+    input.write_text('good\n')
+    bad = tmp_path / 'bad.smt2'
+    bad.write_text('bad\n')
+
+    for mode in ['sequential', 'concurrent', 'adaptive']:
+        args = options.parse_options(mutators, [
+            '--cross-check',
+            str(cmd_cc), '--cross-check-mode', mode, '--timeout', '10',
+            '--timeout-cc', '10',
+            str(input), 'out',
+            str(cmd)
+        ])
+        with context.ReductionContext(args):
+            checker.do_golden_runs()
+            assert checker.check(str(input))
+            if mode == 'concurrent':
+                start = time.time()
+                assert not checker.check(str(bad))
+                assert time.time() - start < 4
+
+
+def test_adaptive_timeout():
+    timeout = checker.AdaptiveTimeout('timeout', 30, 1, 2, size=4)
+    for runtime in [0.1, 0.2, 0.3, 0.2]:
+        timeout.add(runtime)
+        assert timeout.get() == 30
+    timeout.add(0.1)
+    assert timeout.get() == 1
+    for runtime in [2, 1, 1, 1]:
+        timeout.add(runtime)
+        assert timeout.get() == 4
+    timeout.add(1)
+    assert timeout.get() == 2
+    timeout.add(20)
+    assert timeout.get() == 30
+
+
+def test_resource_usage():
+    args = options.parse_options(
+        mutators, ['--timeout-clock', 'cpu', 'in', 'out', 'bin'])
+    with context.ReductionContext(args):
+        checker.take_usage()
+        cmd = ['sh', '-c', 'while :; do :; done']
+        ri = checker.execute(cmd, None, 0.5, b'')
+        assert ri.exit == -9
+        assert checker.get_elapsed(ri) >= 0.5
+        assert ri.maxrss > 0
+        usage = checker.take_usage()
+        assert usage.user + usage.sys >= 0.5
+        assert checker.take_usage() == checker.ResourceUsage(0.0, 0.0, 0)
+
+
+def test_process_groups(tmp_path):
+    def is_alive(pid):
+        # killed processes may take a moment to terminate
+        for _ in range(100):
+            try:
+                with open(f'/proc/{pid}/stat') as file:
+                    if file.read().split(')')[-1].split()[0] == 'Z':
+                        return False
+            except FileNotFoundError:
+                return False
+            time.sleep(0.01)
+        return True
+
+    args = options.parse_options(mutators, ['in', 'out', 'bin'])
+    with context.ReductionContext(args):
+        # the left over sleep keeps stdout open
+        cmd = ['sh', '-c', 'sleep 30 & echo $!']
+        start = time.time()
+        ri = checker.execute(cmd, None, 20, b'')
+        assert time.time() - start < 5
+        assert ri.exit == 0
+        assert not is_alive(int(ri.out))
+
+        pidfile = tmp_path / 'pid'
+        cmd = ['sh', '-c', f'sleep 30 & echo $! > {pidfile}; sleep 30']
+        ri = checker.execute(cmd, None, 0.5, b'')
+        assert ri.out is None
+        assert not is_alive(int(pidfile.read_text()))
+
+
+def test_launcher():
+    cmd = ['sh', '-c', 'ulimit -v; ulimit -t']
+    for launcher in ['shim', 'prlimit']:
+        args = options.parse_options(
+            mutators,
+            ['--launcher', launcher, '--memout', '64', 'in', 'out', 'bin'])
+        with context.ReductionContext(args):
+            ri = checker.execute(cmd, None, 4.5, b'')
+            if launcher == 'shim':
+                # the limits are in place before the command starts
+                assert ri.out == '65536\n5\n'
+            ri = checker.execute(
+                ['python3', '-c', 'x = bytearray(256 * 2**20)'], None, 10, b'')
+            assert ri.exit != 0
+            assert 'MemoryError' in ri.err
+
+
+def test_check_exprs_batch(tmp_path):
+    solver = tmp_path / 'solver'
+    runs = tmp_path / 'runs'
+    solver.write_text(f"""#!/bin/sh
+echo run >> {runs}
+sed 's/)(/)\\n(/g' "$1" | awk 'BEGIN {{ n = 0 }}
+     /^\\(push/ {{ n++; bad[n] = 0 }}
+     /^\\(pop/ {{ n-- }}
+     /^\\(assert false/ {{ bad[n] = 1 }}
+     /^\\(check-sat/ {{ b = 0; for (i = 0; i <= n; i++) b += bad[i];
+                        print (b ? "unsat" : "sat") }}'
+""")
+    solver.chmod(0o755)
+    input = tmp_path / 'input.smt2'
+    input.write_text('(declare-const x Bool)\n(assert false)\n(assert x)\n'
+                     '(check-sat)\n')
+
+    args = options.parse_options(
+        mutators, ['--batch-size', '4',
+                   str(input), 'out', str(solver)])
+    with context.ReductionContext(args):
+        tmpfiles.init()
+        checker.do_golden_runs()
+        assert checker.supports_batches()
+        exprs = list(nodeio.parse_smtlib(input.read_text()))
+        decl, false, x, check_sat = exprs
+        option, = nodeio.parse_smtlib('(set-option :produce-models true)')
+        candidates = [
+            [decl, x, check_sat],
+            [decl, false, check_sat],
+            [decl, false, option, check_sat],
+            [decl, false, x, check_sat],
+            [false, check_sat],
+        ]
+        runs.write_text('')
+        assert checker.check_exprs_batch(candidates) == [
+            False, True, None, True, True
+        ]
+        assert runs.read_text() == 'run\n'
+
+
+def test_check_exprs_batch_answers(tmp_path):
+    input = tmp_path / 'input.smt2'
+    input.write_text('(declare-const x Bool)\n(declare-const y Bool)\n'
+                     '(assert false)\n(assert x)\n(check-sat)\n')
+    # answers are separated by sep, without a final newline, and the
+    # solver gives up on candidates that assert y
+    for sep in ['\\n', '\\r\\n']:
+        solver = tmp_path / 'solver'
+        solver.write_text(f"""#!/bin/sh
+sed 's/)(/)\\n(/g' "$1" | awk -v sep='{sep}' 'BEGIN {{ n = 0; s = "" }}
+     /^\\(push/ {{ n++; bad[n] = 0; unk[n] = 0 }}
+     /^\\(pop/ {{ n-- }}
+     /^\\(assert false/ {{ bad[n] = 1 }}
+     /^\\(assert y/ {{ unk[n] = 1 }}
+     /^\\(check-sat/ {{ b = 0; u = 0;
+                        for (i = 0; i <= n; i++) {{ b += bad[i]; u += unk[i] }}
+                        printf "%s%s", s, (u ? "unknown" : b ? "unsat" : "sat");
+                        s = sep }}'
+""")
+        solver.chmod(0o755)
+        args = options.parse_options(
+            mutators, ['--batch-size', '4',
+                       str(input), 'out', str(solver)])
+        with context.ReductionContext(args):
+            tmpfiles.init()
+            checker.do_golden_runs()
+            assert checker.supports_batches()
+            decl_x, decl_y, false, x, check_sat = nodeio.parse_smtlib(
+                input.read_text())
+            y, = nodeio.parse_smtlib('(assert y)')
+            candidates = [
+                [decl_x, decl_y, x, check_sat],
+                [decl_x, decl_y, false, check_sat],
+                [decl_x, decl_y, false, y, check_sat],
+                [decl_x, decl_y, false, x, check_sat],
+            ]
+            assert checker.check_exprs_batch(candidates) == [
+                False, True, None, True
+            ]
+
+
+def test_differential(tmp_path):
+    runs = tmp_path / 'runs'
+    cmd = tmp_path / 'cmd'
+    cmd.write_text(f'#!/bin/sh\necho cmd >> {runs}\n'
+                   'grep -q slow "$1" && sleep 5\n'
+                   'grep -q x "$1" && echo unsat || echo sat\n')
+    cmd_cc = tmp_path / 'cmd_cc'
+    cmd_cc.write_text(f'#!/bin/sh\necho cc >> {runs}\n'
+                      'grep -q crash "$1" && exit 1\necho sat\n')
+    for script in [cmd, cmd_cc]:
+        script.chmod(0o755)
+    files = {}
+    for content in ['x', 'y', 'x slow crash']:
+        files[content] = tmp_path / f'{len(files)}.smt2'
+        files[content].write_text(content)
+
+    args = options.parse_options(mutators, [
+        '--cross-check',
+        str(cmd_cc), '--differential', '--timeout', '10', '--timeout-cc',
+        '10',
+        str(files['x']), 'out',
+        str(cmd)
+    ])
+    with context.ReductionContext(args):
+        checker.do_golden_runs()
+        runs.write_text('')
+        assert checker.check(str(files['x']))
+        assert not checker.check(str(files['y']))
+        assert sorted(runs.read_text().split()) == ['cc', 'cc', 'cmd', 'cmd']
+
+        # the crash decides the verdict, the slow command is killed
+        start = time.time()
+        assert not checker.check(str(files['x slow crash']))
+        assert time.time() - start < 4
+
+        # cached answers are not checked again
+        runs.write_text('')
+        assert checker.check(str(files['x']))
+        assert not checker.check(str(files['x slow crash']))
+        assert runs.read_text() == ''
+
+
+def test_performance(tmp_path):
+    runs = tmp_path / 'runs'
+    loop = 'i=0; while [ $i -lt {} ]; do i=$((i+1)); done\n'
+    cmd = tmp_path / 'cmd'
+    cmd.write_text(f'#!/bin/sh\necho cmd >> {runs}\n'
+                   'grep -q forever "$1" && while :; do :; done\n'
+                   f'grep -q slow "$1" && {loop.format(100000)}'
+                   f'{loop.format(10000)}')
+    cmd_cc = tmp_path / 'cmd_cc'
+    cmd_cc.write_text(f'#!/bin/sh\n{loop.format(10000)}'
+                      '! grep -q error "$1"\n')
+    for script in [cmd, cmd_cc]:
+        script.chmod(0o755)
+    files = {}
+    for content in ['slow', 'fast', 'forever', 'slow error']:
+        files[content] = tmp_path / f'{content}.smt2'
+        files[content].write_text(content)
+
+    args = options.parse_options(mutators, [
+        '--cross-check',
+        str(cmd_cc), '--performance', '5', '--timeout-clock', 'cpu',
+        '--performance-min-time', '0.001',
+        str(files['slow']), 'out',
+        str(cmd)
+    ])
+    with context.ReductionContext(args):
+        checker.do_golden_runs()
+        for content, expected in [('slow', True), ('fast', False)]:
+            runs.write_text('')
+            assert checker.check(str(files[content])) == expected
+            # the sequential test needs three consistent measurements
+            assert runs.read_text() == 'cmd\n' * 3
+
+        # the cross check needs to match its golden run and to take long
+        # enough, otherwise the command is not even executed
+        runs.write_text('')
+        assert not checker.check(str(files['slow error']))
+        options.args().performance_min_time = 1
+        assert not checker.check(str(files['slow']))
+        assert runs.read_text() == ''
+        options.args().performance_min_time = 0.001
+
+        # a single measurement suffices with a large error probability, and the
+        # command is stopped once it took long enough
+        options.args().performance_error = 0.2
+        runs.write_text('')
+        start = time.time()
+        assert checker.check(str(files['forever']))
+        assert time.time() - start < 5
+        assert runs.read_text() == 'cmd\n'
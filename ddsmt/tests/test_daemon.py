@@ -0,0 +1,88 @@
+import multiprocessing
+import tempfile
+import threading
+import time
+
+from .. import context
+from .. import daemon
+from .. import mutators
+from .. import options
+from .. import scheduler
+from .. import tmpfiles
+
+INPUT = '''(declare-const x Int)
+(declare-const y Int)
+(assert (> (+ x 3) y))
+(assert (= x (* y 2)))
+(check-sat)
+'''
+
+
+def test_fair_scheduler():
+    sched = scheduler.FairScheduler(2, 2)
+    a = sched.register()
+    # a single job gets all slots
+    slots = [sched.acquire(a.job), sched.acquire(a.job)]
+    b = sched.register()
+    acquired = []
+    thread = threading.Thread(
+        target=lambda: acquired.append(sched.acquire(b.job)))
+    thread.start()
+    time.sleep(0.1)
+    assert acquired == []
+    # the slot goes to b, which is below its fair share
+    sched.release(slots.pop())
+    thread.join()
+    assert acquired == [slots[0] ^ 1]
+    # slots of processes that died are reclaimed
+    proc = multiprocessing.Process(target=sched.acquire, args=(a.job, ))
+    sched.release(slots.pop())
+    proc.start()
+    proc.join()
+    assert sched.acquire(a.job) is not None
+    sched.unregister(a)
+    sched.unregister(b)
+
+
+def test_daemon(tmp_path):
+    (tmp_path / 'input.smt2').write_text(INPUT)
+    solver = tmp_path / 'solver'
+    solver.write_text(f'#!/bin/sh\necho "$1" >> {tmp_path / "files"}\n'
+                      'grep -q "(\\* y 2)" "$1" && echo bug\n')
+    solver.chmod(0o755)
+    with context.ReductionContext(
+            options.parse_options(mutators, ['<input>', '<output>'])):
+        from .. import cli
+        cli.add_log_levels()
+        tmpfiles.init()
+        server = daemon.Daemon(2, 1)
+        ids = [
+            server.handle({
+                'command': 'submit',
+                'argv': [
+                    '--strategy', 'ddmin', '--candidate-transport',
+                    transport, 'input.smt2', out, 'solver'
+                ],
+                'cwd': str(tmp_path)
+            })['id'] for out, transport in [('output1.smt2', 'memfd'),
+                                            ('output2.smt2', 'file')]
+        ]
+        assert ids == [1, 2]
+        deadline = time.time() + 60
+        while any(job['state'] not in ('done', 'failed')
+                  for job in server.handle({'command': 'status'})['jobs']):
+            assert time.time() < deadline
+            time.sleep(0.1)
+        for job in server.handle({'command': 'status'})['jobs']:
+            assert job['state'] == 'done'
+            assert job['outfile_size'] < job['infile_size'] / 2
+        for out in ['output1.smt2', 'output2.smt2']:
+            assert '(* y 2)' in (tmp_path / out).read_text()
+        # every job uses its own candidate transport
+        files = (tmp_path / 'files').read_text().split()
+        assert any(f.startswith('/proc/self/fd/') for f in files)
+        assert any(f.startswith(tempfile.gettempdir()) for f in files)
+
+        assert 'error' in server.handle({'command': 'status', 'id': 3})
+        assert 'error' in server.handle({'command': 'cancel'})
+        assert 'error' in server.handle({'command': 'submit'})
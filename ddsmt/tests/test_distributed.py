@@ -0,0 +1,157 @@
+import os
+import pytest
+import socket
+import subprocess
+import sys
+
+from .. import checker
+from .. import context
+from .. import distributed
+from .. import mutators
+from .. import options
+from .. import tmpfiles
+
+INPUT = '''(declare-const x Int)
+(declare-const y Int)
+(assert (> (+ x 3) y))
+(assert (= x (* y 2)))
+(check-sat)
+'''
+
+
+def test_delta():
+    base = INPUT.encode()
+    for data in [
+            base, b'', base[10:], base[:-10], base[:40] + base[60:],
+            b'(check-sat)\n'
+    ]:
+        prefix, suffix, middle = distributed.delta(base, data)
+        assert distributed.apply_delta(base, prefix, suffix, middle) == data
+        assert len(middle) <= len(data)
+    delta = distributed.delta(base, base[:40] + base[60:])
+    assert delta == (40, len(base) - 60, b'')
+
+
+def test_parse_address():
+    assert distributed.parse_address('localhost:1234') == ('localhost', 1234)
+    assert distributed.parse_address('[::1]:80') == ('::1', 80)
+    assert distributed.parse_address(':80') == ('127.0.0.1', 80)
+    assert distributed.parse_address('80') == ('127.0.0.1', 80)
+    for address in ['localhost', 'localhost:port']:
+        with pytest.raises(ValueError):
+            distributed.parse_address(address)
+
+
+def test_agents(tmp_path):
+    input = tmp_path / 'input.smt2'
+    input.write_text(INPUT)
+    solver = tmp_path / 'solver'
+    solver.write_text('#!/bin/sh\ngrep -q "(\\* y 2)" "$1" && echo bug\n')
+    solver.chmod(0o755)
+    secret = tmp_path / 'secret'
+    secret.write_text('secret\n')
+    with context.ReductionContext(
+            options.parse_options(mutators, [
+                '--secret-file',
+                str(secret),
+                str(input), 'output.smt2',
+                str(solver)
+            ])):
+        from .. import cli
+        cli.add_log_levels()
+        tmpfiles.init()
+        checker.do_golden_runs()
+        coordinator = distributed.Coordinator(('127.0.0.1', 0))
+        address = '{}:{}'.format(*coordinator.address)
+        root = os.path.dirname(os.path.dirname(distributed.__file__))
+        cmd = [
+            sys.executable, '-m', 'ddsmt', 'agent', '-j', '2',
+            '--secret-file',
+            str(secret), address,
+            str(solver)
+        ]
+        agents = [subprocess.Popen(cmd, cwd=root) for _ in range(2)]
+        try:
+            lines = INPUT.encode().splitlines(keepends=True)
+            for i in range(len(lines)):
+                candidate = b''.join(lines[:i] + lines[i + 1:])
+                assert coordinator.check(candidate) == (i != 3)
+            # the remaining agent takes over
+            agents[0].kill()
+            agents[0].wait()
+            for i in range(len(lines)):
+                candidate = b''.join(lines[:i] + lines[i + 1:])
+                assert coordinator.check(candidate) == (i != 3)
+            # without agents, the checks run locally
+            agents[1].kill()
+            agents[1].wait()
+            coordinator.WAIT_INTERVAL = 0.5
+            for i in range(len(lines)):
+                candidate = b''.join(lines[:i] + lines[i + 1:])
+                assert coordinator.check(candidate) == (i != 3)
+        finally:
+            coordinator.close()
+            for agent in agents:
+                agent.kill()
+                agent.wait()
+
+
+def test_authentication(tmp_path):
+    input = tmp_path / 'input.smt2'
+    input.write_text(INPUT)
+    secret = tmp_path / 'secret'
+    secret.write_text('secret')
+    with context.ReductionContext(
+            options.parse_options(mutators, [
+                '--secret-file',
+                str(secret),
+                str(input), 'output.smt2', '/bin/true'
+            ])):
+        coordinator = distributed.Coordinator(('127.0.0.1', 0))
+        try:
+            # agents without the secret do not get the input
+            with socket.create_connection(coordinator.address) as sock:
+                conn = distributed.Connection(sock)
+                header, _ = conn.receive()
+                assert header['op'] == 'challenge'
+                conn.send({
+                    'op': 'auth',
+                    'mac': distributed.sign(b'guess', 'agent',
+                                            header['nonce']),
+                    'nonce': '00'
+                })
+                with pytest.raises(ConnectionError):
+                    conn.receive()
+        finally:
+            coordinator.close()
+
+    # agents do not accept setups from coordinators without the secret
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        root = os.path.dirname(os.path.dirname(distributed.__file__))
+        address = '{}:{}'.format(*server.getsockname())
+        cmd = [
+            sys.executable, '-m', 'ddsmt', 'agent', '--secret-file',
+            str(secret), address, '/bin/true'
+        ]
+        agent = subprocess.Popen(cmd, cwd=root)
+        try:
+            sock, _ = server.accept()
+            with sock:
+                conn = distributed.Connection(sock)
+                conn.send({'op': 'challenge', 'nonce': '00'})
+                header, _ = conn.receive()
+                assert header['mac'] == distributed.sign(
+                    b'secret', 'agent', '00')
+                conn.send(
+                    {
+                        'op': 'setup',
+                        'mac': distributed.sign(b'guess', 'coordinator',
+                                                header['nonce'])
+                    }, INPUT.encode())
+                with pytest.raises(ConnectionError):
+                    conn.receive()
+        finally:
+            agent.kill()
+            agent.wait()
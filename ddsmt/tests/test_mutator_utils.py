@@ -0,0 +1,29 @@
+from .. import nodeio
+from ..mutator_utils import Simplification, apply_simp, compose_simps
+from ..nodes import Node
+
+
+def test_compose_simps():
+    exprs = list(
+        nodeio.parse_smtlib(
+            '(assert (and (> x 1) (< y 2)))\n(assert (= x y))\n'))
+    conj = exprs[0][1]
+    simps = [
+        Simplification({conj[1].id: Node('true')}, []),
+        # overlaps with the first one
+        Simplification({conj.id: conj[1]}, []),
+        Simplification({conj[2][1].id: Node('z')},
+                       [Node('declare-const', 'z', 'Int')]),
+        Simplification({exprs[1].id: None}, []),
+        # global substitutions are not composed
+        Simplification({Node('x'): Node('1')}, []),
+    ]
+    indices, simp = compose_simps(exprs, simps)
+    assert indices == [0, 2, 3]
+    assert apply_simp(exprs, simp) == [
+        Node('declare-const', 'z', 'Int'),
+        Node('assert', ('and', 'true', ('<', 'z', 2)))
+    ]
+    # the simplifications are not modified
+    assert all(len(s.substs) == 1 for s in simps)
+    assert compose_simps(exprs, simps[1:2]) == ([0], simps[1])
@@ -2,6 +2,7 @@ import pytest
 
 from .. import nodeio
 from .. import nodes
+from .. import smtlib
 from ..nodes import Node
 
 
@@ -119,6 +120,24 @@ def test_parse_smtlib():
     assert list(
         nodeio.parse_smtlib("(set-option :source |just for testing")) == []
     assert list(nodeio.parse_smtlib("(set-option :source testing")) == []
+    assert list(nodeio.parse_smtlib('(assert "a""')) == []
+
+
+def test_parse_smtlib_bytes(tmp_path):
+    input = '(set-logic QF_S)\n(assert (= x "\u00e4""b"));c\n(check-sat)\n'
+    expected = [
+        Node('set-logic', 'QF_S'),
+        Node('assert', ('=', 'x', '"\u00e4""b"')),
+        Node(';c\n'),
+        Node(Node('check-sat')),
+    ]
+    assert list(nodeio.parse_smtlib(input.encode())) == expected
+
+    filename = tmp_path / 'input.smt2'
+    filename.write_bytes(input.encode())
+    assert list(nodeio.parse_smtlib_file(str(filename))) == expected
+    filename.write_bytes(b'')
+    assert list(nodeio.parse_smtlib_file(str(filename))) == []
 
 
 def test_dfs():
@@ -203,3 +222,144 @@ def test_binary_search():
         (3, 7),
         (0, 3),
     ]
+
+
+def test_parse_smtlib_lazy():
+    import pickle
+    input = '''(declare-const x Int)
+    (assert (> x (+ x 1)))
+    (assert (= x ; comment
+      1))
+    (check-sat)
+    '''
+    eager = list(nodeio.parse_smtlib(input))
+    for text in [input, input.encode()]:
+        exprs = list(nodeio.parse_smtlib(text, lazy=True))
+        assert [nodes.is_lazy(e) for e in exprs] == [False, True, True, False]
+        assert nodes.count_exprs(exprs) == nodes.count_exprs(eager)
+        assert nodes.count_nodes(exprs) == nodes.count_nodes(eager)
+        assert exprs[1].has_ident() and exprs[1].get_ident() == 'assert'
+        assert len(exprs[2]) == 2
+
+        # substitutions by id do not expand lazy nodes
+        subst = nodes.substitute(exprs, {exprs[2].id: None})
+        assert len(subst) == 3 and nodes.is_lazy(subst[1])
+        assert nodeio.__write_smtlib_str(
+            exprs[1]) == '(assert (> x (+ x 1)))'
+
+        # pickling keeps lazy nodes unexpanded, copies use the same ids
+        unpickled = pickle.loads(pickle.dumps(exprs))
+        assert nodes.is_lazy(unpickled[1])
+        assert unpickled[1].id == exprs[1].id
+        assert [n.id for n in nodes.dfs(unpickled)
+                ] == [n.id for n in nodes.dfs(exprs)]
+
+        assert exprs == eager
+        assert not any(nodes.is_lazy(e) for e in exprs)
+        assert exprs[1].get_ident() is exprs[1][0]
+        assert unpickled == eager
+
+
+def __information(exprs):
+    """Return the indices and the sort lookup of ``exprs`` as collected by
+    ``smtlib.collect_information``."""
+    smtlib.reset_information()
+    smtlib.collect_information(exprs)
+    return smtlib.__info().indices, smtlib.__info().sort_lookup
+
+
+def test_snapshot(tmp_path):
+    import pickle
+    input = tmp_path / 'input.smt2'
+    input.write_text('''; comment
+    (declare-const x (_ BitVec 8))
+    (assert (let ((y ((_ extract 3 0) x))) (= y #b0000)))
+    ()
+    (check-sat)
+    ''')
+    cachedir = str(tmp_path / 'cache')
+    for lazy in [False, True]:
+        exprs = nodeio.parse_smtlib_file_cached(str(input), cachedir, lazy)
+        assert exprs == list(nodeio.parse_smtlib_file(str(input)))
+        loaded = nodeio.parse_smtlib_file_cached(str(input), cachedir, lazy)
+        assert [n.id for n in loaded] == [n.id for n in exprs]
+        assert all(nodes.is_lazy(n) == lazy for n in loaded[1:3])
+        assert nodes.count_nodes(loaded) == nodes.count_nodes(exprs)
+        assert nodes.count_exprs(loaded) == nodes.count_exprs(exprs)
+        unpickled = pickle.loads(pickle.dumps(loaded))
+        assert nodes.is_lazy(unpickled[1]) == lazy
+        info = __information(exprs)
+        assert len(info[0]) == 3 and sorted(info[1]) == ['x', 'y']
+        assert __information(loaded) == info
+        assert loaded == exprs
+        assert [n.id for n in nodes.dfs(loaded)
+                ] == [n.id for n in nodes.dfs(exprs)]
+        assert unpickled == exprs
+        output = tmp_path / 'output.smt2'
+        nodeio.write_smtlib_for_checking(str(output), loaded)
+        assert list(nodeio.parse_smtlib_file(str(output))) == exprs
+        assert nodes.Node.last_id() >= max(n.id for n in nodes.dfs(exprs))
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+
+
+def test_snapshot_other_process(tmp_path):
+    import os
+    import subprocess
+    import sys
+    input = tmp_path / 'input.smt2'
+    input.write_text('(declare-const x Int)\n(assert (> (+ x 3) 0))\n')
+    cachedir = str(tmp_path / 'cache')
+    root = os.path.dirname(os.path.dirname(nodeio.__file__))
+    script = ('import sys\nfrom ddsmt import nodeio\n'
+              'nodeio.parse_smtlib_file_cached(*sys.argv[1:3], '
+              'len(sys.argv) > 3)')
+    for lazy in [False, True]:
+        # hashes of strings differ between processes
+        argv = [str(input), cachedir] + (['lazy'] if lazy else [])
+        subprocess.run([sys.executable, '-c', script] + argv,
+                       cwd=root,
+                       env=dict(os.environ, PYTHONHASHSEED='1'),
+                       check=True)
+        loaded = nodeio.parse_smtlib_file_cached(str(input), cachedir, lazy)
+        exprs = list(nodeio.parse_smtlib_file(str(input)))
+        assert loaded == exprs
+        lookup = {node: node.id for node in nodes.dfs(exprs)}
+        assert all(node in lookup for node in nodes.dfs(loaded))
+    assert len(list((tmp_path / 'cache').iterdir())) == 2
+
+
+def test_parse_smtlib_parallel(tmp_path, monkeypatch):
+    import multiprocessing
+    input = tmp_path / 'input.smt2'
+    input.write_text('''; comment (
+    (set-info :source |a (b|)
+    (declare-const x String)
+    (assert (= x "(("))
+    (assert (! (= x ")") :named a))
+    (declare-const b (_ BitVec 8))
+    (assert (let ((y ((_ extract 3 0) b))) (= y #b0000)))
+    (assert a"b)
+    (assert "c)d")
+    (assert (= a|b |e)f|))
+    (check-sat)
+    ''')
+    # workers that are not forked do not share the id counter
+    monkeypatch.setattr(multiprocessing, 'Pool',
+                        multiprocessing.get_context('spawn').Pool)
+    for lazy in [False, True]:
+        exprs = list(nodeio.parse_smtlib_file(str(input)))
+        parsed = nodeio.parse_smtlib_file_parallel(str(input),
+                                                   2,
+                                                   lazy,
+                                                   min_size=0)
+        assert lazy or not any(nodes.is_lazy(n) for n in parsed)
+        # ids differ from the serial parse, compare the number of indices
+        indices, sort_lookup = __information(exprs)
+        assert len(indices) == 3 and sorted(sort_lookup) == ['b', 'x', 'y']
+        info = __information(parsed)
+        assert (len(info[0]), info[1]) == (len(indices), sort_lookup)
+        assert parsed == exprs
+        ids = [n.id for n in nodes.dfs(parsed)]
+        assert len(ids) == len(set(ids))
+        assert Node('x').id > max(ids)
+        assert nodes.count_nodes(parsed) == nodes.count_nodes(exprs)
@@ -1,11 +1,11 @@
 import pytest
 
+from .. import context
 from .. import mutators
 from .. import options
 
 
 def test_help(capsys):
-    options.__PARSED_ARGS = None
     with pytest.raises(SystemExit):
         options.parse_options(mutators, ['--help'])
     captured = capsys.readouterr()
@@ -14,7 +14,6 @@ def test_help(capsys):
 
 
 def test_help_all(capsys):
-    options.__PARSED_ARGS = None
     with pytest.raises(SystemExit):
         options.parse_options(mutators, ['--help-all'])
     captured = capsys.readouterr()
@@ -22,7 +21,6 @@ def test_help_all(capsys):
 
 
 def test_dump_config(capsys):
-    options.__PARSED_ARGS = None
     with pytest.raises(SystemExit):
         options.parse_options(mutators, ['--dump-config'])
     captured = capsys.readouterr()
@@ -30,7 +28,6 @@ def test_dump_config(capsys):
 
 
 def test_no_options(capsys):
-    options.__PARSED_ARGS = None
     with pytest.raises(SystemExit):
         options.parse_options(mutators, [])
     captured = capsys.readouterr()
@@ -39,7 +36,6 @@ def test_no_options(capsys):
 
 
 def test_basic(capsys):
-    options.__PARSED_ARGS = None
     options.parse_options(mutators, ['input.smt2', 'output.smt2', 'binary'])
     options.parse_options(mutators,
                           ['--no-core', 'input.smt2', 'output.smt2', 'binary'])
@@ -49,15 +45,21 @@ def test_basic(capsys):
 
 
 def test_cmd_cc(capsys):
-    options.__PARSED_ARGS = None
     options.parse_options(
         mutators,
         ['-c', 'other-binary', 'input.smt2', 'output.smt2', 'binary'])
 
 
 def test_args(capsys):
-    options.__PARSED_ARGS = None
-    with pytest.raises(SystemExit):
-        options.args()
-    opts = options.args(['--no-core', 'input.smt2', 'output.smt2', 'binary'])
-    assert options.args() == opts
+    with context.ReductionContext():
+        with pytest.raises(SystemExit):
+            options.args()
+        opts = options.args(
+            ['--no-core', 'input.smt2', 'output.smt2', 'binary'])
+        assert options.args() == opts
+    # every context has its own options
+    with context.ReductionContext(options.parse_options(
+            mutators, ['input.smt2', 'output.smt2', 'binary'])):
+        assert options.args() != opts
+        with context.ReductionContext(opts):
+            assert options.args() == opts
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+from .. import checker
+from .. import context
+from .. import mutators
+from .. import options
+from .. import oracle
+
+ORACLE = '''
+import os
+import sys
+import time
+from ddsmt import oracle
+
+def check(filename):
+    with open(filename) as file:
+        content = file.read()
+    if 'slow' in content:
+        time.sleep(30)
+    print(content.strip())
+    print(os.getpid(), file=sys.stderr)
+    return 0 if 'bug' in content else 1
+
+oracle.run(check)
+'''
+
+
+def test_check_file():
+    def check(filename):
+        print(filename)
+        sys.exit('failed')
+
+    assert oracle.check_file(check, 'a') == (1, 'a\n', 'failed\n')
+    assert oracle.check_file(lambda f: None, 'a') == (0, '', '')
+    assert oracle.check_file(lambda f: 1 / 0, 'a')[0] == 1
+
+
+def test_persistent_oracle(tmp_path, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH',
+                       os.path.dirname(os.path.dirname(oracle.__file__)))
+    script = tmp_path / 'oracle.py'
+    script.write_text(ORACLE)
+    cmd = [sys.executable, str(script)]
+    files = []
+    for content in ['bug', 'no bug', 'fine', 'slow']:
+        files.append(tmp_path / f'{len(files)}.smt2')
+        files[-1].write_text(content)
+
+    # the oracle can still be used as regular command
+    res = subprocess.run(cmd + [str(files[2])],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    assert res.returncode == 1 and res.stdout == b'fine\n'
+
+    args = options.parse_options(
+        mutators, ['--oracle', 'in', 'out'] + cmd)
+    with context.ReductionContext(args):
+        runs = [checker.execute(cmd, str(f), 10) for f in files[:3]]
+        assert [(ri.exit, ri.out) for ri in runs] == [
+            (0, 'bug\n'), (0, 'no bug\n'), (1, 'fine\n')
+        ]
+        # all checks were done by the same process
+        assert len(set(ri.err for ri in runs)) == 1
+
+        # the oracle is restarted after a timeout
+        assert checker.execute(cmd, str(files[3]), 0.5).out is None
+        ri = checker.execute(cmd, str(files[0]), 10)
+        assert ri.out == 'bug\n' and ri.err != runs[0].err
+
+
+def test_malformed_reply(tmp_path):
+    script = tmp_path / 'oracle.py'
+    script.write_text('import sys\n'
+                      'for line in sys.stdin:\n'
+                      '    print(\'{"exit": 0, "out": 1, "err": ""}\', '
+                      'flush=True)\n')
+    cmd = [sys.executable, str(script)]
+    args = options.parse_options(mutators, ['--oracle', 'in', 'out'] + cmd)
+    with context.ReductionContext(args):
+        for digest in [False, True]:
+            ri = checker.execute(cmd, str(script), 10, digest=digest)
+            assert ri.exit is None and ri.out is None
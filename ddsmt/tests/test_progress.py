@@ -0,0 +1,23 @@
+import logging
+import sys
+
+from .. import context
+from .. import progress
+
+
+def test_progress_per_context(monkeypatch):
+    monkeypatch.setattr(sys.stdout, 'isatty', lambda: True)
+    monkeypatch.setattr(logging.getLogger(), 'level', logging.INFO)
+    with context.ReductionContext() as outer:
+        progress.start(10)
+        # a concurrent reduction has its own progress bar
+        with context.ReductionContext() as inner:
+            progress.start(5)
+            progress.update(5)
+            progress.finish()
+            assert inner.state('progress', None).bar is None
+        progress.update()
+        bar = outer.state('progress', None).bar
+        assert bar.maxval == 10 and bar.currval == 1
+        progress.finish()
+        assert outer.state('progress', None).bar is None
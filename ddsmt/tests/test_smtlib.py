@@ -7,78 +7,100 @@ from ..smtlib import *
 def test_collect_information():
     reset_information()
     collect_information([])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-const', 'x')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-const', ('x', 'Real'), 'Real')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-const', 'x', 'Real')])
-    assert smtlib.__constants == {'x': 'Real'}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {'x': 'Real'}
+    assert smtlib.__info().constants == {'x': 'Real'}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {'x': 'Real'}
 
     collect_information([Node('declare-fun', 'x', ())])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-fun', ('x', 'Real'), (), 'Real')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-fun', 'x', 'Real', 'Real')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('declare-fun', 'x', (), 'Real')])
-    assert smtlib.__constants == {'x': 'Real'}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {'x': 'Real'}
+    assert smtlib.__info().constants == {'x': 'Real'}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {'x': 'Real'}
 
     collect_information([Node('declare-fun', 'x', ('Real', ), 'Real')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {'x': 'Real'}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {'x': 'Real'}
 
     collect_information([Node('define-fun', 'x', (), 'Real')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('define-fun', ('x', 'Real'), (), 'Real', '5.0')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('define-fun', 'x', 'Real', 'Real', '5.0')])
-    assert smtlib.__constants == {}
-    assert smtlib.__defined_functions == {}
-    assert smtlib.__sort_lookup == {}
+    assert smtlib.__info().constants == {}
+    assert smtlib.__info().defined_functions == {}
+    assert smtlib.__info().sort_lookup == {}
 
     collect_information([Node('define-fun', 'x', (), 'Real', '5.0')])
-    assert smtlib.__constants == {'x': 'Real'}
-    assert 'x' in smtlib.__defined_functions
-    assert smtlib.__defined_functions['x'][1](Node()) == '5.0'
-    assert smtlib.__sort_lookup == {'x': 'Real'}
+    assert smtlib.__info().constants == {'x': 'Real'}
+    assert 'x' in smtlib.__info().defined_functions
+    assert smtlib.__info().defined_functions['x'][1](Node()) == '5.0'
+    assert smtlib.__info().sort_lookup == {'x': 'Real'}
 
     collect_information(
         [Node('define-fun', 'x', ('y', 'Real'), 'Real', ('+', 'y', '5.0'))])
-    assert smtlib.__constants == {}
-    assert 'x' in smtlib.__defined_functions
-    assert smtlib.__defined_functions['x'][1](
+    assert smtlib.__info().constants == {}
+    assert 'x' in smtlib.__info().defined_functions
+    assert smtlib.__info().defined_functions['x'][1](
         (Node('3.0'), )) == ('+', '3.0', '5.0')
-    assert smtlib.__sort_lookup == {'x': 'Real'}
+    assert smtlib.__info().sort_lookup == {'x': 'Real'}
+
+
+def test_collect_information_lazy():
+    from .. import nodeio
+    from .. import nodes
+    input = """(declare-const x (_ BitVec 8))
+(assert (let ((y ((_ extract 3 0) x))) (= y #b0000)))
+(assert (= x x))
+"""
+    reset_information()
+    collect_information(list(nodeio.parse_smtlib(input)))
+    indices = len(smtlib.__info().indices)
+    sort_lookup = dict(smtlib.__info().sort_lookup)
+    assert indices == 3 and sorted(sort_lookup) == ['x', 'y']
+
+    reset_information()
+    exprs = list(nodeio.parse_smtlib(input, lazy=True))
+    collect_information(exprs)
+    assert len(smtlib.__info().indices) == indices
+    assert smtlib.__info().sort_lookup == sort_lookup
+    # lazy nodes without term level information stay unexpanded
+    assert not nodes.is_lazy(exprs[1]) and nodes.is_lazy(exprs[2])
 
 
 def test_get_variables_with_sort():
@@ -0,0 +1,60 @@
+import multiprocessing
+import subprocess
+
+from .. import context
+from .. import mutators
+from .. import nodeio
+from .. import options
+from .. import smtlib
+from .. import tmpfiles
+from .. import writer
+
+
+def test_candidate_file():
+    for transport in ['auto', 'shm', 'memfd', 'file']:
+        with context.ReductionContext(
+                options.parse_options(mutators, [
+                    'in.smt2', 'out', 'bin', '--candidate-transport',
+                    transport
+                ])):
+            tmpfiles.init()
+            for content in ['(assert a)', '(check-sat)']:
+                file, filename = tmpfiles.get_candidate_file()
+                file.write(content)
+                file.flush()
+                if not filename.startswith('/proc/'):
+                    assert filename.endswith('.smt2')
+                assert subprocess.run(['cat', filename],
+                                      stdout=subprocess.PIPE,
+                                      pass_fds=tmpfiles.get_pass_fds(filename),
+                                      check=True).stdout.decode() == content
+                assert tmpfiles.get_candidate_file() == (file, filename)
+
+
+def __get_candidate(content):
+    """Write ``content`` to a candidate file in a worker process."""
+    file, filename = tmpfiles.get_candidate_file()
+    file.write(content)
+    file.flush()
+    return filename, smtlib.get_variables_with_sort('Int')
+
+
+def test_spawned_workers(tmp_path):
+    args = options.parse_options(mutators, [
+        'in.smt2',
+        str(tmp_path / 'out.smt2'), 'bin', '--candidate-transport', 'file'
+    ])
+    with context.ReductionContext(args) as ctx:
+        tmpfiles.init()
+        exprs = list(nodeio.parse_smtlib('(declare-const x Int)'))
+        smtlib.collect_information(exprs)
+        writer.start(args.outfile)
+        # the context (including its locks and the writer) can be pickled
+        # for workers that are spawned instead of forked
+        with multiprocessing.get_context('spawn').Pool(
+                1, context.activate, (ctx, )) as pool:
+            filename, variables = pool.apply(__get_candidate, ('(assert x)', ))
+        writer.finish()
+    assert variables == ['x']
+    with open(filename) as file:
+        assert file.read() == '(assert x)'
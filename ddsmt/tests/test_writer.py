@@ -0,0 +1,25 @@
+from .. import context
+from .. import mutators
+from .. import nodeio
+from .. import options
+from .. import writer
+
+
+def test_writer(tmp_path):
+    output = tmp_path / 'output.smt2'
+    with context.ReductionContext(
+            options.parse_options(
+                mutators,
+                ['in', str(output), 'bin', '--write-interval', '60'])):
+        exprs = list(nodeio.parse_smtlib('(assert a) (assert b) (assert c)'))
+
+        writer.start(str(output))
+        for i in range(len(exprs)):
+            writer.update(exprs[i:])
+        writer.finish()
+        assert output.read_text() == '(assert c)\n'
+        assert [p.name for p in tmp_path.iterdir()] == ['output.smt2']
+
+        # without a running writer thread, updates are written immediately
+        writer.update(exprs[1:])
+        assert output.read_text() == '(assert b)\n(assert c)\n'
@@ -18,30 +18,121 @@
 # You should have received a copy of the GNU General Public License
 # along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
 
+import logging
 import os
 import shutil
 import tempfile
 import threading
 
+from . import context
 from . import options
 
-# The temporary directory. Automatically deleted upon termination.
+# The temporary directory and the directory for candidate files in /dev/shm
+# of this process. Automatically deleted upon termination.
 __TMPDIR = None
-__BINARY = None
-__BINARY_CC = None
-__FILEEXT = None
+__SHM_TMPDIR = None
+# Copies of binaries in the temporary directory, indexed by the path, the
+# modification time and the size of the original, see ``copy_binaries()``.
+__BINARIES = {}
+__BINARIES_LOCK = threading.Lock()
+# Open candidate files, indexed by process id, thread id, transport and file
+# extension.
+__CANDIDATES = {}
+# The state of the most recent call to ``init()``, used by reduction contexts
+# that were not initialized themselves.
+__DEFAULT = None
 
+__SHM_DIR = '/dev/shm'
+__PROC_FD = '/proc/self/fd/'
 
-def init():
-    """Create temporary directory, set filenames."""
+
+def __select_transport(transport):
+    """Select the transport for candidate files.
+
+    For ``auto``, prefers ``shm`` over ``memfd`` over ``file``. Falls
+    back to ``file`` if the requested transport is not available.
+    """
+    shm = os.path.isdir(__SHM_DIR) and os.access(__SHM_DIR, os.W_OK)
+    memfd = hasattr(os, 'memfd_create') and os.path.isdir(__PROC_FD)
+    if transport == 'auto':
+        if shm:
+            return 'shm'
+        if memfd:
+            return 'memfd'
+        return 'file'
+    if (transport == 'shm' and not shm) or (transport == 'memfd'
+                                            and not memfd):
+        logging.warning(f'candidate transport {transport} is not available, '
+                        'using regular files instead')
+        return 'file'
+    return transport
+
+
+class __State:
+    """The temporary directory and the candidate transport, stored per
+    ``ReductionContext``.
+
+    Only holds the names of the directories, such that worker processes
+    (that may be spawned instead of forked) can use them as well.
+    """
+    def __init__(self):
+        self.tmpdir = None
+        self.transport = None
+        self.candidate_dir = None
+
+
+def __state():
+    """Return the state of the current reduction context, or the state of
+    the most recent call to ``init()`` if it was not initialized."""
+    state = context.current().state('tmpfiles', __State)
+    if state.tmpdir is None and __DEFAULT is not None:
+        return __DEFAULT
+    return state
+
+
+def init(transport=None):
+    """Create the temporary directory (once per process) and select the
+    candidate transport for the current reduction context.
+
+    ``transport`` defaults to ``--candidate-transport``.
+    """
     global __TMPDIR
-    global __BINARY
-    global __BINARY_CC
-    global __FILEEXT
-    __TMPDIR = tempfile.TemporaryDirectory(prefix="ddsmt-")
-    __BINARY = os.path.join(__TMPDIR.name, 'binary')
-    __BINARY_CC = os.path.join(__TMPDIR.name, 'binary_cc')
-    __FILEEXT = os.path.splitext(options.args().infile)[1]
+    global __SHM_TMPDIR
+    global __DEFAULT
+    if __TMPDIR is None:
+        __TMPDIR = tempfile.TemporaryDirectory(prefix="ddsmt-")
+    if transport is None:
+        transport = options.args().candidate_transport
+    state = context.current().state('tmpfiles', __State)
+    state.tmpdir = __TMPDIR.name
+    state.transport = __select_transport(transport)
+    state.candidate_dir = None
+    if state.transport == 'shm':
+        if __SHM_TMPDIR is None:
+            __SHM_TMPDIR = tempfile.TemporaryDirectory(prefix="ddsmt-",
+                                                       dir=__SHM_DIR)
+        state.candidate_dir = __SHM_TMPDIR.name
+    __DEFAULT = state
+    logging.debug(f'candidate transport: {state.transport}')
+
+
+def __copy_binary(binary):
+    """Return a copy of ``binary`` in our temporary directory.
+
+    A binary is only copied again if it was modified in the meantime, and
+    not at all if it is a copy already (e.g., made by the daemon).
+    """
+    if os.path.dirname(binary) == __state().tmpdir:
+        return binary
+    stat = os.stat(binary)
+    key = (os.path.realpath(binary), stat.st_mtime_ns, stat.st_size)
+    with __BINARIES_LOCK:
+        if key not in __BINARIES:
+            copy = os.path.join(__state().tmpdir,
+                                f'binary-{len(__BINARIES)}')
+            shutil.copy(binary, copy)
+            __BINARIES[key] = copy
+        return __BINARIES[key]
 
 
 def copy_binaries():
@@ -50,19 +141,65 @@ def copy_binaries():
     If a cross check is defined, also copies this binary. After copying,
     it modifies the ``cmd`` argument to use the copied binary.
     """
-    shutil.copy(options.args().cmd[0], __BINARY)
-    options.args().cmd[0] = __BINARY
+    options.args().cmd[0] = __copy_binary(options.args().cmd[0])
 
     if options.args().cmd_cc:
-        shutil.copy(options.args().cmd_cc[0], __BINARY_CC)
-        options.args().cmd_cc[0] = __BINARY_CC
+        options.args().cmd_cc[0] = __copy_binary(options.args().cmd_cc[0])
+
+
+def __get_fileext():
+    """Return the file extension of the input file."""
+    return os.path.splitext(options.args().infile)[1]
 
 
 def get_tmp_filename():
     """Return a filename within our temporary directory based on the pid."""
     return os.path.join(
-        __TMPDIR.name,
-        f'ddsmt-tmp-{os.getpid()}-{threading.get_ident()}{__FILEEXT}')
+        __state().tmpdir,
+        f'ddsmt-tmp-{os.getpid()}-{threading.get_ident()}{__get_fileext()}')
+
+
+def __open_candidate_file(state, fileext):
+    """Open a new candidate file and return the file object and the
+    filename to pass to the solver."""
+    if state.transport == 'memfd':
+        fd = os.memfd_create(f'ddsmt-{os.getpid()}{fileext}', 0)
+        return open(fd, 'w'), f'{__PROC_FD}{fd}'
+    if state.transport == 'shm':
+        filename = os.path.join(
+            state.candidate_dir,
+            f'ddsmt-tmp-{os.getpid()}-{threading.get_ident()}{fileext}')
+    else:
+        filename = get_tmp_filename()
+    return open(filename, 'w'), filename
+
+
+def get_candidate_file():
+    """Return a file object and filename for candidate files.
+
+    Every process and thread reuses a single file, which is stored in
+    ``/dev/shm``, is an anonymous memory file (``memfd``) that the
+    solver reads via ``/proc/self/fd/``, or is a regular file in our
+    temporary directory (see ``--candidate-transport``). The file is
+    truncated and ready to be written to.
+    """
+    state = __state()
+    fileext = __get_fileext()
+    key = (os.getpid(), threading.get_ident(), state.transport, fileext)
+    if key not in __CANDIDATES:
+        __CANDIDATES[key] = __open_candidate_file(state, fileext)
+    file, filename = __CANDIDATES[key]
+    file.seek(0)
+    file.truncate()
+    return file, filename
+
+
+def get_pass_fds(filename):
+    """Return the file descriptors the solver needs to inherit to be able to
+    read ``filename``."""
+    if filename.startswith(__PROC_FD):
+        return (int(filename[len(__PROC_FD):]), )
+    return ()
 
 
 def copy_to_tmp_file(source):
@@ -0,0 +1,151 @@
+#
+# ddSMT: A delta debugger for SMT benchmarks in SMT-Lib v2 format.
+#
+# This file is part of ddSMT.
+#
+# Copyright (C) 2013-2021 by the authors listed in AUTHORS file.
+#
+# ddSMT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ddSMT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ddSMT.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from . import context
+from . import nodeio
+from . import options
+
+
+class __State:
+    """State of the writer, stored per ``ReductionContext``."""
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.thread = None
+        self.filename = None
+        self.pending = None
+        self.updates = 0
+        self.stop = False
+
+    def __reduce__(self):
+        """Pickle as a fresh state, the writer only runs in the process that
+        owns the reduction."""
+        return (type(self), ())
+
+
+def __state():
+    """Return the state of the writer in the current reduction context."""
+    return context.current().state('writer', __State)
+
+
+def __write(filename, exprs):
+    """Write ``exprs`` to a temporary file that then atomically replaces
+    ``filename``."""
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile('w',
+                                     dir=dirname,
+                                     prefix=f'.{basename}.',
+                                     delete=False) as tmp:
+        try:
+            nodeio.write_smtlib(tmp, exprs)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    if os.path.exists(filename):
+        os.chmod(tmp.name, os.stat(filename).st_mode & 0o777)
+    os.replace(tmp.name, filename)
+
+
+def __run(state, interval, every):
+    """Main loop of the writer thread.
+
+    Waits for pending updates and writes them once ``interval`` seconds
+    have passed since the last write, ``every`` updates are pending, or
+    the writer is stopped.
+    """
+    last_write = 0
+    while True:
+        with state.condition:
+            while state.pending is None and not state.stop:
+                state.condition.wait()
+            if state.pending is None:
+                return
+            while not state.stop and (every <= 0 or state.updates < every):
+                remaining = last_write + interval - time.time()
+                if remaining <= 0:
+                    break
+                state.condition.wait(remaining)
+            exprs = state.pending
+            state.pending = None
+            state.updates = 0
+        try:
+            __write(state.filename, exprs)
+        except OSError as e:
+            logging.error(f'unable to write {state.filename}: {e}')
+        last_write = time.time()
+
+
+def start(filename):
+    """Start the background thread that writes the output to ``filename``.
+
+    Writes are rate-limited via the options ``--write-interval`` and
+    ``--write-every``.
+    """
+    state = __state()
+    state.filename = filename
+    state.pending = None
+    state.updates = 0
+    state.stop = False
+    state.thread = threading.Thread(target=context.bind(__run),
+                                    args=(state,
+                                          options.args().write_interval,
+                                          options.args().write_every),
+                                    name='ddsmt-writer',
+                                    daemon=True)
+    state.thread.start()
+
+
+def update(exprs):
+    """Schedule ``exprs`` to be written to the output file.
+
+    Only the most recent update is written, earlier updates that have
+    not been written yet are dropped. If the writer thread is not
+    running, ``exprs`` are written immediately. Without output file
+    (e.g., within ``ddsmt.reduce()``), nothing is written.
+    """
+    state = __state()
+    if state.thread is None:
+        if options.args().outfile is None:
+            return
+        __write(options.args().outfile, exprs)
+        return
+    with state.condition:
+        state.pending = list(exprs)
+        state.updates += 1
+        state.condition.notify()
+
+
+def finish():
+    """Write the pending update, if any, and stop the writer thread."""
+    state = __state()
+    if state.thread is None:
+        return
+    with state.condition:
+        state.stop = True
+        state.condition.notify()
+    state.thread.join()
+    state.thread = None
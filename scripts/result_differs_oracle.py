@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import json
+import subprocess
+import sys
+
+
+def run(cmd, filename):
+    cmd = cmd + [filename]
+    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return res.stdout.decode('utf8').strip()
+
+
+def check(filename):
+    A = run(['solverA', '--option'], filename)
+    B = run(['solverB', '--option'], filename)
+
+    if A not in ['sat', 'unsat']:
+        return 2, f'Unexpected output for A: {A}\n'
+
+    if B not in ['sat', 'unsat']:
+        return 2, f'Unexpected output for B: {B}\n'
+
+    return (0 if A == B else 1), f'{A} / {B}\n'
+
+
+# read one filename per line, reply with one JSON object per line
+for line in sys.stdin:
+    code, out = check(line.rstrip('\n'))
+    print(json.dumps({'exit': code, 'out': out, 'err': ''}), flush=True)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Measure how long ddSMT takes to run a (trivial) command, for every way of
+# applying resource limits. Usage: spawn_latency.py [runs] [command ...]
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+__root_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, __root_dir)
+
+from ddsmt import checker  # noqa: E402
+from ddsmt import context  # noqa: E402
+from ddsmt import mutators  # noqa: E402
+from ddsmt import options  # noqa: E402
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+cmd = sys.argv[2:] or ['/bin/true']
+
+
+def measure(run):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), statistics.mean(times)
+
+
+def report(name, run):
+    median, mean = measure(run)
+    print(f'{name:25} median {median:.3f} ms, mean {mean:.3f} ms')
+
+
+report(
+    'subprocess.run', lambda: subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+for launcher in ['prlimit', 'shim']:
+    for memout in [[], ['--memout', '1024']]:
+        args = options.parse_options(
+            mutators, ['--launcher', launcher] + memout + ['in', 'out'] + cmd)
+        with context.ReductionContext(args):
+            name = f'{launcher} {" ".join(memout)}'
+            report(name, lambda: checker.execute(cmd, None, 10, b''))